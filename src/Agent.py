@@ -2,15 +2,38 @@ import asyncio
 import json
 from pathlib import Path
 import shlex
-from typing import List, Optional
+from typing import Dict, List, Optional, Tuple
+from openai import AsyncOpenAI
 from ChatOpenAI import ChatOpenAI
+from ContextWindow import ContextWindow
+from LLMResponseCache import LLMResponseCache
+from mcp import Tool
 from MCPClient import MCPClient
-from utils import log_title
+from ToolResultProcessor import READ_ARTIFACT_TOOL, ToolResultProcessor
+from Tracer import tracer
+from utils import debug, error, log_title, warning
 
 class Agent:
-    """Agent类，协调MCP工具和LLM的交互"""
+    """Agent类，协调MCP工具和LLM的交互
 
-    def __init__(self, model: str, mcp_clients: List[MCPClient], system_prompt: str = '', context: str = ''):
+    init 时建立 工具名 -> (MCPClient, 原始工具名) 的路由表，每次工具调用 O(1) 查找。
+    多个服务器提供同名工具时，这些工具统一改名为 "服务器名__工具名" 暴露给 LLM。
+    工具结果经过 ToolResultProcessor 转换和限长后才写回历史，超出的部分由本地的 read_artifact 工具分页读取。
+    """
+
+    def __init__(
+        self,
+        model: str,
+        mcp_clients: List[MCPClient],
+        system_prompt: str = '',
+        context: str = '',
+        close_clients: bool = True,
+        context_window: Optional[ContextWindow] = None,
+        response_cache: Optional[LLMResponseCache] = None,
+        result_processor: Optional[ToolResultProcessor] = None,
+        llm_client: Optional[AsyncOpenAI] = None,
+        llm_semaphore: Optional[asyncio.Semaphore] = None,
+    ):
         """
         初始化Agent
         
@@ -19,39 +42,57 @@ class Agent:
             mcp_clients: MCP客户端列表
             system_prompt: 系统提示词
             context: 上下文信息
+            close_clients: close 时是否关闭 MCP 客户端；客户端来自 MCPClientPool 共享时应为 False
+            context_window: 消息历史的上下文窗口管理，为 None 时使用默认预算
+            response_cache: 可选的 LLM 响应缓存（录制/回放）
+            result_processor: 工具结果处理器，为 None 时使用默认上限和系统临时目录
+            llm_client: 共享的 AsyncOpenAI 客户端（由 AgentRunner 提供），为 None 时自行创建
+            llm_semaphore: 共享的 LLM 并发上限
         """
         self.__model = model
         self.__mcp_clients = mcp_clients
         self.__system_prompt = system_prompt
         self.__context = context
+        self.__close_clients = close_clients
+        self.__context_window = context_window
+        self.__response_cache = response_cache
+        self.__result_processor = result_processor or ToolResultProcessor()
+        self.__llm_client = llm_client
+        self.__llm_semaphore = llm_semaphore
         self.__llm: Optional[ChatOpenAI] = None
+        self.__routes: Dict[str, Tuple[MCPClient, str]] = {}
 
     
     async def init(self) -> None:
         """初始化agent，包括LLM和所有MCP客户端"""
         log_title("INIT LLM AND TOOLS")
-        # 初始化所有MCP客户端
-        for __client in self.__mcp_clients:
-            await __client.init()
+        # 并发初始化所有MCP客户端（已连接的客户端直接返回）
+        await asyncio.gather(*(__client.init() for __client in self.__mcp_clients))
 
-        # 收集所有工具
-        __tools = []
-        for mcp_client in self.__mcp_clients:
-            __tools.extend(mcp_client.get_tools())
+        # 收集所有工具并建立路由表
+        __tools = self.__build_routes()
 
         # 初始化语言模型
-        self.__llm = ChatOpenAI(self.__model, self.__system_prompt, __tools)
+        self.__llm = ChatOpenAI(
+            self.__model, self.__system_prompt, __tools, self.__context,
+            self.__context_window, self.__response_cache,
+            self.__llm_client, self.__llm_semaphore,
+        )
 
     
     async def close(self) -> None:
-        """关闭所有MCP客户端连接"""
+        """关闭LLM客户端，以及（close_clients 为 True 时）所有MCP客户端连接"""
+        if self.__llm is not None:
+            await self.__llm.close()
+        if not self.__close_clients:
+            return
         log_title("CLOSE MCP CLIENTS")
         for __client in self.__mcp_clients:
             try:
                 # 直接关闭，不添加延迟
                 await __client.close()
             except Exception as e:
-                print(f"Warning: Error closing client {__client.name if hasattr(__client, 'name') else 'unknown'}: {e}")
+                warning("Error closing client %s: %s", getattr(__client, 'name', 'unknown'), e)
     
 
     async def invoke(self, prompt: str) -> str:
@@ -69,76 +110,125 @@ class Agent:
         """
         if not self.__llm:
             raise ValueError('LLM is not initialized. Please call init() first.')
-        
+
+        with tracer.span("agent.invoke", model=self.__model) as __span:
+            return await self.__invoke(prompt, __span)
+
+    async def __invoke(self, prompt: str, span) -> str:
+        """invoke 的实现：循环处理工具调用直到 LLM 给出最终回复"""
         __response = await self.__llm.chat(prompt)
+        span.add("turns")
 
         # 这是一个循环,直到没有工具调用为止
         while(True):
             # 处理工具调用
             if __response["tool_calls"] and len(__response["tool_calls"]) > 0:
-                for __tool_call in __response["tool_calls"]:
-                    __tool_name = __tool_call.get("function", {}).get("name", "")
-                    __tool_args = __tool_call.get("function", {}).get("arguments", "")
-
-                    __mcp_client = None
-                    __tool_found = False
-                    for __client in self.__mcp_clients:
-                        tools = __client.get_tools()
-                        if tools:
-                            for __tool in tools:
-                                if __tool.name == __tool_name:
-                                    __mcp_client = __client
-                                    __tool_found = True
-                                    break
-                        if __tool_found:
-                            break
-
-
-                    if __mcp_client:
-                        log_title(f"TOOL USE {__tool_name}")
-                        print(f"Calling tool: {__tool_name} with arguments:")
-                        print(f"Raw arguments: {__tool_args}")
-                        
-                        try:
-                            # 解析参数
-                            parsed_args = json.loads(__tool_args)
-                            __result = await __mcp_client.call_tool(__tool_name, parsed_args)
-                            print(f"Tool result type: {type(__result)}")
-                            print(f"Tool result: {__result}")
-                            
-                            # 确保结果是可序列化的
-                            if isinstance(__result, dict):
-                                result_str = json.dumps(__result)
-                            else:
-                                # 尝试转换为字典或字符串
-                                result_str = json.dumps({"raw_result": str(__result)})
-                            
-                            # 将工具调用结果传回LLM
-                            self.__llm.append_tool_result(__tool_call["id"], result_str)
-                            
-                        except json.JSONDecodeError as e:
-                            error_msg = f"Error parsing tool arguments: {e}"
-                            print(error_msg)
-                            self.__llm.append_tool_result(__tool_call["id"], json.dumps({"error": error_msg}))
-                        except Exception as e:
-                            error_msg = f"Error calling tool: {e}"
-                            print(error_msg)
-                            self.__llm.append_tool_result(__tool_call["id"], json.dumps({"error": error_msg}))
-                    else:
-                        error_msg = f"Error: No MCPClient found for tool: {__tool_name}"
-                        self.__llm.append_tool_result(__tool_call["id"], json.dumps({"error": error_msg}))
-                        print(error_msg)
-                    
+                # 同一轮的工具调用相互独立，并发执行（每个 MCPClient 内部限制并发），
+                # 结果按 tool_call 的原始顺序写回消息历史
+                __results = await asyncio.gather(
+                    *(self.__run_tool_call(__tool_call) for __tool_call in __response["tool_calls"])
+                )
+                for __tool_call, __result in zip(__response["tool_calls"], __results):
+                    self.__llm.append_tool_result(__tool_call["id"], __result)
+
                 __response = await self.__llm.chat()
+                span.add("turns")
+                span.add("tool_calls", len(__results))
 
                 continue
 
             
             # 没有工具调用，返回最终结果
             log_title("FINAL RESPONSE")
-            await self.close()
             return __response["content"]
 
+    def __build_routes(self) -> List[Tool]:
+        """
+        建立路由表，同名工具加上服务器名前缀消除冲突
+
+        Returns:
+            暴露给 LLM 的工具列表（冲突的工具是改名后的副本）
+        """
+        __owners: Dict[str, int] = {}
+        for __client in self.__mcp_clients:
+            for __tool in __client.get_tools() or []:
+                __owners[__tool.name] = __owners.get(__tool.name, 0) + 1
+
+        self.__routes = {}
+        __tools = []
+        for __client in self.__mcp_clients:
+            for __tool in __client.get_tools() or []:
+                __original = __tool.name
+                __exposed = __original
+                if __owners[__original] > 1:
+                    __exposed = f"{__client.name}__{__original}"
+                    __tool = __tool.model_copy(update={"name": __exposed})
+                if __exposed in self.__routes:
+                    # 同一个服务器重复声明，或改名后仍与其他工具重名：保留先注册的
+                    warning("duplicate tool name '%s' from %s, ignored", __exposed, __client.name)
+                    continue
+                self.__routes[__exposed] = (__client, __original)
+                __tools.append(__tool)
+        if READ_ARTIFACT_TOOL in self.__routes:
+            warning("MCP tool '%s' shadows the local artifact reader", READ_ARTIFACT_TOOL)
+        else:
+            __tools.append(self.__result_processor.tool)
+        return __tools
+
+    async def __run_tool_call(self, tool_call: dict) -> str:
+        """
+        执行单个工具调用，错误也转换为 JSON 字符串返回给 LLM
+
+        Args:
+            tool_call: ChatOpenAI 返回的工具调用
+
+        Returns:
+            写回消息历史的工具结果
+        """
+        __tool_name = tool_call.get("function", {}).get("name", "")
+        __tool_args = tool_call.get("function", {}).get("arguments", "")
+
+        __route = self.__routes.get(__tool_name)
+        if __route is None and __tool_name != READ_ARTIFACT_TOOL:
+            error_msg = f"Error: No MCPClient found for tool: {__tool_name}"
+            error(error_msg)
+            return json.dumps({"error": error_msg})
+
+        with tracer.span("tool.call", tool=__tool_name) as __span:
+            __output = await self.__call_tool(__tool_name, __tool_args, __route)
+            __span.set("output_chars", len(__output))
+            tracer.count("tool.output_chars", len(__output), tool=__tool_name)
+            return __output
+
+    async def __call_tool(self, tool_name: str, tool_args: str, route: Optional[Tuple[MCPClient, str]]) -> str:
+        """执行工具（或本地的 read_artifact）并处理结果"""
+        log_title(f"TOOL USE {tool_name}")
+        debug("Calling tool: %s with arguments: %s", tool_name, tool_args)
+
+        try:
+            # 解析参数
+            parsed_args = json.loads(tool_args)
+            if route is None:
+                __output = await asyncio.to_thread(self.__result_processor.read_artifact, **parsed_args)
+            else:
+                __mcp_client, __server_tool_name = route
+                __result = await __mcp_client.call_tool_result(__server_tool_name, parsed_args)
+                # 转换内容块并限长，超出部分转存（写文件放到线程中）；上限按服务器上的原始工具名配置
+                __output = await asyncio.to_thread(
+                    self.__result_processor.process, __server_tool_name, __result.content, bool(__result.isError)
+                )
+            debug("Tool result (%d chars): %.500s", len(__output), __output)
+            return __output
+
+        except json.JSONDecodeError as e:
+            error_msg = f"Error parsing tool arguments: {e}"
+            error(error_msg)
+            return json.dumps({"error": error_msg})
+        except Exception as e:
+            error_msg = f"Error calling tool: {e}"
+            error(error_msg)
+            return json.dumps({"error": error_msg})
+
 
 async def example():
     
@@ -0,0 +1,227 @@
+import asyncio
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional, Sequence, Set, Tuple, Union
+
+from Agent import Agent
+from ChatOpenAI import create_client
+from MCPClientPool import MCPClientPool
+from utils import log_title
+
+
+class AgentRunner:
+    """在同一个事件循环中并发执行多个 Agent
+
+    所有 Agent 共享一个 AsyncOpenAI 客户端（连接池）、同一个 MCPClientPool 中的常驻服务器，
+    以及调用方通过 context_provider 传入的检索器/向量库：
+    - 准入控制：排队和执行中的任务总数不超过 max_pending，满了以后 submit 等待（或 block=False 时立即拒绝）
+    - 后端并发上限：同时在途的 LLM 请求不超过 llm_concurrency，同时进行的检索不超过 context_concurrency，
+      每个 MCP 服务器的上限由 MCPClient 的 max_concurrency 控制
+    - 公平调度：每个 tenant 一个队列，有空闲名额时按 tenant 轮询取任务，单个 tenant 的大批量提交不会饿死其他 tenant
+    """
+
+    def __init__(
+        self,
+        model: str,
+        mcp_pool: MCPClientPool,
+        mcp_clients: Sequence[str] = (),
+        system_prompt: str = '',
+        context_provider: Optional[Callable[[str], Awaitable[str]]] = None,
+        max_agents: int = 8,
+        max_pending: int = 64,
+        llm_concurrency: int = 4,
+        context_concurrency: int = 4,
+        agent_options: Optional[Dict[str, Any]] = None,
+    ):
+        """
+        初始化 Agent 运行器
+
+        Args:
+            model: LLM 模型名称
+            mcp_pool: 共享的 MCP 客户端池
+            mcp_clients: 每个 Agent 使用的客户端名称，为空时使用池中全部客户端
+            system_prompt: 系统提示词
+            context_provider: 可选的异步函数，根据提示词返回 RAG 上下文
+            max_agents: 同时执行的 Agent 数量上限
+            max_pending: 排队和执行中的任务总数上限
+            llm_concurrency: 同时在途的 LLM 请求上限
+            context_concurrency: 同时进行的上下文检索上限
+            agent_options: 传给 Agent 的其他参数（response_cache、result_processor、context_window 等）
+        """
+        if max_pending < max_agents:
+            raise ValueError("max_pending must be >= max_agents")
+        self.__model = model
+        self.__mcp_pool = mcp_pool
+        self.__mcp_clients = tuple(mcp_clients)
+        self.__system_prompt = system_prompt
+        self.__context_provider = context_provider
+        self.__max_agents = max_agents
+        self.__agent_options = dict(agent_options or {})
+
+        self.__llm_client = create_client()
+        self.__llm_semaphore = asyncio.Semaphore(llm_concurrency)
+        self.__context_semaphore = asyncio.Semaphore(context_concurrency)
+        self.__admission = asyncio.Semaphore(max_pending)
+
+        # tenant -> 等待中的 (提示词, 结果 future)；__ready 按轮询顺序保存有任务的 tenant
+        self.__queues: Dict[str, Deque[Tuple[str, asyncio.Future]]] = {}
+        self.__ready: Deque[str] = deque()
+        self.__running: Set[asyncio.Task] = set()
+
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+
+    @property
+    def stats(self) -> Dict[str, int]:
+        """提交/完成/失败/拒绝计数以及当前排队和执行中的数量"""
+        return {
+            "submitted": self.submitted,
+            "completed": self.completed,
+            "failed": self.failed,
+            "rejected": self.rejected,
+            "queued": sum(len(__queue) for __queue in self.__queues.values()),
+            "running": len(self.__running),
+        }
+
+    async def submit(self, prompt: str, tenant: str = "default", block: bool = True) -> str:
+        """
+        提交一个提示词并等待 Agent 的最终响应
+
+        Args:
+            prompt: 用户输入的提示词
+            tenant: 调度分组，不同 tenant 之间轮询
+            block: 准入名额已满时是否等待；为 False 时立即抛出 asyncio.QueueFull
+
+        Returns:
+            Agent 的最终响应
+        """
+        if not block and self.__admission.locked():
+            self.rejected += 1
+            raise asyncio.QueueFull(f"AgentRunner is at capacity, rejected prompt from tenant '{tenant}'")
+
+        async with self.__admission:
+            self.submitted += 1
+            __future = asyncio.get_running_loop().create_future()
+            if tenant not in self.__queues:
+                self.__queues[tenant] = deque()
+                self.__ready.append(tenant)
+            self.__queues[tenant].append((prompt, __future))
+            self.__dispatch()
+            return await __future
+
+    async def map(self, prompts: Sequence[str], tenant: str = "default") -> List[Union[str, BaseException]]:
+        """
+        并发提交一批提示词
+
+        Args:
+            prompts: 提示词列表
+            tenant: 调度分组
+
+        Returns:
+            与输入顺序一致的响应，失败的位置为异常对象
+        """
+        return await asyncio.gather(*(self.submit(__prompt, tenant) for __prompt in prompts), return_exceptions=True)
+
+    async def close(self) -> None:
+        """取消执行中的任务并关闭共享的 LLM 客户端（MCPClientPool 由调用方关闭）"""
+        log_title("CLOSE AGENT RUNNER")
+        for __queue in self.__queues.values():
+            for _, __future in __queue:
+                __future.cancel()
+        self.__queues.clear()
+        self.__ready.clear()
+        for __task in list(self.__running):
+            __task.cancel()
+        await asyncio.gather(*self.__running, return_exceptions=True)
+        await self.__llm_client.close()
+
+    def __dispatch(self) -> None:
+        """有空闲名额时按 tenant 轮询启动排队的任务"""
+        while len(self.__running) < self.__max_agents and self.__ready:
+            __tenant = self.__ready.popleft()
+            __queue = self.__queues[__tenant]
+            __prompt, __future = __queue.popleft()
+            if __queue:
+                self.__ready.append(__tenant)
+            else:
+                del self.__queues[__tenant]
+            if __future.cancelled():
+                continue
+
+            __task = asyncio.create_task(self.__run(__prompt, __future), name=f"agent-{__tenant}")
+            self.__running.add(__task)
+            # 提交方取消等待时同时取消执行中的 Agent
+            __future.add_done_callback(lambda f, t=__task: t.cancel() if f.cancelled() else None)
+
+    async def __run(self, prompt: str, future: asyncio.Future) -> None:
+        """执行一个任务，结果写入 future，结束后释放名额并继续调度"""
+        try:
+            __response = await self.__execute(prompt)
+        except asyncio.CancelledError:
+            # 通知等待结果的提交方后继续向上传播，让 close()/取消 map() 的调用方看到任务确实被取消
+            future.cancel()
+            raise
+        except Exception as e:
+            self.failed += 1
+            if not future.done():
+                future.set_exception(e)
+        else:
+            self.completed += 1
+            if not future.done():
+                future.set_result(__response)
+        finally:
+            self.__running.discard(asyncio.current_task())
+            self.__dispatch()
+
+    async def __execute(self, prompt: str) -> str:
+        """检索上下文，用池中的客户端创建 Agent 并执行"""
+        __context = ''
+        if self.__context_provider is not None:
+            async with self.__context_semaphore:
+                __context = await self.__context_provider(prompt)
+
+        __clients = await self.__mcp_pool.get(*self.__mcp_clients)
+        __agent = Agent(
+            self.__model,
+            __clients,
+            self.__system_prompt,
+            __context,
+            close_clients=False,
+            llm_client=self.__llm_client,
+            llm_semaphore=self.__llm_semaphore,
+            **self.__agent_options,
+        )
+        try:
+            await __agent.init()
+            return await __agent.invoke(prompt)
+        finally:
+            await __agent.close()
+
+
+async def example():
+    import time
+    from MCPClient import MCPClient
+
+    pool = MCPClientPool()
+    await pool.start([MCPClient('fetch', 'uvx', ['mcp-server-fetch'])])
+    runner = AgentRunner('glm-4.7', pool, max_agents=4, llm_concurrency=4)
+
+    prompts = [f"用一句话介绍数字 {i}" for i in range(6)]
+    start = time.perf_counter()
+    # 交互式请求不会排在整批任务之后
+    responses = await asyncio.gather(
+        runner.map(prompts, tenant="batch"),
+        runner.submit("总结 https://example.com 的内容", tenant="interactive"),
+    )
+    elapsed = time.perf_counter() - start
+    print(f"{len(prompts) + 1} 个提示词耗时 {elapsed:.2f}s, {(len(prompts) + 1) / elapsed:.2f} 个/秒")
+    print(responses[1])
+    print("运行统计:", runner.stats)
+
+    await runner.close()
+    await pool.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(example())
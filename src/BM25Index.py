@@ -0,0 +1,196 @@
+import time
+from array import array
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from DocumentChunker import tokenize
+
+
+class BM25Index:
+    """BM25 倒排索引
+
+    词 -> 词编号 的字典加上每个词一对紧凑的倒排数组：行号和词频都是 array('I')，
+    每个 (文档, 词) 只占 8 字节。查询时把各词的倒排列表一次性向量化累加到稠密分数数组，
+    文档长度归一化项缓存到下一次 add 之前。
+    """
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75):
+        """
+        初始化 BM25 索引
+
+        Args:
+            k1: 词频饱和参数
+            b: 文档长度归一化参数
+        """
+        self.k1 = k1
+        self.b = b
+        self.__terms: Dict[str, int] = {}
+        self.__doc_ids: List[array] = []
+        self.__tfs: List[array] = []
+        self.__doc_lens = array('I')
+        self.__total_len = 0
+        self.__norm: Optional[np.ndarray] = None
+
+    @staticmethod
+    def terms(text: str) -> List[str]:
+        """索引和查询使用的词：tokenize 的结果去掉标点"""
+        return [__token for __token in tokenize(text) if __token[0].isalnum() or __token[0] == '_']
+
+    @property
+    def doc_count(self) -> int:
+        """已索引的文档数量（行号范围）"""
+        return len(self.__doc_lens)
+
+    @property
+    def nbytes(self) -> int:
+        """倒排列表和文档长度占用的字节数"""
+        return sum(
+            len(__ids) * __ids.itemsize + len(__tfs) * __tfs.itemsize
+            for __ids, __tfs in zip(self.__doc_ids, self.__tfs)
+        ) + len(self.__doc_lens) * self.__doc_lens.itemsize
+
+    def add(self, start: int, documents: Sequence[str]) -> None:
+        """
+        追加文档，行号从 start 开始连续分配
+
+        Args:
+            start: 第一篇文档的行号，必须等于当前 doc_count
+            documents: 文档文本
+        """
+        if start != self.doc_count:
+            raise ValueError(f"BM25Index expects row {self.doc_count}, got {start}")
+        for __row, __document in enumerate(documents, start):
+            __counts: Dict[str, int] = {}
+            __terms = self.terms(__document)
+            for __term in __terms:
+                __counts[__term] = __counts.get(__term, 0) + 1
+            for __term, __tf in __counts.items():
+                __term_id = self.__terms.get(__term)
+                if __term_id is None:
+                    __term_id = self.__terms[__term] = len(self.__doc_ids)
+                    self.__doc_ids.append(array('I'))
+                    self.__tfs.append(array('I'))
+                self.__doc_ids[__term_id].append(__row)
+                self.__tfs[__term_id].append(__tf)
+            self.__doc_lens.append(len(__terms))
+            self.__total_len += len(__terms)
+        self.__norm = None
+
+    def search(self, query: str, top_k: int = 10, mask: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        BM25 打分并返回前 top_k 个行号
+
+        Args:
+            query: 查询文本
+            top_k: 返回数量
+            mask: 可选的布尔数组 (doc_count,)，只返回为 True 的行
+
+        Returns:
+            (行号, 分数)，按分数降序，只包含至少命中一个查询词的行
+        """
+        __count = self.doc_count
+        __empty = (np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32))
+        __term_ids = {self.__terms[__t] for __t in self.terms(query) if __t in self.__terms}
+        if __count == 0 or top_k <= 0 or not __term_ids:
+            return __empty
+
+        if self.__norm is None:
+            __doc_lens = np.frombuffer(self.__doc_lens, dtype=np.uint32)
+            __avg_len = max(self.__total_len / __count, 1e-9)
+            self.__norm = (self.k1 * (1 - self.b + self.b * __doc_lens / __avg_len)).astype(np.float32)
+        __norm = self.__norm
+        __scores = np.zeros(__count, dtype=np.float32)
+        for __term_id in __term_ids:
+            __ids = np.frombuffer(self.__doc_ids[__term_id], dtype=np.uint32)
+            __tfs = np.frombuffer(self.__tfs[__term_id], dtype=np.uint32).astype(np.float32)
+            __idf = np.log1p((__count - __ids.size + 0.5) / (__ids.size + 0.5))
+            # 一个词的倒排列表中行号互不相同，可以直接按下标累加
+            __scores[__ids] += __idf * __tfs * (self.k1 + 1) / (__tfs + __norm[__ids])
+
+        if mask is not None:
+            __scores[~mask[:__count]] = 0
+        __hits = np.flatnonzero(__scores > 0)
+        if __hits.size > top_k:
+            __hits = __hits[np.argpartition(-__scores[__hits], top_k - 1)[:top_k]]
+        __hits = __hits[np.argsort(-__scores[__hits], kind='stable')]
+        return __hits, __scores[__hits]
+
+    def export_state(self) -> Dict[str, np.ndarray]:
+        """
+        导出索引，倒排列表展平为 doc_ids/tfs + offsets
+
+        Returns:
+            包含 terms、offsets、doc_ids、tfs、doc_lens、params 的数组字典
+        """
+        __terms = sorted(self.__terms, key=self.__terms.get)
+        __sizes = np.array([len(__ids) for __ids in self.__doc_ids], dtype=np.int64)
+        __offsets = np.concatenate([[0], np.cumsum(__sizes)]).astype(np.int64)
+        __doc_ids = np.empty(0, dtype=np.uint32)
+        __tfs = np.empty(0, dtype=np.uint32)
+        if __offsets[-1]:
+            __doc_ids = np.concatenate([np.frombuffer(__ids, dtype=np.uint32) for __ids in self.__doc_ids])
+            __tfs = np.concatenate([np.frombuffer(__t, dtype=np.uint32) for __t in self.__tfs])
+        return {
+            # 词不含空白字符，用换行拼接成一个字符串保存
+            "terms": np.array('\n'.join(__terms)),
+            "offsets": __offsets,
+            "doc_ids": __doc_ids,
+            "tfs": __tfs,
+            "doc_lens": np.frombuffer(self.__doc_lens, dtype=np.uint32).copy(),
+            "params": np.array([self.k1, self.b], dtype=np.float64),
+        }
+
+    def load_state(self, state: Dict[str, np.ndarray]) -> None:
+        """
+        从 export_state 的结果恢复索引
+
+        Args:
+            state: export_state 导出的数组字典
+        """
+        __joined = str(state["terms"])
+        __terms = __joined.split('\n') if __joined else []
+        __offsets = np.asarray(state["offsets"], dtype=np.int64)
+        __doc_ids = np.ascontiguousarray(state["doc_ids"], dtype=np.uint32)
+        __tfs = np.ascontiguousarray(state["tfs"], dtype=np.uint32)
+        self.k1, self.b = (float(__p) for __p in state["params"])
+        self.__terms = {__term: __i for __i, __term in enumerate(__terms)}
+        self.__doc_ids, self.__tfs = [], []
+        for __start, __end in zip(__offsets[:-1], __offsets[1:]):
+            __ids, __tf = array('I'), array('I')
+            __ids.frombytes(__doc_ids[__start:__end].tobytes())
+            __tf.frombytes(__tfs[__start:__end].tobytes())
+            self.__doc_ids.append(__ids)
+            self.__tfs.append(__tf)
+        self.__doc_lens = array('I')
+        self.__doc_lens.frombytes(np.ascontiguousarray(state["doc_lens"], dtype=np.uint32).tobytes())
+        self.__total_len = int(np.sum(state["doc_lens"], dtype=np.int64))
+        self.__norm = None
+
+    def reset(self) -> None:
+        """清空索引"""
+        self.__terms = {}
+        self.__doc_ids = []
+        self.__tfs = []
+        self.__doc_lens = array('I')
+        self.__total_len = 0
+        self.__norm = None
+
+
+def example():
+    rng = np.random.default_rng(0)
+    words = [f'w{i}' for i in range(5000)]
+    documents = [' '.join(rng.choice(words, 200)) for _ in range(20000)]
+    documents[123] += ' Chelsey Dietrich'
+
+    index = BM25Index()
+    index.add(0, documents)
+    print(f"文档数: {index.doc_count}, 倒排列表占用: {index.nbytes / 1024 / 1024:.1f} MiB")
+
+    start = time.perf_counter()
+    rows, scores = index.search('Chelsey Dietrich', top_k=3)
+    print(f"查询耗时: {(time.perf_counter() - start) * 1000:.3f} ms", rows, scores)
+
+
+if __name__ == "__main__":
+    example()
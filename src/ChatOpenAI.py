@@ -1,16 +1,28 @@
+import asyncio
 import json
 import os
-import sys
-from typing import Any, Dict, List
-from openai import OpenAI
+from contextlib import nullcontext
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional
+from openai import AsyncOpenAI
 from dotenv import load_dotenv
-from utils import log_title
+from ContextWindow import ContextWindow, estimate_message_tokens, estimate_tokens
+from LLMResponseCache import LLMResponseCache
+from Tracer import tracer
+from utils import echo as default_echo, log_title
 
 
 # 加载环境变量
 load_dotenv()
 
 
+def create_client() -> AsyncOpenAI:
+    """按环境变量创建 AsyncOpenAI 客户端，多个 ChatOpenAI 可以共享同一个（共享连接池）"""
+    return AsyncOpenAI(
+        api_key=os.getenv("ALIBABA_KEY"),
+        base_url=os.getenv("ALIBABA_BASE_URL")
+    )
+
+
 class ToolCall:
     """工具调用类"""
     def __init__(self, id: str = "", function_name: str = "", function_arg: str = ""):
@@ -29,9 +41,26 @@ class ToolCall:
 
 
 class ChatOpenAI:
-    """OpenAI 聊天客户端类"""
+    """OpenAI 聊天客户端类
+
+    使用 AsyncOpenAI 并以 async for 消费流式响应，生成过程中不会阻塞事件循环，
+    多个 Agent、MCP 通信和嵌入请求可以共享同一个事件循环。
+    每次请求前由 ContextWindow 把消息历史压缩到 token 预算以内，工具调用循环再长请求大小也有上限。
+    可选的 LLMResponseCache 按 (model, messages, tools) 录制/回放整个流，相同的请求不再访问网络。
+    """
 
-    def __init__(self, model: str, system_prompt: str = '', tools: List[Dict] = None, context: str = ''):
+    def __init__(
+        self,
+        model: str,
+        system_prompt: str = '',
+        tools: List[Dict] = None,
+        context: str = '',
+        context_window: Optional[ContextWindow] = None,
+        response_cache: Optional[LLMResponseCache] = None,
+        client: Optional[AsyncOpenAI] = None,
+        semaphore: Optional[asyncio.Semaphore] = None,
+        echo: Optional[Callable[[str], None]] = None,
+    ):
         """
         初始化 OpenAI 聊天客户端
         
@@ -40,24 +69,37 @@ class ChatOpenAI:
             system_prompt: 系统提示词
             tools: 来自 MCP 的工具列表
             context: 上下文
+            context_window: 上下文窗口管理，为 None 时使用默认预算
+            response_cache: 可选的响应缓存（录制/回放）
+            client: 共享的 AsyncOpenAI 客户端，为 None 时自行创建（close 时只关闭自己创建的）
+            semaphore: 共享的并发上限，多个 ChatOpenAI 同时在途的请求数不超过它
+            echo: chat() 中内容增量的回显函数，默认为 utils.echo（按日志级别输出，静默模式下不输出）
         """
-        self.__llm = OpenAI(
-            api_key=os.getenv("ALIBABA_KEY"),
-            base_url=os.getenv("ALIBABA_BASE_URL")
-        )
+        self.__owns_llm = client is None
+        self.__llm = client or create_client()
+        self.__semaphore = semaphore
+        self.__echo = echo or default_echo
 
         # 初始化一下
         self.__model = model
         self.__tools = tools or []
+        # 工具定义在构造时一次性转换为 OpenAI 格式，之后每轮请求直接复用
+        self.__tools_definition = self.__get_tools_definition()
         self.__messages = []
         if system_prompt:
             self.__messages.append({"role": "system", "content": system_prompt})
         if context:
             self.__messages.append({"role": "user", "content": context})
+        # system prompt、RAG 上下文和第一条用户任务（见 __stream）始终保留，不参与压缩
+        self.__pinned = len(self.__messages)
+        self.__context_window = context_window or ContextWindow()
+        self.__response_cache = response_cache
+        # 工具定义每次请求都会发送，从预算中预先扣除
+        self.__reserved_tokens = estimate_tokens(json.dumps(self.__tools_definition, ensure_ascii=False))
 
     async def chat(self, prompt: str = None) -> Dict[str, Any]:
         """
-        发送聊天请求并处理流式响应
+        发送聊天请求并处理流式响应（内容增量交给 echo 回显）
         
         Args:
             prompt: 用户输入的提示词
@@ -66,10 +108,95 @@ class ChatOpenAI:
             包含 content 和 tool_calls 的字典
         """
         log_title('CHAT')
+        __result: Dict[str, Any] = {"content": "", "tool_calls": []}
+        __started = False
+        async for __event in self.stream(prompt):
+            if not __started:
+                log_title('RESPONSE')
+                __started = True
+            if __event["type"] == "content":
+                self.__echo(__event["delta"])
+            elif __event["type"] == "done":
+                __result = {"content": __event["content"], "tool_calls": __event["tool_calls"]}
+        if __result["content"]:
+            self.__echo("\n")
+        return __result
+
+    async def stream(self, prompt: Optional[str] = None) -> AsyncIterator[Dict[str, Any]]:
+        """
+        发送聊天请求，以异步迭代器的形式逐个产出增量事件：
+        - {"type": "content", "delta": str}：内容增量
+        - {"type": "tool_call", "index": int, "id": str, "name": str, "arguments": str}：工具调用增量（字段为本次新增的片段）
+        - {"type": "done", "content": str, "tool_calls": list}：流结束，附带完整的内容和工具调用
+        迭代完成后消息历史才会更新；提前退出迭代时本轮回复不会写入历史。
+        请求前消息历史会按 ContextWindow 的预算压缩。
+        响应缓存命中时逐个回放录制的事件；replay 模式下未命中抛出 LookupError。
+
+        Args:
+            prompt: 用户输入的提示词
+
+        Returns:
+            事件字典的异步迭代器
+        """
+        with tracer.span("llm.chat", model=self.__model) as __span:
+            __first = True
+            async for __event in self.__stream(prompt, __span):
+                if __first:
+                    # 首个事件（首个 token 或缓存回放）到达的时间
+                    __span.mark("ttft_ms")
+                    __first = False
+                if __event["type"] == "done" and tracer.enabled:
+                    __completion_tokens = estimate_tokens(__event["content"]) + sum(
+                        estimate_tokens(__tc["function"]["arguments"]) for __tc in __event["tool_calls"]
+                    )
+                    __span.set("completion_tokens", __completion_tokens)
+                    __span.set("tool_calls", len(__event["tool_calls"]))
+                    tracer.count("llm.completion_tokens", __completion_tokens, model=self.__model)
+                yield __event
+
+    async def __stream(self, prompt: Optional[str], span) -> AsyncIterator[Dict[str, Any]]:
+        """
+        stream 的实现：压缩历史、查询响应缓存，未命中时请求网络
+
+        Args:
+            prompt: 用户输入的提示词
+            span: 本次请求的 llm.chat span
+
+        Returns:
+            事件字典的异步迭代器
+        """
         if prompt:
             self.__messages.append({"role": "user", "content": prompt})
+            if len(self.__messages) == self.__pinned + 1:
+                # 第一条用户消息是整个任务的描述，压缩时原样保留，只摘要/丢弃它之后的轮次
+                self.__pinned += 1
+
+        # 压缩后的历史直接替换原历史，已截断/摘要的部分不会在下一轮重复处理
+        self.__messages = await self.__context_window.compact(
+            self.__messages, self.__pinned, self.__reserved_tokens
+        )
+        if tracer.enabled:
+            __prompt_tokens = self.__reserved_tokens + sum(map(estimate_message_tokens, self.__messages))
+            span.set("messages", len(self.__messages))
+            span.set("prompt_tokens", __prompt_tokens)
+            tracer.count("llm.prompt_tokens", __prompt_tokens, model=self.__model)
+
+        __cache_key = None
+        if self.__response_cache is not None and self.__response_cache.enabled:
+            __cache_key = LLMResponseCache.key(self.__model, self.__messages, self.__tools_definition)
+            # SQLite 读写放到工作线程，不阻塞事件循环
+            __recorded = await asyncio.to_thread(self.__response_cache.get, __cache_key)
+            span.set("cached", __recorded is not None)
+            if __recorded is not None:
+                tracer.count("llm.cache_hits", 1, model=self.__model)
+                for __event in __recorded:
+                    if __event["type"] == "done":
+                        self.__append_response(__event["content"], __event["tool_calls"])
+                    yield dict(__event)
+                return
+            if self.__response_cache.mode == "replay":
+                raise LookupError(f"No recorded LLM response for request {__cache_key}")
 
-        
         # 准备 API 调用参数
         create_params = {
             "model": self.__model,
@@ -77,17 +204,34 @@ class ChatOpenAI:
             "stream": True,
         }
 
-         # 只有有工具时才添加 tools 参数
-        if self.__tools:
-            create_params["tools"] = self.__get_tools_definition() # MCP的tool --> openAI的tool
-    
-        __stream = self.__llm.chat.completions.create(**create_params)
+        # 只有有工具时才添加 tools 参数
+        if self.__tools_definition:
+            create_params["tools"] = self.__tools_definition # MCP的tool --> openAI的tool
+
+        # 持有共享的并发名额直到整个流读完
+        async with self.__semaphore or nullcontext():
+            span.mark("acquired_ms")
+            async for __event in self.__request(create_params, __cache_key):
+                yield __event
+
+    async def __request(self, create_params: Dict[str, Any], cache_key: Optional[str]) -> AsyncIterator[Dict[str, Any]]:
+        """
+        请求网络并产出流事件，结束时更新消息历史，cache_key 不为 None 时录制
+
+        Args:
+            create_params: chat.completions.create 的参数
+            cache_key: 响应缓存的键
+
+        Returns:
+            事件字典的异步迭代器
+        """
+        __stream = await self.__llm.chat.completions.create(**create_params)
 
         __content = ''
         __tool_calls: List[ToolCall] = []
-        
-        log_title('RESPONSE')
-        for __chunk in __stream:
+        __events: List[Dict[str, Any]] = []
+
+        async for __chunk in __stream:
             if not __chunk.choices:
                 continue
 
@@ -95,59 +239,84 @@ class ChatOpenAI:
 
             # 处理普通内容
             if __delta.content:
-                __content_chunk = __delta.content or ""
-                __content += __content_chunk
-                sys.stdout.write(__content_chunk)
-                sys.stdout.flush()
+                __content += __delta.content
+                __event = {"type": "content", "delta": __delta.content}
+                if cache_key is not None:
+                    __events.append(__event)
+                yield __event
 
             # 处理工具调用
             if __delta.tool_calls:
                 for __tool_call_chunk in __delta.tool_calls:
                     __index = __tool_call_chunk.index
-                    
+
                     # 确保有足够的空间存储工具调用
-                    if len(__tool_calls) <= __index:
+                    while len(__tool_calls) <= __index:
                         __tool_calls.append(ToolCall())
-                    
+
                     __current_call = __tool_calls[__index]
-                    
-                    # 更新工具调用信息
-                    if __tool_call_chunk.id:
-                        __current_call.id += __tool_call_chunk.id
+                    __id_chunk = __tool_call_chunk.id or ""
+                    __name_chunk = ""
+                    __arguments_chunk = ""
 
+                    # 更新工具调用信息
+                    __current_call.id += __id_chunk
                     if __tool_call_chunk.function:
-                        if __tool_call_chunk.function.name:
-                            __current_call.function["name"] += (__tool_call_chunk.function.name or "")
-                        
-                        if __tool_call_chunk.function.arguments:
-                            # 检查 arguments 是否为空对象 '{}'，如果是空的就不追加
-                            __arguments_chunk = __tool_call_chunk.function.arguments or ""
-                            if __arguments_chunk.strip() != "{}" or not __current_call.function["arguments"]:
-                                __current_call.function["arguments"] += __arguments_chunk
-
-
-        # 更新消息历史
-        if __tool_calls:
+                        __name_chunk = __tool_call_chunk.function.name or ""
+                        __current_call.function["name"] += __name_chunk
+
+                        # 检查 arguments 是否为空对象 '{}'，如果是空的就不追加
+                        __arguments_chunk = __tool_call_chunk.function.arguments or ""
+                        if __arguments_chunk.strip() == "{}" and __current_call.function["arguments"]:
+                            __arguments_chunk = ""
+                        __current_call.function["arguments"] += __arguments_chunk
+
+                    __event = {
+                        "type": "tool_call",
+                        "index": __index,
+                        "id": __id_chunk,
+                        "name": __name_chunk,
+                        "arguments": __arguments_chunk,
+                    }
+                    if cache_key is not None:
+                        __events.append(__event)
+                    yield __event
+
+        __done = {"type": "done", "content": __content, "tool_calls": [__tc.to_dict() for __tc in __tool_calls]}
+        self.__append_response(__content, __done["tool_calls"])
+        if cache_key is not None:
+            __events.append(__done)
+            await asyncio.to_thread(self.__response_cache.put, cache_key, self.__model, __events)
+
+        yield __done
+
+    def __append_response(self, content: str, tool_calls: List[Dict[str, Any]]) -> None:
+        """
+        把一次完整的回复写入消息历史
+
+        Args:
+            content: 回复内容
+            tool_calls: ToolCall.to_dict() 格式的工具调用
+        """
+        if tool_calls:
             self.__messages.append({
                 "role": "assistant",
-                "content": __content,
+                "content": content,
                 "tool_calls": [
                     {
-                        "id": __tc.id,
-                        "function": __tc.function,
+                        "id": __tc["id"],
+                        "function": dict(__tc["function"]),
                         "type": "function"
                     }
-                    for __tc in __tool_calls
+                    for __tc in tool_calls
                 ]
             })
-        elif __content:  # 只有内容没有工具调用
+        elif content:  # 只有内容没有工具调用
             self.__messages.append({
                 "role": "assistant",
-                "content": __content
+                "content": content
             })
 
-        return {"content": __content, "tool_calls": [__tc.to_dict() for __tc in __tool_calls]}
-
     # 工具结果 ---> tool_message
     def append_tool_result(self, tool_call_id: str, tool_output: str):
         """
@@ -182,8 +351,13 @@ class ChatOpenAI:
         """获取消息历史"""
         return self.__messages.copy()
 
+    async def close(self) -> None:
+        """关闭底层的异步 HTTP 客户端（共享的客户端由创建者关闭）"""
+        if self.__owns_llm:
+            await self.__llm.close()
+
 
-def example():
+async def example():
     # 创建聊天实例
     chat = ChatOpenAI(
         model="glm-4.7",
@@ -191,20 +365,21 @@ def example():
     )
     
     # 发送消息
-    response = chat.chat("今天北京天气怎么样？")
+    response = await chat.chat("今天北京天气怎么样？")
     
     print(f"\n助理回复: {response['content']}")
     
-    # 如果有工具调用，模拟执行并添加结果
-    if response["tool_calls"]:
-        # 继续对话
-        print("\n工具执行完成，继续对话...")
-        response2 = chat.chat("谢谢，告诉我湿度是多少？")
-        print(f"助理回复: {response2['content']}")
+    # 逐个消费增量事件，拿到首个 token 就可以开始处理
+    async for event in chat.stream("谢谢，告诉我湿度是多少？"):
+        if event["type"] == "content":
+            print(event["delta"], end="", flush=True)
+        elif event["type"] == "tool_call":
+            print(f"\n工具调用增量: {event}")
     
     print(f"\n最终消息历史长度: {len(chat.get_messages())}")
+    await chat.close()
 
 
 # 使用示例
 if __name__ == "__main__":
-    example()
\ No newline at end of file
+    asyncio.run(example())
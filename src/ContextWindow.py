@@ -0,0 +1,184 @@
+import asyncio
+import json
+import re
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from utils import warning
+
+# CJK 字符大约每个 1 个 token，其余字符大约每 4 个 1 个 token
+_CJK_PATTERN = re.compile('[㐀-䶿一-鿿豈-﫿　-〿＀-￯]')
+
+# 每条消息的固定开销（角色、分隔符等）
+MESSAGE_OVERHEAD_TOKENS = 4
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    本地估算文本的 token 数，不依赖具体模型的分词器
+
+    Args:
+        text: 文本
+
+    Returns:
+        估算的 token 数
+    """
+    if not text:
+        return 0
+    __cjk = len(_CJK_PATTERN.findall(text))
+    return __cjk + (len(text) - __cjk + 3) // 4
+
+
+def estimate_message_tokens(message: Dict[str, Any]) -> int:
+    """估算一条消息（含工具调用参数）的 token 数"""
+    __tokens = MESSAGE_OVERHEAD_TOKENS + estimate_tokens(message.get("content") or "")
+    for __tool_call in message.get("tool_calls") or []:
+        __function = __tool_call.get("function", {})
+        __tokens += estimate_tokens(__function.get("name", "")) + estimate_tokens(__function.get("arguments", ""))
+    return __tokens
+
+
+class ContextWindow:
+    """消息历史的上下文窗口管理
+
+    每次请求前把历史压缩到 max_tokens 以内：
+    1. 开头固定的消息（system prompt、RAG 上下文、第一条用户任务）始终保留
+    2. 从最旧的开始把工具输出截断到 tool_output_chars 个字符（最后一组工具结果除外，模型还没看过）
+    3. 仍然超出时把最近 keep_recent 条之前的若干组消息交给 summarizer 生成摘要（未提供时直接丢弃并留下说明）
+    一次工具调用的 assistant 消息和它的全部 tool 结果作为一组，要么一起保留，要么一起被摘要/丢弃。
+    """
+
+    def __init__(
+        self,
+        max_tokens: int = 32000,
+        keep_recent: int = 6,
+        tool_output_chars: int = 800,
+        summarizer: Optional[Callable[[List[Dict[str, Any]]], Awaitable[str]]] = None,
+    ):
+        """
+        初始化上下文窗口
+
+        Args:
+            max_tokens: 每次请求的消息 token 预算（不含工具定义，由调用方通过 reserved_tokens 扣除）
+            keep_recent: 末尾不会被摘要/丢弃的消息数量（会向前扩展到完整的工具调用组）
+            tool_output_chars: 截断后每条旧工具输出保留的字符数
+            summarizer: 可选的异步摘要函数，输入要被压缩的消息，返回摘要文本
+        """
+        self.max_tokens = max_tokens
+        self.keep_recent = keep_recent
+        self.tool_output_chars = tool_output_chars
+        self.__summarizer = summarizer
+
+    async def compact(
+        self,
+        messages: List[Dict[str, Any]],
+        pinned: int = 0,
+        reserved_tokens: int = 0,
+    ) -> List[Dict[str, Any]]:
+        """
+        把消息历史压缩到预算以内，返回新的消息列表（被截断的消息是副本，原消息不变）
+
+        Args:
+            messages: 消息历史
+            pinned: 开头固定保留的消息数量（system prompt、RAG 上下文、第一条用户任务）
+            reserved_tokens: 预算中预留给工具定义等其他内容的 token 数
+
+        Returns:
+            压缩后的消息列表
+        """
+        __budget = self.max_tokens - reserved_tokens
+        __messages = list(messages)
+        __tokens = [estimate_message_tokens(__m) for __m in __messages]
+        if sum(__tokens) <= __budget:
+            return __messages
+
+        __recent = self.__recent_start(__messages, pinned, self.keep_recent)
+        __last_group = self.__recent_start(__messages, pinned, 1)
+
+        # 1. 截断旧的工具输出
+        for __i in range(pinned, __last_group):
+            if sum(__tokens) <= __budget:
+                return __messages
+            __message = __messages[__i]
+            __content = __message.get("content") or ""
+            if __message.get("role") == "tool" and len(__content) > self.tool_output_chars:
+                __message = {**__message, "content": self.__truncate(__content)}
+                __messages[__i] = __message
+                __tokens[__i] = estimate_message_tokens(__message)
+        if sum(__tokens) <= __budget:
+            return __messages
+
+        # 2. 从最旧的组开始摘要或丢弃，直到预算以内
+        __excess = sum(__tokens) - __budget
+        __end = pinned
+        __freed = 0
+        while __end < __recent and __freed < __excess:
+            __group_end = self.__group_end(__messages, __end, __recent)
+            __freed += sum(__tokens[__end:__group_end])
+            __end = __group_end
+        if __end == pinned:
+            return __messages
+
+        __removed = __messages[pinned:__end]
+        __note = await self.__summarize(__removed)
+        return __messages[:pinned] + [{"role": "user", "content": __note}] + __messages[__end:]
+
+    @staticmethod
+    def __recent_start(messages: List[Dict[str, Any]], pinned: int, count: int) -> int:
+        """末尾 count 条消息的起点，向前扩展到不落在工具调用组的中间"""
+        __start = max(pinned, len(messages) - count)
+        while __start > pinned and messages[__start].get("role") == "tool":
+            __start -= 1
+        return __start
+
+    @staticmethod
+    def __group_end(messages: List[Dict[str, Any]], start: int, limit: int) -> int:
+        """从 start 开始的一组消息的结束位置：带 tool_calls 的 assistant 消息连同其后的 tool 消息为一组"""
+        __end = start + 1
+        while __end < limit and messages[__end].get("role") == "tool":
+            __end += 1
+        return __end
+
+    def __truncate(self, content: str) -> str:
+        """保留工具输出的开头，并注明截断的长度"""
+        return f"{content[:self.tool_output_chars]}\n...[truncated {len(content) - self.tool_output_chars} chars]"
+
+    async def __summarize(self, messages: List[Dict[str, Any]]) -> str:
+        """生成被移除消息的摘要；没有 summarizer 或摘要失败时只留下说明"""
+        if self.__summarizer is not None:
+            try:
+                __summary = await self.__summarizer(messages)
+                return f"[Summary of {len(messages)} earlier messages]\n{__summary}"
+            except Exception as e:
+                warning("Failed to summarize conversation history: %s", e)
+        __tools = [
+            __tool_call.get("function", {}).get("name", "")
+            for __m in messages
+            for __tool_call in __m.get("tool_calls") or []
+        ]
+        return f"[{len(messages)} earlier messages omitted to fit the context window; tools called: {json.dumps(__tools)}]"
+
+
+def example():
+    window = ContextWindow(max_tokens=300, keep_recent=3, tool_output_chars=100)
+    messages = [
+        {"role": "system", "content": "你是一个有用的助手"},
+        {"role": "user", "content": "上下文：Chelsey Dietrich 住在 Roscoeview"},
+        {"role": "user", "content": "写一个关于 Chelsey 的故事"},
+    ]
+    for i in range(5):
+        messages.append({
+            "role": "assistant",
+            "content": "",
+            "tool_calls": [{"id": f"call_{i}", "type": "function", "function": {"name": "fetch", "arguments": '{"url": "https://example.com"}'}}],
+        })
+        messages.append({"role": "tool", "tool_call_id": f"call_{i}", "content": "<html>" + "x" * 2000 + "</html>"})
+
+    compacted = asyncio.run(window.compact(messages, pinned=3))
+    print(f"压缩前: {sum(map(estimate_message_tokens, messages))} tokens, {len(messages)} 条消息")
+    print(f"压缩后: {sum(map(estimate_message_tokens, compacted))} tokens, {len(compacted)} 条消息")
+    for message in compacted:
+        print(message["role"], (message.get("content") or "")[:80].replace("\n", " "))
+
+
+if __name__ == "__main__":
+    example()
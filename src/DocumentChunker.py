@@ -0,0 +1,178 @@
+import codecs
+import io
+import itertools
+import re
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+# 分词：CJK 字符逐字成词，其余按连续的字母数字切分，标点单独成词
+_CJK = '㐀-䶿一-鿿豈-﫿'
+TOKEN_PATTERN = re.compile(f'[{_CJK}]|[^\\W{_CJK}]+|[^\\w\\s]')
+
+# 句子结束的标点
+SENTENCE_END = frozenset('。！？!?.;；…')
+
+# ASCII 标点只有后面是空白或文本结尾时才算句末，避免在邮箱、网址和小数中间切分
+ASCII_SENTENCE_END = frozenset('!?.;')
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    把文本切分为词元（小写），供分块计数和 BM25 使用
+
+    Args:
+        text: 文本
+
+    Returns:
+        词元列表
+    """
+    return [__token.lower() for __token in TOKEN_PATTERN.findall(text)]
+
+
+class DocumentChunker:
+    """流式文档分块器
+
+    按固定词元数（mode="token"）或在句子边界处（mode="sentence"）切分文本，相邻块之间保留 overlap 个词元。
+    输入是按 read_size 读取的文本片段，缓冲区只保留尚未输出的部分，内存占用与文件大小无关。
+    """
+
+    def __init__(self, chunk_size: int = 256, overlap: int = 32, mode: str = "sentence", read_size: int = 64 * 1024):
+        """
+        初始化分块器
+
+        Args:
+            chunk_size: 每块的最大词元数
+            overlap: 相邻块重叠的词元数，必须小于 chunk_size
+            mode: "token" 严格按词元数切分；"sentence" 在块的后半段寻找句子边界切分
+            read_size: 每次读取文件的字节数
+        """
+        if chunk_size <= 0:
+            raise ValueError("chunk_size must be positive")
+        if not 0 <= overlap < chunk_size:
+            raise ValueError("overlap must be in [0, chunk_size)")
+        if mode not in ("token", "sentence"):
+            raise ValueError(f"Unknown chunk mode: {mode}")
+        self.chunk_size = chunk_size
+        self.overlap = overlap
+        self.mode = mode
+        self.read_size = read_size
+
+    @property
+    def config(self) -> Dict[str, Union[int, str]]:
+        """影响分块结果的参数，配置变化时已有的分块需要重建"""
+        return {"chunk_size": self.chunk_size, "overlap": self.overlap, "mode": self.mode}
+
+    def read_pieces(self, path: Union[str, Path], digest: Optional[Any] = None) -> Iterator[str]:
+        """
+        按 read_size 逐段读取 utf-8 文件，增量解码（多字节字符不会被截断，换行统一为 \\n）
+
+        Args:
+            path: 文件路径
+            digest: 可选的 hashlib 对象，用实际读到的原始字节更新，
+                调用方据此得到与分块结果完全对应的内容哈希
+
+        Returns:
+            文本片段的生成器
+        """
+        __decoder = io.IncrementalNewlineDecoder(codecs.getincrementaldecoder('utf-8')(), translate=True)
+        with open(path, 'rb') as f:
+            while __block := f.read(self.read_size):
+                if digest is not None:
+                    digest.update(__block)
+                if __piece := __decoder.decode(__block):
+                    yield __piece
+        if __tail := __decoder.decode(b'', final=True):
+            yield __tail
+
+    def chunk_file(self, path: Union[str, Path], digest: Optional[Any] = None) -> Iterator[str]:
+        """流式读取文件并分块，digest 见 read_pieces"""
+        return self.chunks(self.read_pieces(path, digest))
+
+    def chunk_text(self, text: str) -> List[str]:
+        """对内存中的文本分块"""
+        return list(self.chunks([text]))
+
+    def chunks(self, pieces: Iterable[str]) -> Iterator[str]:
+        """
+        对文本片段流分块
+
+        Args:
+            pieces: 文本片段，拼接后为完整文档
+
+        Returns:
+            块文本的生成器
+        """
+        __buffer = ''
+        # 缓冲区开头已经输出过（作为上一块的重叠部分）的词元数
+        __emitted = 0
+        for __piece in itertools.chain(pieces, [None]):
+            __final = __piece is None
+            if not __final:
+                __buffer += __piece
+            __spans = [__m.span() for __m in TOKEN_PATTERN.finditer(__buffer)]
+            if not __final and __spans:
+                # 最后一个词元可能在下一个片段中继续
+                __spans.pop()
+
+            while len(__spans) >= self.chunk_size or (__final and len(__spans) > __emitted):
+                __end = min(self.chunk_size, len(__spans))
+                if self.mode == "sentence" and len(__spans) >= self.chunk_size:
+                    __end = self.__sentence_end(__buffer, __spans, __end)
+                yield __buffer[__spans[0][0]:__spans[__end - 1][1]]
+                if __end == len(__spans) and __final:
+                    __buffer, __spans = '', []
+                    break
+
+                __start = max(__end - self.overlap, 1)
+                if __start >= len(__spans):
+                    # 没有重叠且已输出全部完整词元，只保留可能未读完的最后一个词元
+                    __buffer, __spans, __emitted = __buffer[__spans[-1][1]:], [], 0
+                    break
+                if self.mode == "sentence":
+                    __start = self.__sentence_start(__buffer, __spans, __start, __end)
+                __emitted = __end - __start
+                __offset = __spans[__start][0]
+                __buffer = __buffer[__offset:]
+                __spans = [(__a - __offset, __b - __offset) for __a, __b in __spans[__start:]]
+
+            if __spans:
+                __buffer = __buffer[__spans[0][0]:]
+            elif __final or not __buffer.strip():
+                __buffer = ''
+
+    def __sentence_end(self, buffer: str, spans: List[Tuple[int, int]], end: int) -> int:
+        """在块的后半段寻找最后一个句子边界，找不到时按词元数切分"""
+        for __i in range(end - 1, end // 2 - 1, -1):
+            if self.__is_boundary(buffer, spans[__i]):
+                return __i + 1
+        return end
+
+    def __sentence_start(self, buffer: str, spans: List[Tuple[int, int]], start: int, end: int) -> int:
+        """让重叠部分从一个完整的句子开始"""
+        for __i in range(start - 1, end - 1):
+            if self.__is_boundary(buffer, spans[__i]):
+                return __i + 1
+        return start
+
+    @staticmethod
+    def __is_boundary(buffer: str, span: Tuple[int, int]) -> bool:
+        """词元是句末标点（ASCII 标点要求后面是空白或文本结尾），或者后面紧跟换行"""
+        __token = buffer[span[0]:span[1]]
+        __next = buffer[span[1]:span[1] + 1]
+        if __next == '\n':
+            return True
+        if __token in ASCII_SENTENCE_END:
+            return __next == '' or __next.isspace()
+        return __token in SENTENCE_END
+
+
+def example():
+    chunker = DocumentChunker(chunk_size=12, overlap=4)
+    text = "Chelsey Dietrich 住在 Roscoeview。她的邮箱是 Lucio_Hettinger@annie.ca。她在 Keebler LLC 工作，公司口号是 user-centric fault-tolerant solution。"
+    for i, chunk in enumerate(chunker.chunk_text(text)):
+        print(i, chunk)
+    print(tokenize("Chelsey Dietrich 住在 Roscoeview"))
+
+
+if __name__ == "__main__":
+    example()
@@ -0,0 +1,174 @@
+import hashlib
+import sqlite3
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+
+class EmbeddingCache:
+    """内容寻址的嵌入向量缓存
+
+    键为 (model, sha256(text))，两级存储：
+    - 内存 LRU：按向量字节数淘汰，超过 max_memory_bytes 时移除最久未使用的项
+    - SQLite 持久层（可选）：跨进程/跨运行复用，命中后回填到内存层
+    方法都是同步的，SQLite 读写会阻塞调用线程：异步代码应通过 asyncio.to_thread 调用，
+    内部用锁串行化，可以安全地在多个工作线程中使用
+    """
+
+    def __init__(self, path: Optional[Union[str, Path]] = None, max_memory_bytes: int = 64 * 1024 * 1024):
+        """
+        初始化嵌入缓存
+
+        Args:
+            path: SQLite 数据库文件路径，为 None 时只使用内存层
+            max_memory_bytes: 内存层允许占用的最大向量字节数
+        """
+        self.__max_memory_bytes = max_memory_bytes
+        self.__memory: "OrderedDict[Tuple[str, str], np.ndarray]" = OrderedDict()
+        self.__memory_bytes = 0
+        self.__lock = threading.Lock()
+
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        self.__db: Optional[sqlite3.Connection] = None
+        if path is not None:
+            Path(path).parent.mkdir(parents=True, exist_ok=True)
+            # 连接在 to_thread 的工作线程中使用，由 self.__lock 保证同一时刻只有一个线程访问
+            self.__db = sqlite3.connect(str(path), check_same_thread=False)
+            self.__db.execute("PRAGMA journal_mode=WAL")
+            self.__db.execute("PRAGMA synchronous=NORMAL")
+            self.__db.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings ("
+                "model TEXT NOT NULL, digest TEXT NOT NULL, vector BLOB NOT NULL, "
+                "PRIMARY KEY (model, digest))"
+            )
+            self.__db.commit()
+
+    @staticmethod
+    def digest(text: str) -> str:
+        """文本内容的 sha256 摘要"""
+        return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+    @property
+    def stats(self) -> Dict[str, int]:
+        """命中/未命中计数和内存层占用"""
+        return {
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "memory_items": len(self.__memory),
+            "memory_bytes": self.__memory_bytes,
+        }
+
+    def get_many(self, model: str, texts: Sequence[str]) -> List[Optional[np.ndarray]]:
+        """
+        批量查询缓存，先查内存层，未命中的再一次性查询 SQLite
+
+        Args:
+            model: 模型名称（调用方可以把文本类型等区分向量的信息拼进来）
+            texts: 文本列表
+
+        Returns:
+            与输入顺序一致的向量，未命中的位置为 None
+        """
+        with self.__lock:
+            __results: List[Optional[np.ndarray]] = [None] * len(texts)
+            __pending: Dict[str, List[int]] = {}
+            for __i, __text in enumerate(texts):
+                __key = (model, self.digest(__text))
+                __vector = self.__memory.get(__key)
+                if __vector is not None:
+                    self.__memory.move_to_end(__key)
+                    self.memory_hits += 1
+                    __results[__i] = __vector
+                else:
+                    __pending.setdefault(__key[1], []).append(__i)
+
+            if __pending and self.__db is not None:
+                __digests = list(__pending)
+                # SQLite 单条语句的参数数量有限，分块查询
+                for __start in range(0, len(__digests), 500):
+                    __chunk = __digests[__start:__start + 500]
+                    __rows = self.__db.execute(
+                        f"SELECT digest, vector FROM embeddings WHERE model = ? AND digest IN ({','.join('?' * len(__chunk))})",
+                        [model, *__chunk],
+                    ).fetchall()
+                    for __digest, __blob in __rows:
+                        __vector = np.frombuffer(__blob, dtype=np.float32)
+                        self.__remember((model, __digest), __vector)
+                        for __i in __pending.pop(__digest):
+                            __results[__i] = __vector
+                            self.disk_hits += 1
+
+            self.misses += sum(len(__indices) for __indices in __pending.values())
+        return __results
+
+    def put_many(self, model: str, texts: Sequence[str], embeddings: Sequence[Sequence[float]]) -> None:
+        """
+        批量写入缓存（内存层 + SQLite）
+
+        Args:
+            model: 模型名称
+            texts: 文本列表
+            embeddings: 与文本一一对应的向量
+        """
+        __rows = []
+        with self.__lock:
+            for __text, __embedding in zip(texts, embeddings):
+                __digest = self.digest(__text)
+                __vector = np.asarray(__embedding, dtype=np.float32)
+                self.__remember((model, __digest), __vector)
+                __rows.append((model, __digest, __vector.tobytes()))
+
+            if __rows and self.__db is not None:
+                self.__db.executemany(
+                    "INSERT OR REPLACE INTO embeddings (model, digest, vector) VALUES (?, ?, ?)", __rows
+                )
+                self.__db.commit()
+
+    def close(self) -> None:
+        """关闭 SQLite 连接"""
+        with self.__lock:
+            if self.__db is not None:
+                self.__db.close()
+                self.__db = None
+
+    def __remember(self, key: Tuple[str, str], vector: np.ndarray) -> None:
+        """
+        写入内存层并按字节数淘汰最久未使用的项
+
+        Args:
+            key: (model, digest)
+            vector: 向量
+        """
+        __previous = self.__memory.pop(key, None)
+        if __previous is not None:
+            self.__memory_bytes -= __previous.nbytes
+        if vector.nbytes > self.__max_memory_bytes:
+            return
+
+        self.__memory[key] = vector
+        self.__memory_bytes += vector.nbytes
+        while self.__memory_bytes > self.__max_memory_bytes:
+            _, __evicted = self.__memory.popitem(last=False)
+            self.__memory_bytes -= __evicted.nbytes
+
+
+def example():
+    import tempfile
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        cache = EmbeddingCache(Path(tmp_dir) / 'embeddings.sqlite', max_memory_bytes=16)
+        cache.put_many('demo-model', ['你好', '世界'], [[0.1, 0.2], [0.3, 0.4]])
+        print("第一次查询:", cache.get_many('demo-model', ['你好', '世界', '新文本']))
+        print("缓存统计:", cache.stats)
+        cache.close()
+
+
+if __name__ == "__main__":
+    example()
@@ -1,8 +1,14 @@
+import asyncio
+import importlib.util
 import json
 import os
+import random
 import httpx
-from typing import Dict, List
+from typing import Any, AsyncIterable, AsyncIterator, Dict, Iterable, List, Optional, Sequence, Tuple, Union
 from dataclasses import dataclass
+from EmbeddingCache import EmbeddingCache
+from Tracer import tracer
+from utils import warning
 from VectorStore import VectorStore
 from dotenv import load_dotenv
 
@@ -26,64 +32,444 @@ class OutResult:
     document: Dict[str, str]
     
 
+# 这些状态码视为暂时性错误，按抖动退避重试
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+
+# 倒数排名融合（RRF）的平滑常数：score = Σ 1 / (RRF_K + rank)
+RRF_K = 60
+
+
 class EmbeddingRetrieve:
-    """嵌入检索类"""
+    """嵌入检索类
 
-    def __init__(self, embedding_model: str):
+    持有一个长生命周期的 httpx.AsyncClient（连接池 + keep-alive，默认启用 HTTP/2），
+    嵌入和重排序请求复用同一组连接；使用完毕后需要调用 close()。
+    """
+
+    def __init__(
+        self,
+        embedding_model: str,
+        rerank_model: Optional[str] = None,
+        vector_store: Optional[VectorStore] = None,
+        cache: Optional[EmbeddingCache] = None,
+        batch_size: int = 10,
+        max_concurrency: int = 4,
+        http2: bool = True,
+        max_connections: int = 20,
+        max_keepalive_connections: int = 10,
+        keepalive_expiry: float = 30.0,
+        timeout: float = 30.0,
+        connect_timeout: float = 5.0,
+        max_retries: int = 3,
+        backoff_base: float = 0.5,
+        backoff_max: float = 8.0,
+        rerank_candidates: int = 20,
+        rerank_timeout: float = 10.0,
+    ):
         """
         初始化嵌入检索
         
         Args:
             embedding_model: 嵌入模型名称
+            rerank_model: 重排序模型名称
+            vector_store: 可选的向量存储（例如 VectorStore.load 加载的），默认新建内存存储
+            cache: 可选的嵌入缓存，命中的文本不再请求嵌入服务
+            batch_size: 每个嵌入请求包含的文本数量
+            max_concurrency: 同时在途的嵌入请求数量上限
+            http2: 是否启用 HTTP/2（依赖 httpx[http2]，缺少 h2 时告警并退回 HTTP/1.1）
+            max_connections: 连接池最大连接数
+            max_keepalive_connections: 连接池保留的空闲 keep-alive 连接数
+            keepalive_expiry: 空闲连接保留的秒数
+            timeout: 读写超时（秒）
+            connect_timeout: 建立连接超时（秒）
+            max_retries: 429/5xx/网络错误的最大重试次数
+            backoff_base: 退避基数（秒），第 n 次重试在 [0, base*2^n] 内随机等待
+            backoff_max: 单次退避的上限（秒）
+            rerank_candidates: 两阶段检索时第一阶段召回、送去重排序的候选数量 N
+            rerank_timeout: 重排序请求的总超时（秒，包含重试），超时或失败时退回第一阶段的排序
         """
         self.__embedding_model = embedding_model
-        self.__vectorStore = VectorStore()
-    
+        self.__rerank_model = rerank_model
+        self.__vectorStore = vector_store if vector_store is not None else VectorStore()
+        self.__cache = cache
+        self.__batch_size = max(1, batch_size)
+        self.__max_concurrency = max(1, max_concurrency)
+
+        self.__http2 = http2 and importlib.util.find_spec("h2") is not None
+        if http2 and not self.__http2:
+            warning('请求启用 HTTP/2，但未安装 h2（httpx[http2]），退回 HTTP/1.1')
+        self.__limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections,
+            keepalive_expiry=keepalive_expiry,
+        )
+        self.__timeout = httpx.Timeout(timeout, connect=connect_timeout)
+        self.__max_retries = max(0, max_retries)
+        self.__backoff_base = backoff_base
+        self.__backoff_max = backoff_max
+        self.__client: Optional[httpx.AsyncClient] = None
+        self.__rerank_candidates = max(1, rerank_candidates)
+        self.__rerank_timeout = rerank_timeout
+
+    @property
+    def vector_store(self) -> VectorStore:
+        """底层向量存储"""
+        return self.__vectorStore
+
+    async def close(self) -> None:
+        """关闭共享的 HTTP 客户端及其连接池"""
+        if self.__client is not None:
+            await self.__client.aclose()
+            self.__client = None
+
+    async def embed(self, texts: List[str], text_type: str = "document") -> List[Sequence[float]]:
+        """
+        批量获取文本的嵌入向量：先查缓存并去重，剩余文本按 batch_size 切分，用信号量限制并发后同时发送
+
+        Args:
+            texts: 文本列表
+            text_type: "document" 或 "query"，部分嵌入模型对两者使用不同的编码
+
+        Returns:
+            与输入顺序一致的嵌入向量列表
+        """
+        if not texts:
+            return []
+
+        # 缓存命名空间包含文本类型：同一文本作为查询和文档时向量可能不同
+        __cache_model = f'{self.__embedding_model}#{text_type}'
+        # 缓存的 SQLite 读写放到工作线程，不阻塞事件循环
+        __results: List[Optional[Sequence[float]]] = (
+            await asyncio.to_thread(self.__cache.get_many, __cache_model, texts)
+            if self.__cache is not None else [None] * len(texts)
+        )
+
+        # 相同文本只请求一次
+        __missing: Dict[str, List[int]] = {}
+        for __i, (__text, __cached) in enumerate(zip(texts, __results)):
+            if __cached is None:
+                __missing.setdefault(__text, []).append(__i)
+        tracer.count("embedding.texts", len(texts), text_type=text_type)
+        tracer.count("embedding.cache_hits", len(texts) - sum(map(len, __missing.values())), text_type=text_type)
+        if not __missing:
+            return __results
+
+        __unique = list(__missing)
+        __semaphore = asyncio.Semaphore(self.__max_concurrency)
+        __batches = [__unique[__i:__i + self.__batch_size] for __i in range(0, len(__unique), self.__batch_size)]
+
+        async def __embed_batch(batch: List[str]) -> List[List[float]]:
+            async with __semaphore:
+                with tracer.span("embedding.batch", size=len(batch), text_type=text_type):
+                    return await self.__request_embeddings(batch, text_type)
+
+        __fetched = [
+            __embedding
+            for __batch_result in await asyncio.gather(*(__embed_batch(__batch) for __batch in __batches))
+            for __embedding in __batch_result
+        ]
+        if self.__cache is not None:
+            await asyncio.to_thread(self.__cache.put_many, __cache_model, __unique, __fetched)
+
+        for __text, __embedding in zip(__unique, __fetched):
+            for __i in __missing[__text]:
+                __results[__i] = __embedding
+        return __results
+
+    async def add_documents(self, documents: List[str], metadatas: Optional[List[Dict[str, Any]]] = None) -> int:
+        """
+        嵌入文档并批量写入向量存储
+
+        Args:
+            documents: 文档列表
+            metadatas: 与文档一一对应的元数据（例如来源路径）
+
+        Returns:
+            写入的文档数量
+        """
+        if metadatas is not None and len(metadatas) != len(documents):
+            raise ValueError("metadatas must have the same length as documents")
+
+        __embeddings = await self.embed(documents)
+        self.__vectorStore.add_items([
+            {
+                'embedding': __embedding,
+                'document': __document,
+                'metadata': metadatas[__i] if metadatas is not None else {},
+            }
+            for __i, (__embedding, __document) in enumerate(zip(__embeddings, documents))
+        ])
+        return len(documents)
+
+    async def add_document_stream(
+        self,
+        items: Union[Iterable[Tuple[str, Dict[str, Any]]], AsyncIterable[Tuple[str, Dict[str, Any]]]],
+    ) -> int:
+        """
+        从 (文档, 元数据) 流中按 batch_size 切批嵌入并写入：每凑满一批就立即发出请求，
+        最多 max_concurrency 个批次在途，在途批次满时才暂停读取，上游的读取/分块与嵌入请求重叠进行
+
+        Args:
+            items: (文档, 元数据) 的同步或异步可迭代对象，例如 DocumentChunker 产生的分块
 
-    async def embed(self, query: str, documents: List[str]) -> List[float]:
+        Returns:
+            写入的文档数量
         """
-        获取查询和文档的嵌入向量（实际上是重排序分数）
+        __semaphore = asyncio.Semaphore(self.__max_concurrency)
+        __tasks: List[asyncio.Task] = []
+
+        async def __flush(documents: List[str], metadatas: List[Dict[str, Any]]) -> int:
+            try:
+                return await self.add_documents(documents, metadatas)
+            finally:
+                __semaphore.release()
+
+        async def __submit(documents: List[str], metadatas: List[Dict[str, Any]]) -> None:
+            await __semaphore.acquire()
+            # 已经失败或被取消的批次尽早抛出，不再继续读取
+            for __task in __tasks:
+                if not __task.done():
+                    continue
+                # 被取消的任务调用 exception() 本身会抛出 CancelledError，先单独判断
+                if __task.cancelled():
+                    __semaphore.release()
+                    raise asyncio.CancelledError()
+                if __task.exception() is not None:
+                    __semaphore.release()
+                    raise __task.exception()
+            __tasks.append(asyncio.create_task(__flush(documents, metadatas)))
+
+        __documents: List[str] = []
+        __metadatas: List[Dict[str, Any]] = []
+        try:
+            async for __document, __metadata in self.__aiter(items):
+                __documents.append(__document)
+                __metadatas.append(__metadata)
+                if len(__documents) >= self.__batch_size:
+                    await __submit(__documents, __metadatas)
+                    __documents, __metadatas = [], []
+            if __documents:
+                await __submit(__documents, __metadatas)
+            return sum(await asyncio.gather(*__tasks))
+        except BaseException:
+            for __task in __tasks:
+                __task.cancel()
+            await asyncio.gather(*__tasks, return_exceptions=True)
+            raise
+
+    async def rerank(self, query: str, documents: List[str]) -> List[float]:
+        """
+        获取查询与文档的重排序相关性分数
         
         Args:
             query: 查询文本
             documents: 文档列表
             
         Returns:
-            相关性分数列表
+            与文档顺序一致的相关性分数列表
+        """
+        __data = await self.__post(
+            '/services/rerank/text-rerank/text-rerank',
+            {
+                "model": self.__rerank_model or self.__embedding_model,
+                "input": {
+                    "query": query,
+                    "documents": documents
+                }
+            }
+        )
+        __scores = [0.0] * len(documents)
+        for __result in __data["output"]["results"]:
+            __scores[__result["index"]] = __result["relevance_score"]
+        return __scores
+
+    async def retrieve(
+        self,
+        query: str,
+        topK: int = 3,
+        where: Optional[Dict[str, Any]] = None,
+        mode: str = "dense",
+        rerank: bool = False,
+        candidates: Optional[int] = None,
+    ) -> List[str]:
+        """
+        检索与查询最相关的文档
+
+        Args:
+            query: 查询文本
+            topK: 返回的文档数量
+            where: 可选的元数据过滤表达式
+            mode: "dense" 向量检索；"lexical" BM25 关键词检索；
+                "hybrid" 两路各取 max(4*topK, 20) 个候选，按倒数排名融合（RRF）合并
+            rerank: 为 True 时两阶段检索：先召回 candidates 个候选，只把候选用一次批量请求送去重排序，再保留 topK
+            candidates: 覆盖构造函数中的 rerank_candidates
+
+        Returns:
+            文档列表
+        """
+        if mode not in ("dense", "lexical", "hybrid"):
+            raise ValueError(f"Unknown retrieve mode: {mode}")
+        if not rerank:
+            return [self.__vectorStore.get_document(__row) for __row in await self.__first_stage(query, topK, where, mode)]
+
+        __candidates = max(topK, candidates or self.__rerank_candidates)
+        __documents = [
+            self.__vectorStore.get_document(__row) for __row in await self.__first_stage(query, __candidates, where, mode)
+        ]
+        if len(__documents) <= 1:
+            return __documents[:topK]
+        try:
+            with tracer.span("rerank", documents=len(__documents)):
+                __scores = await asyncio.wait_for(self.rerank(query, __documents), self.__rerank_timeout)
+        except Exception as e:
+            # 重排序不可用时退回第一阶段的排序，检索本身不失败
+            warning('重排序失败，使用召回顺序: %r', e)
+            return __documents[:topK]
+        __order = sorted(range(len(__documents)), key=lambda __i: __scores[__i], reverse=True)
+        return [__documents[__i] for __i in __order[:topK]]
+
+    async def retrieve_many(self, queries: List[str], topK: int = 3) -> List[List[str]]:
+        """
+        批量检索：查询向量走同一条批量嵌入管线，再用一次批量搜索打分
+
+        Args:
+            queries: 查询文本列表
+            topK: 每个查询返回的文档数量
+
+        Returns:
+            与查询顺序一一对应的文档列表
+        """
+        __query_embeddings = await self.embed(queries, text_type="query")
+        return await self.__vectorStore.search_many(__query_embeddings, topK)
+
+    async def __first_stage(self, query: str, top_k: int, where: Optional[Dict[str, Any]], mode: str) -> List[int]:
+        """
+        第一阶段召回：向量（ANN 或暴力）、BM25 或两者的 RRF 融合
+
+        Args:
+            query: 查询文本
+            top_k: 召回数量
+            where: 可选的元数据过滤表达式
+            mode: 检索模式，见 retrieve
+
+        Returns:
+            按相关性降序排列的行号
+        """
+        if mode == "lexical":
+            with tracer.span("lexical.search", top_k=top_k):
+                return self.__vectorStore.lexical_search_indices(query, top_k, where).tolist()
+
+        __query_embedding = (await self.embed([query], text_type="query"))[0]
+        if mode == "dense":
+            with tracer.span("vector.search", top_k=top_k):
+                return self.__vectorStore.search_indices([__query_embedding], top_k, where=where)[0].tolist()
+
+        __candidates = max(4 * top_k, 20)
+        with tracer.span("vector.search", top_k=__candidates):
+            __dense = self.__vectorStore.search_indices([__query_embedding], __candidates, where=where)[0]
+        with tracer.span("lexical.search", top_k=__candidates):
+            __lexical = self.__vectorStore.lexical_search_indices(query, __candidates, where)
+        __fused: Dict[int, float] = {}
+        for __ranking in (__dense, __lexical):
+            for __rank, __row in enumerate(__ranking.tolist()):
+                __fused[__row] = __fused.get(__row, 0.0) + 1.0 / (RRF_K + __rank + 1)
+        return sorted(__fused, key=__fused.get, reverse=True)[:top_k]
+
+    async def __request_embeddings(self, texts: List[str], text_type: str) -> List[List[float]]:
+        """
+        发送一个批次的嵌入请求
+
+        Args:
+            texts: 本批次的文本
+            text_type: 文本类型
+
+        Returns:
+            与本批次文本顺序一致的嵌入向量
         """
-        async with httpx.AsyncClient() as client:
-            __response = await client.request(
-                url=f'{os.getenv("EMBEDDING_BASE_URL")}/services/rerank/text-rerank/text-rerank',
-                method="POST",
+        __data = await self.__post(
+            '/services/embeddings/text-embedding/text-embedding',
+            {
+                "model": self.__embedding_model,
+                "input": {
+                    "texts": texts
+                },
+                "parameters": {
+                    "text_type": text_type
+                }
+            }
+        )
+        tracer.count("embedding.tokens", __data.get("usage", {}).get("total_tokens", 0))
+        __embeddings: List[Optional[List[float]]] = [None] * len(texts)
+        for __item in __data["output"]["embeddings"]:
+            __embeddings[__item["text_index"]] = __item["embedding"]
+        if any(__embedding is None for __embedding in __embeddings):
+            raise ValueError(f"Embedding response is missing vectors: got {len(__data['output']['embeddings'])} of {len(texts)}")
+        return __embeddings
+
+    @staticmethod
+    async def __aiter(items: Union[Iterable[Any], AsyncIterable[Any]]) -> AsyncIterator[Any]:
+        """把同步或异步可迭代对象统一为异步迭代"""
+        if hasattr(items, '__aiter__'):
+            async for __item in items:
+                yield __item
+        else:
+            for __item in items:
+                yield __item
+
+    def __get_client(self) -> httpx.AsyncClient:
+        """懒加载共享的 HTTP 客户端"""
+        if self.__client is None:
+            self.__client = httpx.AsyncClient(
+                base_url=os.getenv("EMBEDDING_BASE_URL", ""),
                 headers={
                     "Authorization": f'Bearer {os.getenv("EMBEDDING_KEY")}',
                     "content-type": "application/json",
                 },
-                json={
-                    "model": self.__embedding_model,
-                    "input": {
-                        "query": query,
-                        "documents": documents
-                    }
-                }
+                http2=self.__http2,
+                limits=self.__limits,
+                timeout=self.__timeout,
             )
+        return self.__client
 
+    async def __post(self, path: str, payload: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        发送 POST 请求，429/5xx 和网络错误按带抖动的指数退避重试（优先遵循 Retry-After）
 
-            __data = __response.json()
-            print('Embedding Response Data:', __data)
-            return [__result.relevance_score for __result in __data.output.results]
-        
-    
-    async def retrieve(self, query: str, topK: int = 3):
-        __query_embedding = await self.embed(query, [])
-        return await self.__vectorStore.search(__query_embedding, topK)
+        Args:
+            path: 相对于 EMBEDDING_BASE_URL 的路径
+            payload: JSON 请求体
 
+        Returns:
+            解析后的 JSON 响应
+        """
+        __client = self.__get_client()
+        __attempt = 0
+        while True:
+            __delay: Optional[float] = None
+            try:
+                __response = await __client.post(path, json=payload)
+                if __response.status_code not in RETRYABLE_STATUS_CODES or __attempt >= self.__max_retries:
+                    __response.raise_for_status()
+                    tracer.count("http.response_bytes", len(__response.content), path=path)
+                    return __response.json()
+                __retry_after = __response.headers.get("retry-after")
+                if __retry_after and __retry_after.replace('.', '', 1).isdigit():
+                    __delay = min(float(__retry_after), self.__backoff_max)
+            except httpx.TransportError:
+                if __attempt >= self.__max_retries:
+                    raise
+
+            if __delay is None:
+                __delay = random.uniform(0, min(self.__backoff_max, self.__backoff_base * (2 ** __attempt)))
+            __attempt += 1
+            tracer.count("http.retries", 1, path=path)
+            await asyncio.sleep(__delay)
 
 
-def example():
-    """重排序示例"""
+async def example():
+    """嵌入检索与重排序示例"""
 
-    retriever = EmbeddingRetrieve(embedding_model="text-rerank-model")
+    retriever = EmbeddingRetrieve(embedding_model="text-embedding-v4", rerank_model="qwen3-rerank")
     
     query = "什么是人工智能？"
     documents = [
@@ -91,9 +477,14 @@ def example():
         "深度学习是机器学习的一个子领域",
         "Python是一种流行的编程语言"
     ]
+
+    # 批量嵌入文档并写入向量存储
+    await retriever.add_documents(documents, [{"source": "example"}] * len(documents))
+    print(f"向量检索结果: {await retriever.retrieve(query, topK=2)}")
+    print(f"召回+重排序结果: {await retriever.retrieve(query, topK=2, rerank=True, candidates=3)}")
     
     # 获取重排序分数
-    relevance_scores = retriever.embed_sync(query, documents)
+    relevance_scores = await retriever.rerank(query, documents)
     print(f"重排序分数: {relevance_scores}")
     
     # 将分数与文档配对
@@ -106,6 +497,8 @@ def example():
     for score, doc in scored_docs:
         print(f"分数: {score:.4f} - 文档: {doc}")
 
+    await retriever.close()
+
 
 if __name__ == "__main__":
-    example()
\ No newline at end of file
+    asyncio.run(example())
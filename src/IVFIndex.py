@@ -0,0 +1,274 @@
+import time
+from array import array
+from typing import TYPE_CHECKING, Dict, List, Optional
+
+import numpy as np
+
+if TYPE_CHECKING:
+    from VectorStore import VectorStore
+
+
+class IVFIndex:
+    """倒排文件（IVF）近似最近邻索引
+
+    用球面 k-means 把归一化向量划分到 nlist 个簇，每个簇维护一个行号倒排列表。
+    检索时只对与查询最接近的 nprobe 个簇中的向量打分。
+    """
+
+    def __init__(
+        self,
+        nlist: Optional[int] = None,
+        nprobe: int = 8,
+        train_size: Optional[int] = None,
+        kmeans_iters: int = 20,
+        max_train_points: int = 65536,
+        seed: int = 0,
+    ):
+        """
+        初始化 IVF 索引
+
+        Args:
+            nlist: 簇数量，为 None 时训练时按 4*sqrt(N) 自动选择，并随数据增长自动重训
+            nprobe: 检索时探查的簇数量（召回率/延迟的调节旋钮）
+            train_size: 累积多少向量后开始训练，默认 max(39*nlist, 1024)
+            kmeans_iters: k-means 迭代次数
+            max_train_points: k-means 训练时最多采样的向量数
+            seed: 随机种子
+        """
+        self.__nlist = nlist
+        self.nprobe = nprobe
+        self.__train_size = train_size
+        self.__kmeans_iters = kmeans_iters
+        self.__max_train_points = max_train_points
+        self.__rng = np.random.default_rng(seed)
+
+        self.__centroids: Optional[np.ndarray] = None
+        self.__lists: List[array] = []
+        self.__trained_count = 0
+
+    @property
+    def is_trained(self) -> bool:
+        """是否已经训练出簇中心"""
+        return self.__centroids is not None
+
+    @property
+    def train_size(self) -> int:
+        """开始训练所需的最少向量数"""
+        if self.__train_size is not None:
+            return self.__train_size
+        return max(39 * (self.__nlist or 0), 1024)
+
+    @property
+    def nlist(self) -> int:
+        """当前簇数量（未训练时为0）"""
+        return 0 if self.__centroids is None else self.__centroids.shape[0]
+
+    def needs_retrain(self, count: int) -> bool:
+        """
+        自动 nlist 模式下，数据量增长到上次训练的4倍时需要重训，使簇大小保持在 O(sqrt(N))
+
+        Args:
+            count: 当前向量数量
+
+        Returns:
+            是否需要重训
+        """
+        return self.__nlist is None and self.is_trained and count >= 4 * self.__trained_count
+
+    def train(self, vectors: np.ndarray) -> None:
+        """
+        用球面 k-means 训练簇中心，会清空已有倒排列表
+
+        Args:
+            vectors: 归一化后的向量 (N, dim)
+        """
+        __count = vectors.shape[0]
+        __nlist = self.__nlist or int(4 * np.sqrt(__count))
+        __nlist = max(1, min(__nlist, __count))
+
+        if __count > self.__max_train_points:
+            __sample = vectors[self.__rng.choice(__count, self.__max_train_points, replace=False)]
+        else:
+            __sample = np.ascontiguousarray(vectors)
+
+        __centroids = __sample[self.__rng.choice(__sample.shape[0], __nlist, replace=False)].copy()
+        for _ in range(self.__kmeans_iters):
+            __assign = self.__assign(__sample, __centroids)
+            __sums = np.zeros_like(__centroids)
+            np.add.at(__sums, __assign, __sample)
+            __sizes = np.bincount(__assign, minlength=__nlist)
+
+            # 空簇用随机样本重新播种
+            __empty = np.flatnonzero(__sizes == 0)
+            if __empty.size:
+                __sums[__empty] = __sample[self.__rng.choice(__sample.shape[0], __empty.size)]
+
+            __norms = np.linalg.norm(__sums, axis=1, keepdims=True)
+            __norms[__norms == 0] = 1.0
+            __centroids = (__sums / __norms).astype(np.float32)
+
+        self.__centroids = __centroids
+        self.__lists = [array('q') for _ in range(__nlist)]
+        self.__trained_count = __count
+
+    def add(self, row_ids: np.ndarray, vectors: np.ndarray) -> None:
+        """
+        把向量分配到最近的簇
+
+        Args:
+            row_ids: 向量在存储中的行号
+            vectors: 对应的归一化向量 (n, dim)
+        """
+        if not self.is_trained:
+            raise RuntimeError("IVFIndex is not trained. Call train() first.")
+        __assign = self.__assign(vectors, self.__centroids)
+        for __row_id, __list_id in zip(np.asarray(row_ids).tolist(), __assign.tolist()):
+            self.__lists[__list_id].append(__row_id)
+
+    def probe(self, query: np.ndarray, nprobe: Optional[int] = None) -> np.ndarray:
+        """
+        返回与查询最接近的 nprobe 个簇中的全部行号
+
+        Args:
+            query: 归一化后的查询向量 (dim,)
+            nprobe: 本次探查的簇数量，默认使用 self.nprobe
+
+        Returns:
+            候选行号数组
+        """
+        __nprobe = min(nprobe or self.nprobe, self.nlist)
+        __scores = self.__centroids @ query
+        if __nprobe < self.nlist:
+            __chosen = np.argpartition(-__scores, __nprobe - 1)[:__nprobe]
+        else:
+            __chosen = np.arange(self.nlist)
+
+        __parts = [np.frombuffer(self.__lists[__i], dtype=np.int64) for __i in __chosen if len(self.__lists[__i])]
+        if not __parts:
+            return np.empty(0, dtype=np.int64)
+        return np.concatenate(__parts)
+
+    def export_state(self) -> Dict[str, np.ndarray]:
+        """
+        导出索引状态，倒排列表被展平成 ids + offsets 以便一次写盘
+
+        Returns:
+            包含 centroids、list_offsets、list_ids、trained_count 的数组字典
+        """
+        if not self.is_trained:
+            raise RuntimeError("IVFIndex is not trained.")
+        __sizes = np.array([len(__l) for __l in self.__lists], dtype=np.int64)
+        __offsets = np.concatenate([[0], np.cumsum(__sizes)])
+        __ids = np.empty(0, dtype=np.int64)
+        if __offsets[-1]:
+            __ids = np.concatenate([np.frombuffer(__l, dtype=np.int64) for __l in self.__lists if len(__l)])
+        return {
+            "centroids": self.__centroids,
+            "list_offsets": __offsets,
+            "list_ids": __ids,
+            "trained_count": np.array(self.__trained_count, dtype=np.int64),
+        }
+
+    def load_state(self, state: Dict[str, np.ndarray]) -> None:
+        """
+        从 export_state 的结果恢复索引
+
+        Args:
+            state: export_state 导出的数组字典
+        """
+        __offsets = np.asarray(state["list_offsets"], dtype=np.int64)
+        __ids = np.ascontiguousarray(state["list_ids"], dtype=np.int64)
+        self.__centroids = np.asarray(state["centroids"], dtype=np.float32)
+        self.__lists = []
+        for __start, __end in zip(__offsets[:-1], __offsets[1:]):
+            __list = array('q')
+            __list.frombytes(__ids[__start:__end].tobytes())
+            self.__lists.append(__list)
+        self.__trained_count = int(state["trained_count"])
+
+    def reset(self) -> None:
+        """清空簇中心和倒排列表"""
+        self.__centroids = None
+        self.__lists = []
+        self.__trained_count = 0
+
+    @staticmethod
+    def __assign(vectors: np.ndarray, centroids: np.ndarray, block_size: int = 16384) -> np.ndarray:
+        """
+        分块计算每个向量最近的簇中心，避免一次性生成 (N, nlist) 的大矩阵
+
+        Args:
+            vectors: 归一化向量 (N, dim)
+            centroids: 簇中心 (nlist, dim)
+            block_size: 每块的行数
+
+        Returns:
+            每个向量所属簇的下标
+        """
+        __result = np.empty(vectors.shape[0], dtype=np.int64)
+        for __start in range(0, vectors.shape[0], block_size):
+            __block = vectors[__start:__start + block_size]
+            __result[__start:__start + block_size] = np.argmax(__block @ centroids.T, axis=1)
+        return __result
+
+
+def recall_report(
+    store: "VectorStore",
+    query_embeddings: List[List[float]],
+    top_k: int = 10,
+    nprobe_values: List[int] = (1, 2, 4, 8, 16, 32),
+) -> List[Dict[str, float]]:
+    """
+    对比 ANN 检索与精确检索的召回率和延迟
+
+    Args:
+        store: 已配置 IVFIndex 的向量存储
+        query_embeddings: 查询向量列表
+        top_k: 计算 recall@top_k
+        nprobe_values: 需要评估的 nprobe 取值
+
+    Returns:
+        每一行包含 nprobe、recall、每个查询的平均延迟（毫秒）
+    """
+    __start = time.perf_counter()
+    __exact = store.search_indices(query_embeddings, top_k, exact=True)
+    __exact_ms = (time.perf_counter() - __start) * 1000 / len(query_embeddings)
+
+    __report = [{"nprobe": 0, "recall": 1.0, "latency_ms": __exact_ms}]
+    for __nprobe in nprobe_values:
+        __start = time.perf_counter()
+        __approx = store.search_indices(query_embeddings, top_k, nprobe=__nprobe)
+        __latency_ms = (time.perf_counter() - __start) * 1000 / len(query_embeddings)
+
+        __hits = sum(len(np.intersect1d(__a, __e)) for __a, __e in zip(__approx, __exact))
+        __total = sum(len(__e) for __e in __exact)
+        __report.append({
+            "nprobe": __nprobe,
+            "recall": __hits / __total if __total else 1.0,
+            "latency_ms": __latency_ms,
+        })
+    return __report
+
+
+def example():
+    from VectorStore import VectorStore
+
+    # 构造带聚类结构的随机数据
+    rng = np.random.default_rng(42)
+    dim, count = 64, 50000
+    centers = rng.normal(size=(200, dim))
+    data = centers[rng.integers(0, 200, count)] + 0.3 * rng.normal(size=(count, dim))
+
+    store = VectorStore(index=IVFIndex())
+    for i, vector in enumerate(data):
+        store.add_item({'embedding': vector, 'document': f'doc-{i}'})
+
+    queries = data[rng.choice(count, 200, replace=False)] + 0.1 * rng.normal(size=(200, dim))
+    print(f"向量数: {len(store)}")
+    print("nprobe(0=精确)  recall@10  latency(ms)")
+    for row in recall_report(store, queries, top_k=10):
+        print(f"{row['nprobe']:>14}  {row['recall']:>9.3f}  {row['latency_ms']:>11.3f}")
+
+
+if __name__ == "__main__":
+    example()
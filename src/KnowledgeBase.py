@@ -0,0 +1,301 @@
+import asyncio
+import hashlib
+import json
+import mmap
+import os
+import threading
+from contextlib import aclosing
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, AsyncIterator, Dict, List, Optional, Sequence, Tuple, Union
+
+from BM25Index import BM25Index
+from DocumentChunker import DocumentChunker
+from Tracer import tracer
+from utils import warning
+from VectorStore import VectorStore
+
+if TYPE_CHECKING:
+    from EmbeddingRetrieve import EmbeddingRetrieve
+
+
+class KnowledgeBase:
+    """增量同步的知识库索引
+
+    在 index_dir 中持久化向量存储和一份清单 manifest.json：
+    路径 -> (mtime_ns, size, sha256, chunk_ids)。
+    每次 sync 只用 stat 比较文件，mtime/size 未变的文件不会被读取；
+    内容变化的文件删除旧向量后流式分块、重新嵌入，已删除的文件删除对应向量。
+    stat、哈希和分块都在线程池中进行（并发数有上限），不阻塞事件循环，并与嵌入请求重叠。
+    """
+
+    MANIFEST_VERSION = 3
+
+    # 超过该大小的文件用 mmap 计算哈希，避免把整个文件读入内存
+    MMAP_THRESHOLD = 1024 * 1024
+
+    def __init__(
+        self,
+        knowledge_dir: Union[str, Path],
+        index_dir: Union[str, Path],
+        suffixes: Sequence[str] = ('.md', '.txt', '.json'),
+        chunker: Optional[DocumentChunker] = None,
+        max_workers: int = 8,
+        queue_size: int = 256,
+    ):
+        """
+        初始化知识库，index_dir 中已有索引时直接加载
+
+        Args:
+            knowledge_dir: 知识文件所在目录
+            index_dir: 向量存储和清单的保存目录
+            suffixes: 需要索引的文件后缀
+            chunker: 文档分块器，分块参数与清单中记录的不同时所有文件会重新嵌入
+            max_workers: 同时读取的文件数量上限
+            queue_size: 分块队列的容量，嵌入跟不上时读取线程在此等待
+        """
+        self.__knowledge_dir = Path(knowledge_dir)
+        self.__index_dir = Path(index_dir)
+        self.__store_dir = self.__index_dir / 'store'
+        self.__manifest_path = self.__index_dir / 'manifest.json'
+        self.__suffixes = set(suffixes)
+        self.__chunker = chunker if chunker is not None else DocumentChunker()
+        self.__max_workers = max(1, max_workers)
+        self.__queue_size = max(1, queue_size)
+
+        self.__manifest: Dict[str, Dict[str, Any]] = {}
+        if self.__manifest_path.exists() and (self.__store_dir / 'meta.json').exists():
+            with open(self.__manifest_path, 'r', encoding='utf-8') as f:
+                __data = json.load(f)
+            # 清单版本或分块参数变化时丢弃旧索引，全部重建
+            if __data.get("version") == self.MANIFEST_VERSION and __data.get("chunker") == self.__chunker.config:
+                self.__manifest = __data["files"]
+        # 挂载 BM25 索引，支持 retrieve(mode="hybrid") 的关键词召回
+        if self.__manifest:
+            self.__vector_store = VectorStore.load(self.__store_dir, lexical_index=BM25Index())
+        else:
+            self.__vector_store = VectorStore(lexical_index=BM25Index())
+
+    @property
+    def vector_store(self) -> VectorStore:
+        """知识库的向量存储，传给 EmbeddingRetrieve 用于检索"""
+        return self.__vector_store
+
+    @property
+    def files(self) -> List[str]:
+        """已索引的文件路径"""
+        return list(self.__manifest)
+
+    async def sync(self, retriever: "EmbeddingRetrieve") -> Dict[str, int]:
+        """
+        把知识目录的变化同步到向量存储，没有变化时不读取文件内容也不写盘
+
+        Args:
+            retriever: 用于嵌入新文档的检索器，其 vector_store 必须是本知识库的存储
+
+        Returns:
+            added / updated / removed / unchanged 文件数和新写入的 chunks 数
+        """
+        if retriever.vector_store is not self.__vector_store:
+            raise ValueError("retriever must be constructed with vector_store=knowledge_base.vector_store")
+
+        with tracer.span("knowledge.sync") as __span:
+            __stats = await self.__sync(retriever)
+            for __name, __value in __stats.items():
+                __span.set(__name, __value)
+            return __stats
+
+    async def __sync(self, retriever: "EmbeddingRetrieve") -> Dict[str, int]:
+        """sync 的实现"""
+        __stats = {"added": 0, "updated": 0, "removed": 0, "unchanged": 0, "failed": 0, "chunks": 0}
+        __files = await asyncio.to_thread(self.__scan)
+        __seen = {__key for __key, _ in __files}
+        __dirty = False
+
+        # 只有 stat 变化的文件需要计算哈希
+        __candidates = [
+            (__key, __stat) for __key, __stat in __files
+            if self.__manifest.get(__key, {}).get("mtime_ns") != __stat.st_mtime_ns
+            or self.__manifest[__key]["size"] != __stat.st_size
+        ]
+        __semaphore = asyncio.Semaphore(self.__max_workers)
+
+        async def __hash(key: str) -> Optional[str]:
+            async with __semaphore:
+                try:
+                    return await asyncio.to_thread(self.__hash_file, key)
+                except OSError as e:
+                    warning('读取文件 %s 失败，跳过: %s', key, e)
+                    return None
+
+        __changed: List[str] = []
+        __hashes = await asyncio.gather(*(__hash(__key) for __key, _ in __candidates))
+        for (__key, __stat), __sha in zip(__candidates, __hashes):
+            __entry = self.__manifest.get(__key)
+            if __sha is None:
+                __stats["failed"] += 1
+                continue
+            if __entry is not None and __entry["sha256"] == __sha:
+                # 只是 touch 过，内容未变：更新 stat 即可
+                __entry["mtime_ns"] = __stat.st_mtime_ns
+                __entry["size"] = __stat.st_size
+                __dirty = True
+                continue
+
+            __stats["updated" if __entry is not None else "added"] += 1
+            __changed.append(__key)
+            self.__manifest[__key] = {
+                "mtime_ns": __stat.st_mtime_ns,
+                "size": __stat.st_size,
+                "sha256": __sha,
+                "chunk_ids": [],
+            }
+        __stats["unchanged"] = len(__files) - len(__changed) - __stats["failed"]
+
+        __removed = [__key for __key in self.__manifest if __key not in __seen]
+        for __key in __removed:
+            del self.__manifest[__key]
+        __stats["removed"] = len(__removed)
+
+        # 变化的文件也按来源删除：即使上次在写清单前中断，也不会留下重复向量
+        for __key in __removed + __changed:
+            self.__vector_store.delete({'source': __key})
+
+        if __changed:
+            __failed: List[str] = []
+            try:
+                async with aclosing(self.__produce_chunks(__changed, __failed)) as __chunks:
+                    __stats["chunks"] = await retriever.add_document_stream(__chunks)
+            except BaseException:
+                # 嵌入中断：这些文件视为未索引，下次 sync 重新处理
+                for __key in __changed:
+                    self.__manifest.pop(__key, None)
+                raise
+            # 分块失败的文件从清单移除，下次 sync 会重新处理（并清理已写入的部分向量）
+            for __key in __failed:
+                del self.__manifest[__key]
+                self.__vector_store.delete({'source': __key})
+            __stats["failed"] += len(__failed)
+
+        if __dirty or __removed or __changed:
+            await asyncio.to_thread(self.save)
+        return __stats
+
+    def save(self) -> None:
+        """先保存向量存储（压缩掉已删除的行），再原子替换清单"""
+        self.__index_dir.mkdir(parents=True, exist_ok=True)
+        self.__vector_store.save(self.__store_dir)
+
+        __tmp = self.__manifest_path.with_name(self.__manifest_path.name + '.tmp')
+        with open(__tmp, 'w', encoding='utf-8') as f:
+            json.dump(
+                {"version": self.MANIFEST_VERSION, "chunker": self.__chunker.config, "files": self.__manifest},
+                f,
+                ensure_ascii=False,
+            )
+        os.replace(__tmp, self.__manifest_path)
+
+    def __scan(self) -> List[Tuple[str, os.stat_result]]:
+        """列出需要索引的文件及其 stat"""
+        self.__knowledge_dir.mkdir(parents=True, exist_ok=True)
+        __files = []
+        with os.scandir(self.__knowledge_dir) as __entries:
+            for __entry in __entries:
+                if __entry.is_file() and os.path.splitext(__entry.name)[1] in self.__suffixes:
+                    __files.append((__entry.path, __entry.stat()))
+        __files.sort()
+        return __files
+
+    def __hash_file(self, path: str) -> str:
+        """计算文件内容的 sha256，大文件通过 mmap 交给 hashlib，不复制到 Python 对象"""
+        with open(path, 'rb') as f:
+            __size = os.fstat(f.fileno()).st_size
+            if __size >= self.MMAP_THRESHOLD:
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as __mapped:
+                    return hashlib.sha256(__mapped).hexdigest()
+            return hashlib.sha256(f.read()).hexdigest()
+
+    async def __produce_chunks(self, paths: List[str], failed: List[str]) -> AsyncIterator[Tuple[str, Dict[str, Any]]]:
+        """
+        在线程池中并发读取、分块文件，通过有界队列交给事件循环中的嵌入流程
+
+        Args:
+            paths: 需要重新嵌入的文件
+            failed: 读取或解码失败、或分块时内容与清单哈希不一致的文件会追加到这里
+
+        Returns:
+            (块文本, 元数据) 的异步生成器
+        """
+        __loop = asyncio.get_running_loop()
+        __queue: asyncio.Queue = asyncio.Queue(maxsize=self.__queue_size)
+        __stop = threading.Event()
+        __semaphore = asyncio.Semaphore(self.__max_workers)
+
+        def __read(key: str) -> bool:
+            __entry = self.__manifest[key]
+            # 分块读到的字节同时计算哈希，与清单中的哈希核对
+            __digest = hashlib.sha256()
+            for __i, __chunk in enumerate(self.__chunker.chunk_file(key, __digest)):
+                if __stop.is_set():
+                    return True
+                __chunk_id = f'{__entry["sha256"][:16]}:{__i}'
+                __entry["chunk_ids"].append(__chunk_id)
+                # 队列满时阻塞读取线程，形成背压
+                asyncio.run_coroutine_threadsafe(
+                    __queue.put((__chunk, {'source': key, 'chunk_id': __chunk_id})), __loop
+                ).result()
+            return __digest.hexdigest() == __entry["sha256"]
+
+        async def __load(key: str) -> None:
+            async with __semaphore:
+                try:
+                    if not await asyncio.to_thread(__read, key):
+                        # 文件在计算哈希之后、分块之前被修改：块与清单中的哈希不对应，下次 sync 重新索引
+                        warning('文件 %s 在同步过程中被修改，跳过', key)
+                        failed.append(key)
+                except (OSError, UnicodeDecodeError) as e:
+                    warning('读取文件 %s 失败，跳过: %s', key, e)
+                    failed.append(key)
+
+        async def __run() -> None:
+            try:
+                await asyncio.gather(*(__load(__key) for __key in paths))
+            finally:
+                await __queue.put(None)
+
+        __producer = asyncio.create_task(__run())
+        try:
+            while (__item := await __queue.get()) is not None:
+                yield __item
+            await __producer
+        finally:
+            # 消费方提前退出时通知读取线程停止，并清空队列唤醒阻塞在 put 上的线程
+            __stop.set()
+            while not __producer.done():
+                while not __queue.empty():
+                    __queue.get_nowait()
+                await asyncio.wait({__producer}, timeout=0.05)
+
+
+async def example():
+    import tempfile
+    from EmbeddingRetrieve import EmbeddingRetrieve
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        knowledge_dir = Path(tmp_dir) / 'knowledge'
+        knowledge_dir.mkdir()
+        (knowledge_dir / 'a.md').write_text('机器学习是一种人工智能技术', encoding='utf-8')
+        (knowledge_dir / 'b.md').write_text('Python是一种流行的编程语言', encoding='utf-8')
+
+        knowledge_base = KnowledgeBase(knowledge_dir, Path(tmp_dir) / 'index')
+        retriever = EmbeddingRetrieve('text-embedding-v4', vector_store=knowledge_base.vector_store)
+        print("首次同步:", await knowledge_base.sync(retriever))
+        print("再次同步:", await knowledge_base.sync(retriever))
+
+        (knowledge_dir / 'b.md').unlink()
+        print("删除文件后同步:", await knowledge_base.sync(retriever))
+        print(await retriever.retrieve('什么是人工智能？', topK=1))
+        await retriever.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(example())
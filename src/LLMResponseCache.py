@@ -0,0 +1,183 @@
+import hashlib
+import json
+import sqlite3
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Union
+
+
+class LLMResponseCache:
+    """LLM 流式响应的缓存 / 录制回放层
+
+    键为 sha256(model, messages, tools) 的规范化 JSON，值为一次请求产出的全部流事件，两级存储：
+    - 内存 LRU：按条目数淘汰
+    - SQLite 持久层（可选）：跨运行复用，命中后回填到内存层
+    模式：
+    - "off"：不读不写，ChatOpenAI 总是请求网络
+    - "record"：命中则回放，未命中请求网络并录制
+    - "replay"：只回放，未命中抛出 LookupError，保证整个流程不访问网络
+    get/put 是同步的，异步代码应通过 asyncio.to_thread 调用；内部用锁串行化，可以在多个工作线程中使用
+    """
+
+    MODES = ("off", "record", "replay")
+
+    def __init__(
+        self,
+        path: Optional[Union[str, Path]] = None,
+        mode: str = "record",
+        max_memory_items: int = 256,
+    ):
+        """
+        初始化响应缓存
+
+        Args:
+            path: SQLite 数据库文件路径，为 None 时只使用内存层
+            mode: "off"、"record" 或 "replay"
+            max_memory_items: 内存层保留的最大响应数量
+        """
+        if mode not in self.MODES:
+            raise ValueError(f"Unknown LLM cache mode '{mode}', expected one of {self.MODES}")
+        self.mode = mode
+        self.__max_memory_items = max_memory_items
+        self.__memory: "OrderedDict[str, List[Dict[str, Any]]]" = OrderedDict()
+        self.__lock = threading.Lock()
+
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        self.__db: Optional[sqlite3.Connection] = None
+        if path is not None and mode != "off":
+            Path(path).parent.mkdir(parents=True, exist_ok=True)
+            # 连接在 to_thread 的工作线程中使用，由 self.__lock 保证同一时刻只有一个线程访问
+            self.__db = sqlite3.connect(str(path), check_same_thread=False)
+            self.__db.execute("PRAGMA journal_mode=WAL")
+            self.__db.execute("PRAGMA synchronous=NORMAL")
+            self.__db.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, model TEXT NOT NULL, events TEXT NOT NULL)"
+            )
+            self.__db.commit()
+
+    @property
+    def enabled(self) -> bool:
+        """是否读写缓存"""
+        return self.mode != "off"
+
+    @staticmethod
+    def key(model: str, messages: List[Dict[str, Any]], tools: List[Dict[str, Any]]) -> str:
+        """
+        请求的规范化哈希：字典键排序、紧凑分隔符，与字段顺序和空白无关
+
+        Args:
+            model: 模型名称
+            messages: 发送的消息列表
+            tools: 发送的工具定义
+
+        Returns:
+            sha256 十六进制摘要
+        """
+        __canonical = json.dumps(
+            {"model": model, "messages": messages, "tools": tools},
+            sort_keys=True,
+            ensure_ascii=False,
+            separators=(',', ':'),
+        )
+        return hashlib.sha256(__canonical.encode('utf-8')).hexdigest()
+
+    @property
+    def stats(self) -> Dict[str, int]:
+        """命中/未命中计数和内存层条目数"""
+        return {
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "memory_items": len(self.__memory),
+        }
+
+    def get(self, key: str) -> Optional[List[Dict[str, Any]]]:
+        """
+        查询录制的流事件，先查内存层再查 SQLite
+
+        Args:
+            key: key() 的结果
+
+        Returns:
+            流事件列表，未命中为 None
+        """
+        with self.__lock:
+            __events = self.__memory.get(key)
+            if __events is not None:
+                self.__memory.move_to_end(key)
+                self.memory_hits += 1
+                return __events
+
+            if self.__db is not None:
+                __row = self.__db.execute("SELECT events FROM responses WHERE key = ?", (key,)).fetchone()
+                if __row is not None:
+                    __events = json.loads(__row[0])
+                    self.__remember(key, __events)
+                    self.disk_hits += 1
+                    return __events
+
+            self.misses += 1
+            return None
+
+    def put(self, key: str, model: str, events: List[Dict[str, Any]]) -> None:
+        """
+        录制一次完整请求的流事件（内存层 + SQLite）
+
+        Args:
+            key: key() 的结果
+            model: 模型名称，便于按模型清理
+            events: ChatOpenAI.stream 产出的全部事件，最后一个为 done
+        """
+        with self.__lock:
+            self.__remember(key, events)
+            if self.__db is not None:
+                self.__db.execute(
+                    "INSERT OR REPLACE INTO responses (key, model, events) VALUES (?, ?, ?)",
+                    (key, model, json.dumps(events, ensure_ascii=False)),
+                )
+                self.__db.commit()
+
+    def close(self) -> None:
+        """关闭 SQLite 连接"""
+        with self.__lock:
+            if self.__db is not None:
+                self.__db.close()
+                self.__db = None
+
+    def __remember(self, key: str, events: List[Dict[str, Any]]) -> None:
+        """写入内存层并淘汰最久未使用的项"""
+        self.__memory[key] = events
+        self.__memory.move_to_end(key)
+        while len(self.__memory) > self.__max_memory_items:
+            self.__memory.popitem(last=False)
+
+
+def example():
+    import tempfile
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        messages = [{"role": "user", "content": "今天北京天气怎么样？"}]
+        events = [
+            {"type": "content", "delta": "晴，"},
+            {"type": "content", "delta": "25 度"},
+            {"type": "done", "content": "晴，25 度", "tool_calls": []},
+        ]
+        cache = LLMResponseCache(Path(tmp_dir) / 'llm.sqlite')
+        key = LLMResponseCache.key("glm-4.7", messages, [])
+        cache.put(key, "glm-4.7", events)
+        cache.close()
+
+        # 新进程只用磁盘层回放，未命中直接报错
+        replay = LLMResponseCache(Path(tmp_dir) / 'llm.sqlite', mode="replay")
+        print("回放:", replay.get(key))
+        print("缓存统计:", replay.stats)
+        replay.close()
+
+
+if __name__ == "__main__":
+    example()
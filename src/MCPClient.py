@@ -4,12 +4,24 @@ from pathlib import Path
 import shlex
 from typing import Any, List, Optional
 from mcp import ClientSession, StdioServerParameters, Tool
+from mcp.types import CallToolResult
 from mcp.client.stdio import stdio_client
 
-from utils import log_title
+from ToolResultCache import ToolResultCache
+from Tracer import tracer
+from utils import error, info, log_title, warning
 
 class MCPClient:
-    def __init__(self, name: str, command: str, args: List[str], version: str = None):
+    """MCP 客户端
+
+    stdio 连接和会话在一个专用的后台任务中进入和退出（anyio 的 cancel scope 要求同一个任务），
+    因此可以在任意任务中 init/close，也可以被多个 Agent 共享。连接断开后下一次调用工具时自动重连；
+    调用过程中断开时只重试只读工具，写工具的调用以 ConnectionError 交给调用方处理。
+    可选的 ToolResultCache 缓存只读工具的结果，命中时不再与服务器进程往返。
+    """
+
+    def __init__(self, name: str, command: str, args: List[str], version: str = None, max_concurrency: int = 4,
+                 result_cache: Optional[ToolResultCache] = None):
         """
         初始化 MCP 客户端
         
@@ -18,11 +30,21 @@ class MCPClient:
             command: 要执行的命令
             args: 命令参数（必须是字符串列表）
             version: 版本号
+            max_concurrency: 同时在途的工具调用数量上限（同一个服务器进程）
+            result_cache: 可选的工具结果缓存，可以在多个客户端之间共享（键包含服务器名）
         """
         
         # Initialize session and client objects
         self.__session: Optional[ClientSession] = None
-        self.__exit_stack: Optional[AsyncExitStack] = None
+        # stdio 传输的读端，服务器进程退出（stdout EOF）后其发送端被关闭
+        self.__read_stream: Any = None
+        # 持有连接的后台任务，设置 __stop 后退出并关闭子进程
+        self.__runner: Optional[asyncio.Task] = None
+        self.__stop: Optional[asyncio.Event] = None
+        self.__init_lock = asyncio.Lock()
+        self.__reconnect_lock = asyncio.Lock()
+        # 每次成功连接加一，并发调用同时发现断开时只重连一次
+        self.__generation = 0
 
         # 不需要anthropic,因为有openai
         # self.anthropic = Anthropic()
@@ -37,24 +59,91 @@ class MCPClient:
         self.__command = command
         self.__args = [str(arg) for arg in args]  # 确保所有参数都是字符串
         self.__version = version or "0.0.1"
-        self.__stdio_transport = None
         self.__tools = []
         self.__initialized = False
+        self.__semaphore = asyncio.Semaphore(max(1, max_concurrency))
+        self.__result_cache = result_cache
+        # 已发送、尚未返回的工具调用数，健康检查据此区分"服务器忙"和"服务器无响应"
+        self.__in_flight = 0
+
+    @property
+    def name(self) -> str:
+        """客户端名称"""
+        return self.__name
+
+    @property
+    def in_flight(self) -> int:
+        """正在服务器上执行的工具调用数量"""
+        return self.__in_flight
+
+    @property
+    def is_alive(self) -> bool:
+        """连接任务是否仍在运行，且服务器进程的输出流没有关闭"""
+        return (
+            self.__initialized and self.__runner is not None and not self.__runner.done()
+            and self.__transport_open
+        )
+
+    @property
+    def __transport_open(self) -> bool:
+        """读端是否还有打开的发送端（stdio 读取任务在服务器 stdout 关闭时退出），无法判断时视为打开"""
+        if self.__read_stream is None:
+            return False
+        try:
+            return self.__read_stream.statistics().open_send_streams > 0
+        except Exception:
+            return True
 
     async def close(self):
-        """正确关闭所有资源"""
-        if self.__exit_stack:
+        """正确关闭所有资源：通知后台任务退出，由它在自己的任务中关闭会话和子进程"""
+        __runner = self.__runner
+        if __runner is not None:
+            self.__stop.set()
             try:
-                await self.__exit_stack.aclose()
+                await __runner
             except Exception as e:
-                print(f"Warning: Error closing MCP client {self.__name}: {e}")
+                warning("Error closing MCP client %s: %s", self.__name, e)
+        self.__runner = None
+        self.__session = None
         self.__initialized = False
     
     async def init(self):
-        """初始化 MCP 客户端"""
-        if not self.__initialized:
-            await self.__connect_to_server()
-            self.__initialized = True
+        """初始化 MCP 客户端（并发调用时只会启动一次服务器）"""
+        async with self.__init_lock:
+            if not self.__initialized:
+                await self.__connect_to_server()
+                self.__initialized = True
+
+    async def reconnect(self, generation: Optional[int] = None):
+        """
+        关闭并重新建立连接
+
+        Args:
+            generation: 调用方观察到断开时的连接代数；若期间已被其他任务重连则跳过
+        """
+        async with self.__reconnect_lock:
+            if generation is not None and generation != self.__generation:
+                return
+            await self.close()
+            await self.init()
+
+    async def ping(self, timeout: float = 5.0) -> bool:
+        """
+        健康检查
+
+        Args:
+            timeout: 超时（秒）
+
+        Returns:
+            服务器是否在超时内响应 ping
+        """
+        if not self.is_alive:
+            return False
+        try:
+            await asyncio.wait_for(self.__session.send_ping(), timeout)
+            return True
+        except Exception:
+            return False
 
     def get_tools(self) -> List[Tool]:
         return self.__tools
@@ -67,58 +156,132 @@ class MCPClient:
             tool_name: 工具名称
             args: 工具参数
             
+        Returns:
+            工具执行结果（内容块列表）
+        """
+        return (await self.call_tool_result(tool_name, args)).content
+
+    async def call_tool_result(self, tool_name: str, args: dict) -> CallToolResult:
+        """
+        调用工具并返回完整的 CallToolResult（包含 isError），交给 ToolResultProcessor 处理
+
+        Args:
+            tool_name: 工具名称
+            args: 工具参数
+
         Returns:
             工具执行结果
         """
-        if not self.__session:
+        if not self.__initialized:
             raise RuntimeError("MCP client not initialized. Call init() first.")
-        
-        try:
-            # 调用工具
-            result = await self.__session.call_tool(tool_name, args)
-            return result.content
-        except Exception as e:
-            print(f"Error calling tool {tool_name}: {e}")
-            raise
+        if self.__result_cache is not None:
+            return await self.__result_cache.call(
+                self.__name, tool_name, args, lambda: self.__call_tool_uncached(tool_name, args)
+            )
+        return await self.__call_tool_uncached(tool_name, args)
+
+    async def __call_tool_uncached(self, tool_name: str, args: dict) -> CallToolResult:
+        """
+        调用服务器上的工具，连接断开时重连
+
+        发送前已经断开时重连后再发送；发送后才断开时请求可能已经在服务器上执行过，
+        只有 ToolResultCache 中登记的只读工具会重试一次，其他工具重连后抛出 ConnectionError，避免写操作被执行两次。
+        """
+        for __attempt in range(2):
+            __generation = self.__generation
+            if not self.is_alive:
+                warning("MCP client %s disconnected, reconnecting...", self.__name)
+                await self.reconnect(__generation)
+                continue
+            try:
+                # 调用工具，超过并发上限时在这里排队
+                async with self.__semaphore:
+                    with tracer.span("mcp.call_tool", server=self.__name, tool=tool_name, attempt=__attempt):
+                        self.__in_flight += 1
+                        try:
+                            return await self.__session.call_tool(tool_name, args)
+                        finally:
+                            self.__in_flight -= 1
+            except Exception as e:
+                if await self.ping():
+                    error("Error calling tool %s: %s", tool_name, e)
+                    raise
+                # 调用失败且服务器不再响应 ping：连接已断开，先重连让后续调用可用
+                warning("MCP client %s connection lost during tool %s, reconnecting...", self.__name, tool_name)
+                await self.reconnect(__generation)
+                if __attempt == 0 and self.__result_cache is not None and self.__result_cache.is_idempotent(tool_name):
+                    continue
+                raise ConnectionError(
+                    f"MCP server '{self.__name}' connection lost while calling tool '{tool_name}'; "
+                    f"the call may already have run on the server and was not retried"
+                ) from e
+        raise RuntimeError(f"MCP client {self.__name} could not reconnect")
 
     async def __connect_to_server(self):
-        """连接到 MCP 服务器"""
+        """在后台任务中连接到 MCP 服务器，等待握手完成"""
         
         # 创建服务器参数
         server_params = StdioServerParameters(
             command=self.__command,
             args=self.__args,
         )
-        
+
+        __ready: asyncio.Future = asyncio.get_running_loop().create_future()
+        self.__stop = asyncio.Event()
         try:
-            # 创建新的 AsyncExitStack
-            self.__exit_stack = AsyncExitStack()
-            
-            # 创建 stdio 传输
-            stdio_transport = await self.__exit_stack.enter_async_context(
-                stdio_client(server_params)
-            )
-            self.__stdio_transport = stdio_transport
-            read_stream, write_stream = stdio_transport
-            
-            # 创建会话
-            self.__session = await self.__exit_stack.enter_async_context(
-                ClientSession(read_stream, write_stream)
-            )
-            
-            # 初始化会话
-            await self.__session.initialize()
-            
-            # 获取可用工具
-            response = await self.__session.list_tools()
-            self.__tools = response.tools
-            print(f"\nConnected to '{self.__name}' server with tools:", [tool.name for tool in self.__tools])
-            
+            with tracer.span("mcp.connect", server=self.__name):
+                # 后台任务继承当前上下文，其中的 mcp.list_tools span 挂在 mcp.connect 下
+                self.__runner = asyncio.create_task(self.__run(server_params, __ready), name=f"mcp-{self.__name}")
+                await __ready
         except Exception as e:
-            print(f"Error connecting to server '{self.__name}': {e}")
+            error("Error connecting to server '%s': %s", self.__name, e)
             await self.close()
             raise
 
+    async def __run(self, server_params: StdioServerParameters, ready: asyncio.Future):
+        """
+        持有连接的后台任务：进入 stdio 传输和会话上下文，握手后等待关闭信号
+
+        Args:
+            server_params: 服务器参数
+            ready: 握手完成（或失败）时设置
+        """
+        try:
+            async with AsyncExitStack() as __exit_stack:
+                # 创建 stdio 传输
+                read_stream, write_stream = await __exit_stack.enter_async_context(stdio_client(server_params))
+                self.__read_stream = read_stream
+
+                # 创建会话
+                self.__session = await __exit_stack.enter_async_context(ClientSession(read_stream, write_stream))
+
+                # 初始化会话
+                await self.__session.initialize()
+
+                # 获取可用工具
+                with tracer.span("mcp.list_tools", server=self.__name) as __span:
+                    response = await self.__session.list_tools()
+                    self.__tools = response.tools
+                    __span.set("tools", len(self.__tools))
+                info("Connected to '%s' server with tools: %s", self.__name, [tool.name for tool in self.__tools])
+                self.__generation += 1
+                ready.set_result(None)
+
+                await self.__stop.wait()
+        except Exception as e:
+            if not ready.done():
+                ready.set_exception(e)
+            else:
+                # 连接中途断开：记录后结束任务，下一次 call_tool 会重连
+                warning("MCP server '%s' connection lost: %s", self.__name, e)
+        except BaseException as e:
+            if not ready.done():
+                ready.set_exception(RuntimeError(f"MCP server '{self.__name}' connection cancelled: {e!r}"))
+            raise
+        finally:
+            self.__session = None
+            self.__read_stream = None
+
 
 async def example():
     project_root_dir = Path(__file__).parent.parent
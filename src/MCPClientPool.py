@@ -0,0 +1,167 @@
+import asyncio
+from typing import Dict, List, Optional, Set
+
+from MCPClient import MCPClient
+from utils import log_title, warning
+
+
+class MCPClientPool:
+    """MCP 客户端池
+
+    让服务器子进程保持常驻，多个 Agent 共享同一组已连接的 MCPClient：
+    首次启动时所有服务器并发握手（冷启动耗时取决于最慢的服务器），之后获取客户端几乎没有开销。
+    后台定期 ping 每个服务器，无响应时透明重连。
+    重连会中断该服务器上所有在途的调用：进程已退出时立即重连；进程仍在但 ping 超时，
+    且有工具调用在途时（服务器可能只是忙于长时间的调用），连续失败 max_ping_failures 次才重连。
+    """
+
+    def __init__(
+        self,
+        health_check_interval: Optional[float] = 30.0,
+        ping_timeout: float = 5.0,
+        max_ping_failures: int = 3,
+    ):
+        """
+        初始化客户端池
+
+        Args:
+            health_check_interval: 健康检查间隔（秒），为 None 时不做后台检查
+            ping_timeout: 单次 ping 的超时（秒）
+            max_ping_failures: 有调用在途时，触发重连所需的连续 ping 失败次数
+        """
+        self.__clients: Dict[str, MCPClient] = {}
+        # 已经启动过的客户端名称，只对它们做健康检查
+        self.__started: Set[str] = set()
+        self.__health_check_interval = health_check_interval
+        self.__ping_timeout = ping_timeout
+        self.__max_ping_failures = max(1, max_ping_failures)
+        # 名称 -> 连续 ping 失败次数
+        self.__ping_failures: Dict[str, int] = {}
+        self.__health_task: Optional[asyncio.Task] = None
+
+    def register(self, client: MCPClient) -> MCPClient:
+        """
+        登记一个客户端（不会立即启动）
+
+        Args:
+            client: MCP 客户端，名称在池内必须唯一
+
+        Returns:
+            池中同名的客户端
+        """
+        __existing = self.__clients.get(client.name)
+        if __existing is not None and __existing is not client:
+            raise ValueError(f"MCP client '{client.name}' is already registered")
+        self.__clients[client.name] = client
+        return client
+
+    async def start(self, clients: Optional[List[MCPClient]] = None) -> List[MCPClient]:
+        """
+        登记并并发启动客户端，同时开启后台健康检查
+
+        Args:
+            clients: 需要登记的客户端，为 None 时启动池中所有客户端
+
+        Returns:
+            已启动的客户端列表
+        """
+        for __client in clients or []:
+            self.register(__client)
+        __targets = clients if clients is not None else list(self.__clients.values())
+        await self.__init_all(__targets)
+        if self.__health_check_interval and self.__health_task is None:
+            self.__health_task = asyncio.create_task(self.__health_loop(), name="mcp-pool-health")
+        return list(__targets)
+
+    async def get(self, *names: str) -> List[MCPClient]:
+        """
+        按名称获取已连接的客户端，尚未启动的会并发启动
+
+        Args:
+            names: 客户端名称，为空时返回全部
+
+        Returns:
+            客户端列表，可直接传给 Agent(..., close_clients=False)
+        """
+        __clients = [self.__clients[__name] for __name in names] if names else list(self.__clients.values())
+        await self.__init_all(__clients)
+        return __clients
+
+    async def check_health(self) -> Dict[str, bool]:
+        """
+        并发 ping 所有已启动的客户端，无响应的重连（有调用在途时需连续失败 max_ping_failures 次）
+
+        Returns:
+            名称 -> 检查前是否健康
+        """
+        __clients = [self.__clients[__name] for __name in self.__started]
+        __healthy = await asyncio.gather(*(__client.ping(self.__ping_timeout) for __client in __clients))
+        for __client, __ok in zip(__clients, __healthy):
+            if __ok:
+                self.__ping_failures.pop(__client.name, None)
+                continue
+            __failures = self.__ping_failures.get(__client.name, 0) + 1
+            self.__ping_failures[__client.name] = __failures
+            if __client.is_alive and __client.in_flight and __failures < self.__max_ping_failures:
+                warning(
+                    "MCP server '%s' missed ping with %d call(s) in flight (%d/%d), not reconnecting yet",
+                    __client.name, __client.in_flight, __failures, self.__max_ping_failures,
+                )
+                continue
+            warning("MCP server '%s' failed health check, reconnecting...", __client.name)
+            self.__ping_failures.pop(__client.name, None)
+            try:
+                await __client.reconnect()
+            except Exception as e:
+                warning("Failed to reconnect MCP client %s: %s", __client.name, e)
+        return {__client.name: __ok for __client, __ok in zip(__clients, __healthy)}
+
+    async def close(self) -> None:
+        """停止健康检查并关闭所有服务器"""
+        log_title("CLOSE MCP POOL")
+        if self.__health_task is not None:
+            self.__health_task.cancel()
+            try:
+                await self.__health_task
+            except asyncio.CancelledError:
+                pass
+            self.__health_task = None
+        await asyncio.gather(*(__client.close() for __client in self.__clients.values()))
+        self.__started.clear()
+        self.__ping_failures.clear()
+
+    async def __init_all(self, clients: List[MCPClient]) -> None:
+        """并发启动客户端（已连接的直接返回）"""
+        await asyncio.gather(*(__client.init() for __client in clients))
+        self.__started.update(__client.name for __client in clients)
+
+    async def __health_loop(self) -> None:
+        """后台健康检查循环"""
+        while True:
+            await asyncio.sleep(self.__health_check_interval)
+            try:
+                await self.check_health()
+            except Exception as e:
+                warning("MCP pool health check failed: %s", e)
+
+
+async def example():
+    import time
+
+    pool = MCPClientPool(health_check_interval=10)
+    servers = [MCPClient(f'fetch-{i}', 'uvx', ['mcp-server-fetch']) for i in range(3)]
+
+    start = time.perf_counter()
+    await pool.start(servers)
+    print(f"冷启动耗时: {time.perf_counter() - start:.2f}s")
+
+    start = time.perf_counter()
+    clients = await pool.get()
+    print(f"热启动耗时: {(time.perf_counter() - start) * 1000:.3f}ms", [client.name for client in clients])
+
+    print("健康检查:", await pool.check_health())
+    await pool.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(example())
@@ -0,0 +1,383 @@
+import copy
+import time
+from typing import Dict, List, Optional
+
+import numpy as np
+
+
+class ScalarQuantizer:
+    """int8 标量量化
+
+    每个维度按训练样本的最大绝对值缩放到 [-127, 127]，每维 1 字节（float32 的 1/4）。
+    打分时把查询乘以缩放系数后直接与 int8 码做内积。
+    """
+
+    kind = "int8"
+
+    def __init__(self, train_size: int = 1024, block_size: int = 65536):
+        """
+        初始化标量量化器
+
+        Args:
+            train_size: 累积多少向量后训练缩放系数
+            block_size: 打分时每块转换为 float32 的行数，限制临时内存
+        """
+        self.train_size = train_size
+        self.__block_size = block_size
+        self.__scale: Optional[np.ndarray] = None
+
+    @property
+    def is_trained(self) -> bool:
+        """是否已经训练"""
+        return self.__scale is not None
+
+    def code_size(self, dim: int) -> int:
+        """每个向量的编码字节数"""
+        return dim
+
+    @property
+    def code_dtype(self) -> np.dtype:
+        """编码的数据类型"""
+        return np.dtype(np.int8)
+
+    def train(self, vectors: np.ndarray) -> None:
+        """
+        按维度统计最大绝对值作为缩放系数
+
+        Args:
+            vectors: 归一化向量 (N, dim)
+        """
+        __max_abs = np.abs(vectors).max(axis=0)
+        __max_abs[__max_abs == 0] = 1.0
+        self.__scale = (__max_abs / 127.0).astype(np.float32)
+
+    def encode(self, vectors: np.ndarray) -> np.ndarray:
+        """
+        编码为 int8
+
+        Args:
+            vectors: 归一化向量 (n, dim)
+
+        Returns:
+            int8 编码 (n, dim)
+        """
+        return np.clip(np.rint(vectors / self.__scale), -127, 127).astype(np.int8)
+
+    def decode(self, codes: np.ndarray) -> np.ndarray:
+        """
+        解码为近似的 float32 向量
+
+        Args:
+            codes: int8 编码 (n, dim)
+
+        Returns:
+            近似向量 (n, dim)
+        """
+        return codes.astype(np.float32) * self.__scale
+
+    def score(self, queries: np.ndarray, codes: np.ndarray) -> np.ndarray:
+        """
+        直接在压缩编码上计算近似内积
+
+        Args:
+            queries: 归一化查询 (m, dim)
+            codes: int8 编码 (n, dim)
+
+        Returns:
+            近似相似度 (m, n)
+        """
+        __scaled = (queries * self.__scale).astype(np.float32)
+        __scores = np.empty((queries.shape[0], codes.shape[0]), dtype=np.float32)
+        for __start in range(0, codes.shape[0], self.__block_size):
+            __block = codes[__start:__start + self.__block_size].astype(np.float32)
+            __scores[:, __start:__start + self.__block_size] = __scaled @ __block.T
+        return __scores
+
+    def export_state(self) -> Dict[str, np.ndarray]:
+        """导出量化参数"""
+        return {"scale": self.__scale}
+
+    def load_state(self, state: Dict[str, np.ndarray]) -> None:
+        """恢复量化参数"""
+        self.__scale = np.asarray(state["scale"], dtype=np.float32)
+
+
+class ProductQuantizer:
+    """乘积量化（PQ）
+
+    把向量切成 m 个子空间，每个子空间用 k-means 学出 256 个中心，
+    每个向量只保存 m 个 uint8 中心编号。打分时先为查询构造 (m, 256) 的内积查找表，
+    再按编码查表求和（非对称距离计算）。
+    """
+
+    kind = "pq"
+
+    def __init__(
+        self,
+        m: int = 16,
+        train_size: int = 8192,
+        kmeans_iters: int = 15,
+        block_size: int = 65536,
+        seed: int = 0,
+    ):
+        """
+        初始化乘积量化器
+
+        Args:
+            m: 子空间数量，向量维度必须能被 m 整除；每个向量编码为 m 字节
+            train_size: 累积多少向量后训练码本
+            kmeans_iters: 每个子空间 k-means 的迭代次数
+            block_size: 查表打分时每块的行数
+            seed: 随机种子
+        """
+        self.m = m
+        self.train_size = train_size
+        self.__kmeans_iters = kmeans_iters
+        self.__block_size = block_size
+        self.__rng = np.random.default_rng(seed)
+        self.__codebooks: Optional[np.ndarray] = None  # (m, ksub, dsub)
+
+    @property
+    def is_trained(self) -> bool:
+        """是否已经训练"""
+        return self.__codebooks is not None
+
+    def code_size(self, dim: int) -> int:
+        """每个向量的编码字节数"""
+        return self.m
+
+    @property
+    def code_dtype(self) -> np.dtype:
+        """编码的数据类型"""
+        return np.dtype(np.uint8)
+
+    def train(self, vectors: np.ndarray) -> None:
+        """
+        为每个子空间训练码本
+
+        Args:
+            vectors: 归一化向量 (N, dim)
+        """
+        __dim = vectors.shape[1]
+        if __dim % self.m != 0:
+            raise ValueError(f"Embedding dimension {__dim} is not divisible by PQ subspace count {self.m}")
+        __dsub = __dim // self.m
+        __ksub = min(256, vectors.shape[0])
+
+        __codebooks = np.empty((self.m, __ksub, __dsub), dtype=np.float32)
+        for __j in range(self.m):
+            __sub = np.ascontiguousarray(vectors[:, __j * __dsub:(__j + 1) * __dsub], dtype=np.float32)
+            __codebooks[__j] = self.__kmeans(__sub, __ksub)
+        self.__codebooks = __codebooks
+
+    def encode(self, vectors: np.ndarray) -> np.ndarray:
+        """
+        编码为每个子空间最近的中心编号
+
+        Args:
+            vectors: 归一化向量 (n, dim)
+
+        Returns:
+            uint8 编码 (n, m)
+        """
+        __dsub = self.__codebooks.shape[2]
+        __codes = np.empty((vectors.shape[0], self.m), dtype=np.uint8)
+        for __j in range(self.m):
+            __sub = vectors[:, __j * __dsub:(__j + 1) * __dsub]
+            __codes[:, __j] = self.__nearest(__sub, self.__codebooks[__j])
+        return __codes
+
+    def decode(self, codes: np.ndarray) -> np.ndarray:
+        """
+        用码本中心重建近似向量
+
+        Args:
+            codes: uint8 编码 (n, m)
+
+        Returns:
+            近似向量 (n, dim)
+        """
+        return np.concatenate([self.__codebooks[__j][codes[:, __j]] for __j in range(self.m)], axis=1)
+
+    def score(self, queries: np.ndarray, codes: np.ndarray) -> np.ndarray:
+        """
+        查表计算近似内积
+
+        Args:
+            queries: 归一化查询 (m_q, dim)
+            codes: uint8 编码 (n, m)
+
+        Returns:
+            近似相似度 (m_q, n)
+
+        查询较少时按子空间查表累加，每个编码只做 m 次查表；
+        查询较多时（至少 4 * dsub 个）先分块重建近似向量再做一次矩阵乘，
+        重建的开销被所有查询分摊，两种方式结果相同
+        """
+        __dsub = self.__codebooks.shape[2]
+        __queries = np.asarray(queries, dtype=np.float32)
+        __scores = np.empty((__queries.shape[0], codes.shape[0]), dtype=np.float32)
+        if __queries.shape[0] >= 4 * __dsub:
+            for __start in range(0, codes.shape[0], self.__block_size):
+                __block = self.decode(codes[__start:__start + self.__block_size])
+                __scores[:, __start:__start + self.__block_size] = __queries @ __block.T
+            return __scores
+
+        # (m_q, m, ksub) 查找表：每个查询在每个子空间中与各中心的内积
+        __lut = np.einsum('qjd,jkd->qjk', __queries.reshape(-1, self.m, __dsub), self.__codebooks)
+        for __start in range(0, codes.shape[0], self.__block_size):
+            __block = codes[__start:__start + self.__block_size]
+            __out = __scores[:, __start:__start + self.__block_size]
+            np.take(__lut[:, 0, :], __block[:, 0], axis=1, out=__out)
+            for __j in range(1, self.m):
+                __out += np.take(__lut[:, __j, :], __block[:, __j], axis=1)
+        return __scores
+
+    def export_state(self) -> Dict[str, np.ndarray]:
+        """导出码本"""
+        return {"codebooks": self.__codebooks}
+
+    def load_state(self, state: Dict[str, np.ndarray]) -> None:
+        """恢复码本"""
+        self.__codebooks = np.asarray(state["codebooks"], dtype=np.float32)
+        self.m = self.__codebooks.shape[0]
+
+    def __kmeans(self, vectors: np.ndarray, k: int) -> np.ndarray:
+        """
+        欧氏距离 k-means
+
+        Args:
+            vectors: 子空间向量 (N, dsub)
+            k: 中心数量
+
+        Returns:
+            中心 (k, dsub)
+        """
+        __centroids = vectors[self.__rng.choice(vectors.shape[0], k, replace=False)].copy()
+        for _ in range(self.__kmeans_iters):
+            __assign = self.__nearest(vectors, __centroids)
+            __sums = np.zeros_like(__centroids)
+            np.add.at(__sums, __assign, vectors)
+            __sizes = np.bincount(__assign, minlength=k)
+
+            __empty = __sizes == 0
+            __centroids[~__empty] = __sums[~__empty] / __sizes[~__empty, np.newaxis]
+            if __empty.any():
+                __centroids[__empty] = vectors[self.__rng.choice(vectors.shape[0], int(__empty.sum()))]
+        return __centroids
+
+    def __nearest(self, vectors: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+        """
+        分块求最近中心：argmin ||x-c||² 等价于 argmax (2x·c - ||c||²)
+
+        Args:
+            vectors: (N, dsub)
+            centroids: (k, dsub)
+
+        Returns:
+            最近中心编号
+        """
+        __half_norms = 0.5 * np.einsum('kd,kd->k', centroids, centroids)
+        __result = np.empty(vectors.shape[0], dtype=np.int64)
+        for __start in range(0, vectors.shape[0], self.__block_size):
+            __block = vectors[__start:__start + self.__block_size]
+            __result[__start:__start + self.__block_size] = np.argmax(__block @ centroids.T - __half_norms, axis=1)
+        return __result
+
+
+QUANTIZERS = {
+    ScalarQuantizer.kind: ScalarQuantizer,
+    ProductQuantizer.kind: ProductQuantizer,
+}
+
+
+def quantization_report(
+    embeddings: np.ndarray,
+    query_embeddings: np.ndarray,
+    top_k: int = 10,
+    configs: Optional[Dict[str, dict]] = None,
+) -> List[Dict[str, float]]:
+    """
+    对比量化存储与 float32 存储的内存占用、召回率和延迟
+
+    Args:
+        embeddings: 语料向量 (N, dim)
+        query_embeddings: 查询向量 (m, dim)
+        top_k: 计算 recall@top_k
+        configs: 名称 -> VectorStore 构造参数，默认评估 int8 / pq 以及各自的重排序版本
+
+    Returns:
+        每一行包含 name、trained、bytes、rescore_bytes、compression、recall、latency_ms；
+        bytes 是编码加上重排序保留的 float32 向量（rescore_bytes）的总占用，
+        语料仍不足以训练的量化器 trained 为 False，compression 和 recall 为 nan
+    """
+    from VectorStore import VectorStore
+
+    if configs is None:
+        # pq 每个子空间 4 维（相对 float32 压缩 16 倍），pq8 每个子空间 2 维（压缩 8 倍）
+        __pq_m = max(1, embeddings.shape[1] // 4) if embeddings.shape[1] % 4 == 0 else 1
+        __pq8_m = max(1, embeddings.shape[1] // 2) if embeddings.shape[1] % 2 == 0 else 1
+        configs = {
+            "float32": {},
+            "int8": {"quantizer": ScalarQuantizer()},
+            "int8+rescore": {"quantizer": ScalarQuantizer(), "rescore_factor": 4},
+            "pq": {"quantizer": ProductQuantizer(m=__pq_m)},
+            "pq8": {"quantizer": ProductQuantizer(m=__pq8_m)},
+            "pq+rescore": {"quantizer": ProductQuantizer(m=__pq_m), "rescore_factor": 16},
+        }
+
+    __baseline = VectorStore()
+    __baseline.add_items([{'embedding': __v, 'document': ''} for __v in embeddings])
+    __exact = __baseline.search_indices(query_embeddings, top_k)
+    __float_bytes = embeddings.shape[0] * embeddings.shape[1] * 4
+
+    __report = []
+    for __name, __kwargs in configs.items():
+        __quantizer = __kwargs.get("quantizer")
+        if __quantizer is not None:
+            # 在副本上调整：语料比默认训练量小时用全部语料训练，否则量化器永远不会生效，
+            # 调用方传入的量化器保持不变
+            __quantizer = copy.deepcopy(__quantizer)
+            __quantizer.train_size = min(__quantizer.train_size, embeddings.shape[0])
+            __kwargs = {**__kwargs, "quantizer": __quantizer}
+        __store = VectorStore(**__kwargs)
+        __store.add_items([{'embedding': __v, 'document': ''} for __v in embeddings])
+        __trained = __quantizer is None or __quantizer.is_trained
+        __rescore_bytes = __float_bytes if __quantizer is not None and __kwargs.get("rescore_factor", 0) > 0 else 0
+
+        __start = time.perf_counter()
+        __approx = __store.search_indices(query_embeddings, top_k)
+        __latency_ms = (time.perf_counter() - __start) * 1000 / len(query_embeddings)
+
+        __hits = sum(len(np.intersect1d(__a, __e)) for __a, __e in zip(__approx, __exact))
+        __total = sum(len(__e) for __e in __exact)
+        __report.append({
+            "name": __name,
+            "trained": __trained,
+            "bytes": __store.vector_nbytes,
+            "rescore_bytes": __rescore_bytes if __trained else 0,
+            "compression": __float_bytes / max(__store.vector_nbytes, 1) if __trained else float("nan"),
+            "recall": (__hits / __total if __total else 1.0) if __trained else float("nan"),
+            "latency_ms": __latency_ms,
+        })
+    return __report
+
+
+def example():
+    rng = np.random.default_rng(0)
+    dim, count = 128, 20000
+    centers = rng.normal(size=(100, dim))
+    data = (centers[rng.integers(0, 100, count)] + 0.5 * rng.normal(size=(count, dim))).astype(np.float32)
+    queries = data[rng.choice(count, 100, replace=False)] + 0.1 * rng.normal(size=(100, dim))
+
+    print(f"float32 基线: {count * dim * 4} bytes")
+    print(f"{'name':>14}  {'bytes':>10}  {'rescore':>10}  {'压缩比':>6}  recall@10  latency(ms)")
+    for row in quantization_report(data, queries, top_k=10):
+        print(
+            f"{row['name']:>14}  {row['bytes']:>10}  {row['rescore_bytes']:>10}  {row['compression']:>8.1f}x  "
+            f"{row['recall']:>9.3f}  {row['latency_ms']:>11.3f}" + ("" if row['trained'] else "  (untrained)")
+        )
+
+
+if __name__ == "__main__":
+    example()
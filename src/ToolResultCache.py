@@ -0,0 +1,248 @@
+import asyncio
+import json
+import time
+from collections import OrderedDict
+from pathlib import PurePosixPath
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+from Tracer import tracer
+
+# 文件系统服务器的写工具 -> 参数中被修改的路径
+DEFAULT_INVALIDATIONS: Dict[str, Sequence[str]] = {
+    "write_file": ("path",),
+    "edit_file": ("path",),
+    "create_directory": ("path",),
+    "move_file": ("source", "destination"),
+}
+
+# (服务器名, 工具名, 规范化参数 JSON)
+CacheKey = Tuple[str, str, str]
+
+
+class ToolResultCache:
+    """幂等 MCP 工具的结果缓存
+
+    只缓存 ttls 中列出的只读工具，键为 (服务器, 工具, 规范化 JSON 参数)，按 TTL 过期、按条目数 LRU 淘汰；
+    相同参数的并发调用合并为一次请求（发起请求的调用被取消时由等待者接手）。调用 invalidations 中的写工具后，
+    同一服务器上参数涉及被写路径、其上级目录或其下级路径的缓存项（如 read_file、list_directory）立即失效。
+    isError 的结果不缓存。
+    """
+
+    def __init__(
+        self,
+        ttls: Dict[str, float],
+        max_items: int = 256,
+        invalidations: Optional[Dict[str, Sequence[str]]] = None,
+    ):
+        """
+        初始化工具结果缓存
+
+        Args:
+            ttls: 工具名 -> 缓存有效期（秒），未列出的工具不缓存
+            max_items: 最多缓存的结果数量
+            invalidations: 写工具名 -> 参数中被修改路径的参数名，为 None 时使用文件系统服务器的默认配置
+        """
+        self.__ttls = dict(ttls)
+        self.__max_items = max_items
+        self.__invalidations = dict(DEFAULT_INVALIDATIONS if invalidations is None else invalidations)
+        self.__entries: "OrderedDict[CacheKey, Tuple[float, Any]]" = OrderedDict()
+        # (服务器名, 参数中的字符串值) -> 缓存键，用于按路径失效
+        self.__by_value: Dict[Tuple[str, str], Set[CacheKey]] = {}
+        self.__inflight: Dict[CacheKey, asyncio.Future] = {}
+
+        self.hits = 0
+        self.misses = 0
+        self.invalidated = 0
+
+    @staticmethod
+    def key(server: str, tool: str, args: Dict[str, Any]) -> CacheKey:
+        """规范化的缓存键：参数按键排序后序列化，与字段顺序和空白无关"""
+        return (server, tool, json.dumps(args, sort_keys=True, ensure_ascii=False, separators=(',', ':')))
+
+    def is_idempotent(self, tool: str) -> bool:
+        """工具是否登记为可缓存的只读工具（重复调用没有副作用，连接断开后可以安全重试）"""
+        return tool in self.__ttls
+
+    @property
+    def stats(self) -> Dict[str, int]:
+        """命中/未命中/失效计数和缓存条目数"""
+        return {"hits": self.hits, "misses": self.misses, "invalidated": self.invalidated, "items": len(self.__entries)}
+
+    async def call(self, server: str, tool: str, args: Dict[str, Any], fetch: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        经过缓存执行一次工具调用
+
+        Args:
+            server: MCP 服务器名称
+            tool: 工具名称
+            args: 工具参数
+            fetch: 实际调用工具的协程函数，返回 CallToolResult
+
+        Returns:
+            工具执行结果
+        """
+        if tool in self.__invalidations:
+            try:
+                return await fetch()
+            finally:
+                # 写操作无论成功与否都可能改变了文件，调用结束后失效相关缓存
+                self.invalidate_paths(server, self.__values(args, self.__invalidations[tool]))
+
+        __ttl = self.__ttls.get(tool)
+        if __ttl is None:
+            return await fetch()
+
+        __key = self.key(server, tool, args)
+        __entry = self.__entries.get(__key)
+        if __entry is not None:
+            if __entry[0] > time.monotonic():
+                self.__entries.move_to_end(__key)
+                self.hits += 1
+                tracer.count("tool_cache.hits", 1, server=server, tool=tool)
+                return __entry[1]
+            self.__remove(__key)
+
+        __pending = self.__inflight.get(__key)
+        while __pending is not None:
+            try:
+                __result = await asyncio.shield(__pending)
+            except asyncio.CancelledError:
+                # 发起请求的调用被取消时由等待者接手重新请求；等待者自身被取消时照常抛出
+                if not __pending.cancelled() or asyncio.current_task().cancelling():
+                    raise
+                __pending = self.__inflight.get(__key)
+                continue
+            self.hits += 1
+            tracer.count("tool_cache.hits", 1, server=server, tool=tool)
+            return __result
+
+        self.misses += 1
+        tracer.count("tool_cache.misses", 1, server=server, tool=tool)
+        __future = asyncio.get_running_loop().create_future()
+        self.__inflight[__key] = __future
+        try:
+            __result = await fetch()
+        except asyncio.CancelledError:
+            __future.cancel()
+            raise
+        except Exception as e:
+            __future.set_exception(e)
+            # 没有其他等待者时避免 "exception was never retrieved" 警告
+            __future.exception()
+            raise
+        else:
+            __future.set_result(__result)
+            if not getattr(__result, "isError", False):
+                self.__put(__key, time.monotonic() + __ttl, __result, args)
+            return __result
+        finally:
+            del self.__inflight[__key]
+
+    def invalidate_paths(self, server: str, paths: Iterable[str]) -> int:
+        """
+        失效同一服务器上参数涉及这些路径、其上级目录或其下级路径的缓存项
+        （move_file 移动目录后，目录中文件的 read_file 结果同样过期）
+
+        Args:
+            server: MCP 服务器名称
+            paths: 被修改的路径
+
+        Returns:
+            失效的条目数
+        """
+        __keys: Set[CacheKey] = set()
+        __prefixes = []
+        for __path in paths:
+            __pure = PurePosixPath(__path)
+            for __candidate in (__pure, *__pure.parents):
+                __keys |= self.__by_value.get((server, str(__candidate)), set())
+            __prefixes.append(str(__pure).rstrip('/') + '/')
+        if __prefixes:
+            for (__server, __value), __value_keys in self.__by_value.items():
+                if __server == server and __value.startswith(tuple(__prefixes)):
+                    __keys |= __value_keys
+        for __key in __keys:
+            self.__remove(__key)
+        self.invalidated += len(__keys)
+        return len(__keys)
+
+    def invalidate(self, server: Optional[str] = None, tool: Optional[str] = None) -> int:
+        """
+        手动失效缓存项
+
+        Args:
+            server: 只失效该服务器的缓存，为 None 时不限
+            tool: 只失效该工具的缓存，为 None 时不限
+
+        Returns:
+            失效的条目数
+        """
+        __keys = [
+            __key for __key in self.__entries
+            if (server is None or __key[0] == server) and (tool is None or __key[1] == tool)
+        ]
+        for __key in __keys:
+            self.__remove(__key)
+        self.invalidated += len(__keys)
+        return len(__keys)
+
+    def __put(self, key: CacheKey, expires: float, result: Any, args: Dict[str, Any]) -> None:
+        """写入缓存，登记参数中的字符串值并淘汰最久未使用的项"""
+        self.__remove(key)
+        self.__entries[key] = (expires, result)
+        for __value in self.__values(args):
+            self.__by_value.setdefault((key[0], __value), set()).add(key)
+        while len(self.__entries) > self.__max_items:
+            self.__remove(next(iter(self.__entries)))
+
+    def __remove(self, key: CacheKey) -> None:
+        """删除缓存项及其路径索引"""
+        if self.__entries.pop(key, None) is None:
+            return
+        for __value in self.__values(json.loads(key[2])):
+            __keys = self.__by_value.get((key[0], __value))
+            if __keys is not None:
+                __keys.discard(key)
+                if not __keys:
+                    del self.__by_value[(key[0], __value)]
+
+    @staticmethod
+    def __values(args: Dict[str, Any], names: Optional[Sequence[str]] = None) -> List[str]:
+        """参数中的字符串值（含字符串列表），names 不为 None 时只取这些参数"""
+        __values: List[str] = []
+        for __name, __value in args.items():
+            if names is not None and __name not in names:
+                continue
+            for __item in (__value if isinstance(__value, list) else [__value]):
+                if isinstance(__item, str):
+                    __values.append(__item)
+        return __values
+
+
+async def example():
+    from types import SimpleNamespace
+
+    cache = ToolResultCache({"read_file": 60, "list_directory": 60})
+    calls = []
+
+    def server(tool, args):
+        async def fetch():
+            calls.append(tool)
+            await asyncio.sleep(0.01)
+            return SimpleNamespace(isError=False, content=f"{tool} {args}")
+        return fetch
+
+    args = {"path": "/data/notes/a.md"}
+    # 并发的相同调用只请求一次
+    await asyncio.gather(*(cache.call("file", "read_file", args, server("read_file", args)) for _ in range(3)))
+    await cache.call("file", "list_directory", {"path": "/data/notes"}, server("list_directory", {}))
+    print("首次调用后:", calls, cache.stats)
+
+    # 写文件使该文件和上级目录的缓存失效
+    await cache.call("file", "write_file", {"path": "/data/notes/a.md", "content": "new"}, server("write_file", args))
+    await cache.call("file", "read_file", args, server("read_file", args))
+    print("写入后:", calls, cache.stats)
+
+
+if __name__ == "__main__":
+    asyncio.run(example())
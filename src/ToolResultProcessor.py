@@ -0,0 +1,207 @@
+import base64
+import codecs
+import hashlib
+import json
+import mimetypes
+import tempfile
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Union
+
+from mcp import Tool
+
+# 让模型分页读取被转存结果的伪工具，由 Agent 在本地执行
+READ_ARTIFACT_TOOL = "read_artifact"
+
+
+class ToolResultProcessor:
+    """MCP 工具结果的处理阶段
+
+    把 MCP 返回的内容块（TextContent、ImageContent、EmbeddedResource 等）转换成结构化 JSON，
+    每次工具调用写回历史的文本不超过该工具的字符上限；超出的部分连同图片等二进制数据
+    转存到本地 artifact 目录，只把句柄交给模型，模型可以用 read_artifact 按字节偏移分页读取。
+    """
+
+    def __init__(
+        self,
+        artifact_dir: Optional[Union[str, Path]] = None,
+        max_chars: int = 4000,
+        limits: Optional[Dict[str, int]] = None,
+        page_bytes: int = 8192,
+    ):
+        """
+        初始化工具结果处理器
+
+        Args:
+            artifact_dir: 转存目录，为 None 时使用系统临时目录下的 mcp-artifacts
+            max_chars: 每次工具调用写回历史的默认字符上限
+            limits: 按工具名单独设置的字符上限
+            page_bytes: read_artifact 每页的最大字节数
+        """
+        self.__artifact_dir = Path(artifact_dir) if artifact_dir is not None else Path(tempfile.gettempdir()) / 'mcp-artifacts'
+        self.__max_chars = max_chars
+        self.__limits = dict(limits or {})
+        self.__page_bytes = page_bytes
+
+    @property
+    def tool(self) -> Tool:
+        """read_artifact 伪工具的定义，和 MCP 工具一起交给 LLM"""
+        return Tool(
+            name=READ_ARTIFACT_TOOL,
+            description=(
+                "Read a page of a tool result that was too large to return inline. "
+                "Pass the artifact handle and the next_offset from the previous result."
+            ),
+            inputSchema={
+                "type": "object",
+                "properties": {
+                    "artifact": {"type": "string", "description": "Artifact handle"},
+                    "offset": {"type": "integer", "description": "Byte offset to start reading from", "default": 0},
+                    "limit": {"type": "integer", "description": f"Maximum bytes to read (<= {self.__page_bytes})"},
+                },
+                "required": ["artifact"],
+            },
+        )
+
+    def limit_for(self, tool_name: str) -> int:
+        """工具的字符上限"""
+        return self.__limits.get(tool_name, self.__max_chars)
+
+    def process(self, tool_name: str, content: Sequence[Any], is_error: bool = False) -> str:
+        """
+        把 MCP 内容块转换为写回历史的 JSON 字符串
+
+        Args:
+            tool_name: 工具名称，用于查找字符上限
+            content: CallToolResult.content
+            is_error: CallToolResult.isError
+
+        Returns:
+            {"content": [...], "isError": bool} 的 JSON 字符串，文本总长度不超过上限
+        """
+        __budget = self.limit_for(tool_name)
+        __blocks: List[Dict[str, Any]] = []
+        for __item in content or []:
+            __block = __item.model_dump(by_alias=True, exclude_none=True) if hasattr(__item, "model_dump") else {"type": "text", "text": str(__item)}
+            __type = __block.get("type")
+            if __type == "text":
+                __text = __block.get("text", "")
+                __blocks.append(self.__text_block(__text, __budget))
+                __budget -= min(len(__text), __budget)
+            elif __type in ("image", "audio"):
+                __blocks.append(self.__binary_block(__type, __block.get("data", ""), __block.get("mimeType")))
+            elif __type == "resource":
+                __resource = __block.get("resource", {})
+                __meta = {__k: __v for __k, __v in __resource.items() if __k not in ("text", "blob")}
+                if "blob" in __resource:
+                    __blocks.append({**self.__binary_block("resource", __resource["blob"], __resource.get("mimeType")), **__meta})
+                else:
+                    __text = __resource.get("text", "")
+                    __blocks.append({**self.__text_block(__text, __budget), **__meta, "type": "resource"})
+                    __budget -= min(len(__text), __budget)
+            else:
+                # resource_link 等只有元数据的块原样保留
+                __blocks.append(__block)
+        return json.dumps({"content": __blocks, "isError": is_error}, ensure_ascii=False)
+
+    def read_artifact(self, artifact: str, offset: int = 0, limit: Optional[int] = None) -> str:
+        """
+        按字节偏移读取一页转存的文本，页边界落在完整的 UTF-8 字符上
+
+        Args:
+            artifact: process 返回的 artifact 句柄
+            offset: 起始字节偏移，必须为非负整数
+            limit: 读取的最大字节数，限制在 [4, page_bytes] 内（参数来自模型，不能绕过分页上限）
+
+        Returns:
+            {"artifact", "offset", "text", "next_offset", "total_bytes"} 的 JSON 字符串，读完时 next_offset 为 null
+        """
+        __path = self.__artifact_dir / Path(artifact).name
+        if not __path.is_file():
+            return json.dumps({"error": f"Unknown artifact: {artifact}"})
+        if isinstance(offset, bool) or not isinstance(offset, int) or offset < 0:
+            return json.dumps({"error": f"offset must be a non-negative integer, got {offset!r}"})
+        if limit is not None and (isinstance(limit, bool) or not isinstance(limit, int)):
+            return json.dumps({"error": f"limit must be an integer, got {limit!r}"})
+        # 至少读 4 字节（一个完整的 UTF-8 字符），保证每页都有进展
+        __limit = self.__page_bytes if limit is None else max(4, min(limit, self.__page_bytes))
+        __total = __path.stat().st_size
+        if not (mimetypes.guess_type(__path.name)[0] or "").startswith("text/"):
+            return json.dumps({"error": f"Artifact {artifact} is binary ({__total} bytes) and cannot be read as text"})
+
+        with open(__path, 'rb') as f:
+            f.seek(offset)
+            __data = f.read(__limit)
+        # 偏移落在多字节字符中间时跳过续字节；末尾不完整的字符留到下一页
+        __skip = 0
+        while __skip < len(__data) and __data[__skip] & 0xC0 == 0x80:
+            __skip += 1
+        __decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+        __text = __decoder.decode(__data[__skip:], final=offset + len(__data) >= __total)
+        __pending = len(__decoder.getstate()[0])
+        __next = offset + len(__data) - __pending
+        return json.dumps({
+            "artifact": artifact,
+            "offset": offset,
+            "text": __text,
+            "next_offset": __next if __next < __total else None,
+            "total_bytes": __total,
+        }, ensure_ascii=False)
+
+    def __text_block(self, text: str, budget: int) -> Dict[str, Any]:
+        """文本在剩余预算内原样返回，否则转存并只返回开头和句柄"""
+        if len(text) <= budget:
+            return {"type": "text", "text": text}
+        __data = text.encode('utf-8')
+        __preview = text[:max(budget, 0)]
+        return {
+            "type": "text",
+            "text": __preview,
+            "truncated": True,
+            "artifact": self.__store(__data, '.txt'),
+            "total_bytes": len(__data),
+            "next_offset": len(__preview.encode('utf-8')),
+            "hint": f"Call {READ_ARTIFACT_TOOL} with this artifact and next_offset to read more.",
+        }
+
+    def __binary_block(self, block_type: str, data: str, mime_type: Optional[str]) -> Dict[str, Any]:
+        """base64 二进制内容转存为文件，只返回类型、大小和句柄"""
+        __raw = base64.b64decode(data) if data else b''
+        __suffix = mimetypes.guess_extension(mime_type or '') or '.bin'
+        return {
+            "type": block_type,
+            "mimeType": mime_type,
+            "artifact": self.__store(__raw, __suffix),
+            "bytes": len(__raw),
+        }
+
+    def __store(self, data: bytes, suffix: str) -> str:
+        """按内容哈希写入 artifact 目录（相同内容只写一次），返回句柄"""
+        self.__artifact_dir.mkdir(parents=True, exist_ok=True)
+        __name = hashlib.sha256(data).hexdigest()[:24] + suffix
+        __path = self.__artifact_dir / __name
+        if not __path.exists():
+            __tmp = __path.with_suffix(__path.suffix + '.tmp')
+            __tmp.write_bytes(data)
+            __tmp.replace(__path)
+        return __name
+
+
+def example():
+    from mcp.types import ImageContent, TextContent
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        processor = ToolResultProcessor(tmp_dir, max_chars=200, limits={"fetch": 100}, page_bytes=256)
+        page = "<html>" + "新闻标题 headline " * 500 + "</html>"
+        output = processor.process("fetch", [
+            TextContent(type="text", text=page),
+            ImageContent(type="image", data=base64.b64encode(b'\x89PNG' + b'\0' * 64).decode(), mimeType="image/png"),
+        ])
+        print(f"原始结果: {len(page)} 字符, 写回历史: {len(output)} 字符")
+        print(output)
+
+        artifact = json.loads(output)["content"][0]
+        print(processor.read_artifact(artifact["artifact"], artifact["next_offset"]))
+
+
+if __name__ == "__main__":
+    example()
@@ -0,0 +1,290 @@
+import contextvars
+import itertools
+import json
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Union
+
+# 当前任务/协程中正在进行的 span，子 span 通过它找到父 span
+_current_span: contextvars.ContextVar[Optional["Span"]] = contextvars.ContextVar("current_span", default=None)
+
+
+class Span:
+    """一次计时区间：with 进入时开始，退出时结束并交给导出器"""
+
+    __slots__ = ("name", "trace_id", "span_id", "parent_id", "parent", "attributes", "error", "__tracer", "__start", "__wall", "__token")
+
+    def __init__(self, tracer: "Tracer", name: str, attributes: Dict[str, Any]):
+        self.name = name
+        self.attributes = attributes
+        self.error: Optional[str] = None
+        self.__tracer = tracer
+        self.parent: Optional[Span] = _current_span.get()
+        self.span_id = next(tracer.ids)
+        self.parent_id = self.parent.span_id if self.parent is not None else None
+        self.trace_id = self.parent.trace_id if self.parent is not None else self.span_id
+        self.__start = 0.0
+        self.__wall = 0.0
+        self.__token = None
+
+    def set(self, key: str, value: Any) -> None:
+        """设置属性"""
+        self.attributes[key] = value
+
+    def add(self, key: str, value: Union[int, float] = 1) -> None:
+        """累加数值属性"""
+        self.attributes[key] = self.attributes.get(key, 0) + value
+
+    def mark(self, key: str) -> None:
+        """把从 span 开始到现在的毫秒数记录为属性（例如首个 token 的时间）"""
+        self.attributes[key] = round((time.perf_counter() - self.__start) * 1000, 3)
+
+    def __enter__(self) -> "Span":
+        self.__token = _current_span.set(self)
+        self.__wall = time.time()
+        self.__start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        __duration = (time.perf_counter() - self.__start) * 1000
+        if exc_type is not None:
+            self.error = f"{exc_type.__name__}: {exc}"
+        try:
+            _current_span.reset(self.__token)
+        except ValueError:
+            # 异步生成器跨上下文结束时 token 不属于当前上下文，改为恢复父 span，后续 span 仍挂在正确的父节点下
+            _current_span.set(self.parent)
+        self.__tracer.export({
+            "type": "span",
+            "name": self.name,
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "start": self.__wall,
+            "duration_ms": round(__duration, 3),
+            "attributes": self.attributes,
+            "error": self.error,
+        })
+
+
+class _NoopSpan:
+    """关闭追踪时返回的共享空 span，所有操作都不做任何事"""
+
+    __slots__ = ()
+
+    def set(self, key: str, value: Any) -> None:
+        pass
+
+    def add(self, key: str, value: Union[int, float] = 1) -> None:
+        pass
+
+    def mark(self, key: str) -> None:
+        pass
+
+    def __enter__(self) -> "_NoopSpan":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        pass
+
+
+NOOP_SPAN = _NoopSpan()
+
+
+class InMemoryCollector:
+    """进程内收集器：保存最近的 span 并累计计数器，便于测试和在程序结束时汇总"""
+
+    def __init__(self, max_spans: int = 10000):
+        """
+        初始化收集器
+
+        Args:
+            max_spans: 最多保留的 span 数量，超过后丢弃最早的
+        """
+        self.__max_spans = max_spans
+        self.spans: List[Dict[str, Any]] = []
+        self.counters: Dict[str, float] = {}
+
+    def export(self, record: Dict[str, Any]) -> None:
+        """接收一条 span 或计数器记录"""
+        if record["type"] == "counter":
+            self.counters[record["name"]] = self.counters.get(record["name"], 0) + record["value"]
+            return
+        self.spans.append(record)
+        if len(self.spans) > self.__max_spans:
+            del self.spans[:len(self.spans) - self.__max_spans]
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        """
+        按 span 名称汇总耗时
+
+        Returns:
+            名称 -> {count, total_ms, max_ms}
+        """
+        __summary: Dict[str, Dict[str, float]] = {}
+        for __span in self.spans:
+            __item = __summary.setdefault(__span["name"], {"count": 0, "total_ms": 0.0, "max_ms": 0.0})
+            __item["count"] += 1
+            __item["total_ms"] += __span["duration_ms"]
+            __item["max_ms"] = max(__item["max_ms"], __span["duration_ms"])
+        return __summary
+
+    def close(self) -> None:
+        pass
+
+
+class JsonlExporter:
+    """JSON Lines 导出器：记录先写入内存缓冲，达到 buffer_size 条或 close 时追加到文件"""
+
+    def __init__(self, path: Union[str, Path], buffer_size: int = 256):
+        """
+        初始化导出器
+
+        Args:
+            path: 输出文件路径（追加写入）
+            buffer_size: 缓冲多少条记录后写一次文件
+        """
+        self.__path = Path(path)
+        self.__path.parent.mkdir(parents=True, exist_ok=True)
+        self.__buffer_size = buffer_size
+        self.__buffer: List[str] = []
+        self.__lock = threading.Lock()
+
+    def export(self, record: Dict[str, Any]) -> None:
+        """缓冲一条记录"""
+        __line = json.dumps(record, ensure_ascii=False, default=str)
+        with self.__lock:
+            self.__buffer.append(__line)
+            if len(self.__buffer) >= self.__buffer_size:
+                self.__flush_locked()
+
+    def flush(self) -> None:
+        """把缓冲写入文件"""
+        with self.__lock:
+            self.__flush_locked()
+
+    def close(self) -> None:
+        self.flush()
+
+    def __flush_locked(self) -> None:
+        if not self.__buffer:
+            return
+        with open(self.__path, 'a', encoding='utf-8') as f:
+            f.write('\n'.join(self.__buffer) + '\n')
+        self.__buffer.clear()
+
+
+class Tracer:
+    """轻量的 span / 计数器 API
+
+    没有导出器时 span() 返回共享的空 span、count() 直接返回，调用方无需判断是否开启。
+    span 的父子关系通过 contextvars 在协程和任务之间传递，create_task 创建的子任务会继承当前 span。
+    """
+
+    def __init__(self):
+        self.__exporter = None
+        self.ids = itertools.count(1)
+
+    @property
+    def enabled(self) -> bool:
+        """是否有导出器"""
+        return self.__exporter is not None
+
+    def enable(self, exporter) -> None:
+        """
+        开启追踪
+
+        Args:
+            exporter: 带 export(record) 和 close() 方法的导出器（InMemoryCollector、JsonlExporter）
+        """
+        self.__exporter = exporter
+
+    def disable(self) -> None:
+        """关闭追踪并关闭导出器（刷新缓冲）"""
+        __exporter, self.__exporter = self.__exporter, None
+        if __exporter is not None:
+            __exporter.close()
+
+    def span(self, name: str, **attributes: Any) -> Union[Span, _NoopSpan]:
+        """
+        创建一个 span，用 with 包住要计时的代码
+
+        Args:
+            name: span 名称，例如 "llm.chat"、"tool.call"
+            attributes: 初始属性
+
+        Returns:
+            Span；未开启时为共享的空 span
+        """
+        if self.__exporter is None:
+            return NOOP_SPAN
+        return Span(self, name, attributes)
+
+    def count(self, name: str, value: Union[int, float] = 1, **attributes: Any) -> None:
+        """
+        累加计数器（token 数、缓存命中、字节数等）
+
+        Args:
+            name: 计数器名称
+            value: 增量
+            attributes: 附加属性
+        """
+        if self.__exporter is None:
+            return
+        __span = _current_span.get()
+        self.__exporter.export({
+            "type": "counter",
+            "name": name,
+            "value": value,
+            "time": time.time(),
+            "trace_id": __span.trace_id if __span is not None else None,
+            "attributes": attributes,
+        })
+
+    def export(self, record: Dict[str, Any]) -> None:
+        """把记录交给导出器（Span 结束时调用）"""
+        __exporter = self.__exporter
+        if __exporter is not None:
+            __exporter.export(record)
+
+
+# 进程内共享的追踪器，默认关闭；设置 TRACE_FILE 环境变量时导出到该 JSONL 文件
+tracer = Tracer()
+if os.getenv("TRACE_FILE"):
+    tracer.enable(JsonlExporter(os.environ["TRACE_FILE"]))
+
+
+def example():
+    import asyncio
+
+    collector = InMemoryCollector()
+    tracer.enable(collector)
+
+    async def handle(i: int):
+        with tracer.span("tool.call", tool="fetch") as span:
+            await asyncio.sleep(0.01 * i)
+            span.set("bytes", 1024 * i)
+            tracer.count("tool.bytes", 1024 * i)
+
+    async def run():
+        with tracer.span("agent.invoke"):
+            await asyncio.gather(*(handle(i) for i in range(1, 4)))
+
+    asyncio.run(run())
+    tracer.disable()
+    for span in collector.spans:
+        print(span["name"], span["parent_id"], span["duration_ms"], span["attributes"])
+    print("汇总:", collector.summary())
+    print("计数器:", collector.counters)
+
+    start = time.perf_counter()
+    for _ in range(100000):
+        with tracer.span("noop"):
+            pass
+    print(f"关闭时每个 span 的开销: {(time.perf_counter() - start) * 10:.3f} µs")
+
+
+if __name__ == "__main__":
+    example()
@@ -1,124 +1,967 @@
 import asyncio
-import math
-from typing import List, TypedDict
+import json
+import os
+from array import array
+from pathlib import Path
+from typing import Any, Dict, List, NotRequired, Optional, Tuple, TypedDict, Union
+
+import numpy as np
+
+from BM25Index import BM25Index
+from IVFIndex import IVFIndex
+from Quantizer import QUANTIZERS, ProductQuantizer, ScalarQuantizer
 
 
 class VectorStoreItem(TypedDict):
     """向量存储项类型定义"""
     embedding: List[float]
     document: str
+    metadata: NotRequired[Dict[str, Any]]
 
 
 class VectorStore:
-    """向量存储类"""
-    
-    def __init__(self):
-        """初始化向量存储"""
-        self.vector_store: List[VectorStoreItem] = []
+    """向量存储类
+
+    所有向量保存在一块预分配、可按倍数扩容的 float32 矩阵中，
+    同时缓存归一化后的行，检索时只需一次矩阵-向量乘法。
+    可选挂载 IVFIndex，数据量达到训练阈值后改为近似检索。
+    可选挂载量化器（int8 / PQ），训练后只保留压缩编码并直接在编码上打分。
+    每项可携带 metadata，按字段维护 值 -> 行号 的倒排列表，过滤在打分之前完成。
+    可选挂载 BM25Index，随 add_items 同步索引文档文本，供关键词检索。
+    delete 只打删除标记，检索时屏蔽；save 时压缩掉已删除的行。
+    save/load 使用 .npy + 文档偏移文件的磁盘格式，load 默认通过 np.memmap 零拷贝打开。
+    """
+
+    FORMAT_VERSION = 1
+
+    def __init__(
+        self,
+        initial_capacity: int = 1024,
+        index: Optional[IVFIndex] = None,
+        quantizer: Optional[Union[ScalarQuantizer, ProductQuantizer]] = None,
+        rescore_factor: int = 0,
+        lexical_index: Optional[BM25Index] = None,
+    ):
+        """
+        初始化向量存储
+
+        Args:
+            initial_capacity: 矩阵初始预分配的行数
+            index: 可选的近似最近邻索引，随 add_item 增量构建
+            quantizer: 可选的量化器，累积到 train_size 后训练，之后只保存压缩编码
+            rescore_factor: 大于0时额外保留 float32 归一化向量，
+                先用编码选出 top_k * rescore_factor 个候选，再用原始向量精确重排序
+            lexical_index: 可选的 BM25 索引，与向量使用相同的行号
+        """
+        self.__index = index
+        self.__lexical_index = lexical_index
+        self.__quantizer = quantizer
+        self.__rescore_factor = rescore_factor
+        self.__initial_capacity = max(1, initial_capacity)
+        self.__dim: Optional[int] = None
+        self.__count = 0
+        self.__matrix: Optional[np.ndarray] = None      # 原始向量 (capacity, dim)，量化模式下不保存
+        self.__normalized: Optional[np.ndarray] = None  # 归一化后的向量 (capacity, dim)
+        self.__codes: Optional[np.ndarray] = None       # 量化编码 (capacity, code_size)
+        self.__documents: List[str] = []
+        self.__metadata: List[Dict[str, Any]] = []
+        # 元数据倒排索引：字段 -> 值 -> 升序行号
+        self.__filters: Dict[str, Dict[Any, array]] = {}
+        # 删除标记，长度可能小于 count（之后新增的行视为未删除）
+        self.__deleted: Optional[np.ndarray] = None
+        self.__deleted_count = 0
+
+        # load 打开的只读文档区：utf-8 拼接字节 + 偏移，行号 < base_count 的文档和元数据从这里解码
+        self.__base_count = 0
+        self.__base_blob: Optional[np.ndarray] = None
+        self.__base_offsets: Optional[np.ndarray] = None
+        self.__base_meta_blob: Optional[np.ndarray] = None
+        self.__base_meta_offsets: Optional[np.ndarray] = None
 
     def add_item(self, item: VectorStoreItem) -> None:
         """
         添加向量项到存储
-        
+
         Args:
-            item: 包含嵌入向量和文档的字典
+            item: 包含嵌入向量、文档和可选元数据的字典
         """
-        self.vector_store.append(item)
-    
-    async def search(self, query_embedding: List[float], top_k: int = 3) -> List[str]:
+        self.add_items([item])
+
+    def add_items(self, items: List[VectorStoreItem]) -> None:
+        """
+        批量添加向量项，只扩容一次并整体归一化
+
+        Args:
+            items: 包含嵌入向量、文档和可选元数据的字典列表
+        """
+        if not items:
+            return
+        __vectors = np.asarray([__item['embedding'] for __item in items], dtype=np.float32)
+        if __vectors.ndim != 2:
+            raise ValueError("Embeddings must all have the same dimension")
+        if self.__dim is None:
+            self.__dim = __vectors.shape[1]
+        elif __vectors.shape[1] != self.__dim:
+            raise ValueError(f"Embedding dimension mismatch: expected {self.__dim}, got {__vectors.shape[1]}")
+
+        __normalized = self.__normalize(__vectors)
+        __start, __end = self.__count, self.__count + __vectors.shape[0]
+
+        if self.__quantizer is None:
+            self.__matrix = self.__grow(self.__matrix, __end, self.__dim, np.float32)
+            self.__matrix[__start:__end] = __vectors
+        if self.__keeps_normalized:
+            self.__normalized = self.__grow(self.__normalized, __end, self.__dim, np.float32)
+            self.__normalized[__start:__end] = __normalized
+        if self.__quantized:
+            self.__codes = self.__grow(
+                self.__codes, __end, self.__quantizer.code_size(self.__dim), self.__quantizer.code_dtype
+            )
+            self.__codes[__start:__end] = self.__quantizer.encode(__normalized)
+
+        self.__documents.extend(__item['document'] for __item in items)
+        for __row, __item in enumerate(items, __start):
+            __metadata = __item.get('metadata') or {}
+            self.__metadata.append(__metadata)
+            self.__index_metadata(__row, __metadata)
+        self.__count = __end
+        if self.__lexical_index is not None:
+            self.__lexical_index.add(__start, [__item['document'] for __item in items])
+        self.__train_quantizer()
+        self.__update_index(__start, __normalized)
+
+    async def search(
+        self,
+        query_embedding: List[float],
+        top_k: int = 3,
+        where: Optional[Dict[str, Any]] = None,
+    ) -> List[str]:
         """
         搜索与查询向量最相似的文档
-        
+
         Args:
             query_embedding: 查询向量
             top_k: 返回的顶部相似文档数量
-            
+            where: 可选的元数据过滤表达式，见 filter_rows
+
         Returns:
             最相似文档的列表
         """
-        # 计算每个向量的相似度并排序
-        scored_items = []
-        
-        for item in self.vector_store:
-            similarity = self.__cosine_similarity(query_embedding, item['embedding'])
-            scored_items.append({
-                'document': item['document'],
-                'similarity': similarity
-            })
-        
-        # 按相似度降序排序并获取前top_k个
-        scored_items.sort(key=lambda x: x['similarity'], reverse=True)
-        top_items = scored_items[:top_k]
-        
-        # 提取文档内容
-        return [item['document'] for item in top_items]
-    
+        return (await self.search_many([query_embedding], top_k, where))[0]
+
+    async def search_many(
+        self,
+        query_embeddings: List[List[float]],
+        top_k: int = 3,
+        where: Optional[Dict[str, Any]] = None,
+    ) -> List[List[str]]:
+        """
+        批量搜索：一次矩阵-矩阵乘法为多个查询向量打分
+
+        Args:
+            query_embeddings: 查询向量列表
+            top_k: 每个查询返回的顶部相似文档数量
+            where: 可选的元数据过滤表达式，见 filter_rows
+
+        Returns:
+            与查询顺序一一对应的最相似文档列表
+        """
+        return [
+            [self.get_document(__i) for __i in __ids]
+            for __ids in self.search_indices(query_embeddings, top_k, where=where)
+        ]
+
+    def search_indices(
+        self,
+        query_embeddings: List[List[float]],
+        top_k: int = 3,
+        exact: bool = False,
+        nprobe: Optional[int] = None,
+        where: Optional[Dict[str, Any]] = None,
+    ) -> List[np.ndarray]:
+        """
+        批量搜索并返回行号；索引已训练时走 IVF 近似检索
+
+        Args:
+            query_embeddings: 查询向量列表
+            top_k: 每个查询返回的数量
+            exact: 为 True 时忽略索引做暴力检索（量化模式下仍在编码上打分）
+            nprobe: 覆盖索引默认的 nprobe
+            where: 可选的元数据过滤表达式，先由倒排索引得到候选行再打分
+
+        Returns:
+            与查询顺序一一对应、按相似度降序排列的行号数组
+        """
+        if len(query_embeddings) == 0:
+            return []
+        __rows = None
+        if where is not None:
+            __rows = self.filter_rows(where)
+        elif self.__deleted_count:
+            __rows = np.flatnonzero(~self.__deleted_mask())
+        if self.__count == 0 or top_k <= 0 or (__rows is not None and __rows.size == 0):
+            return [np.empty(0, dtype=np.int64) for _ in query_embeddings]
+
+        __queries = np.asarray(query_embeddings, dtype=np.float32)
+        if __queries.ndim != 2 or __queries.shape[1] != self.__dim:
+            raise ValueError(f"Query dimension mismatch: expected {self.__dim}, got {__queries.shape[-1]}")
+        __queries = self.__normalize(__queries)
+
+        __use_index = not exact and self.__index is not None and self.__index.is_trained
+        if __use_index and __rows is not None:
+            # 过滤后的候选比一次探查还少时，直接精确扫描过滤结果更便宜
+            __probe_size = self.__count * min(nprobe or self.__index.nprobe, self.__index.nlist) / self.__index.nlist
+            __use_index = __rows.size > __probe_size
+
+        if __use_index:
+            __mask = None
+            if __rows is not None:
+                __mask = np.zeros(self.__count, dtype=bool)
+                __mask[__rows] = True
+            __results = []
+            for __query in __queries:
+                __candidates = self.__index.probe(__query, nprobe)
+                if __mask is not None:
+                    __candidates = __candidates[__mask[__candidates]]
+                __scores = self.__score(__query[np.newaxis, :], __candidates)[0]
+                __results.append(self.__select(__query, __scores, __candidates, top_k))
+            return __results
+
+        if __rows is not None and __rows.size * 4 > self.__count:
+            # 过滤条件不够选择性时，按行收集向量比整体打分再屏蔽更慢
+            __scores = self.__score(__queries)
+            __excluded = np.ones(self.__count, dtype=bool)
+            __excluded[__rows] = False
+            __scores[:, __excluded] = -np.inf
+            __top_k = min(top_k, __rows.size)
+            return [self.__select(__query, __row, None, __top_k) for __query, __row in zip(__queries, __scores)]
+
+        # (m, dim) @ (dim, N) 得到每个查询对全部（或过滤后）向量的余弦相似度
+        __scores = self.__score(__queries, __rows)
+        return [self.__select(__query, __row, __rows, top_k) for __query, __row in zip(__queries, __scores)]
+
+    def lexical_search_indices(
+        self,
+        query: str,
+        top_k: int = 3,
+        where: Optional[Dict[str, Any]] = None,
+    ) -> np.ndarray:
+        """
+        用 BM25 索引做关键词检索
+
+        Args:
+            query: 查询文本
+            top_k: 返回的数量
+            where: 可选的元数据过滤表达式
+
+        Returns:
+            按 BM25 分数降序排列的行号，只包含至少命中一个查询词的行
+        """
+        if self.__lexical_index is None:
+            raise RuntimeError("VectorStore has no lexical index. Pass lexical_index=BM25Index().")
+        __mask = None
+        if where is not None:
+            __mask = np.zeros(self.__count, dtype=bool)
+            __mask[self.filter_rows(where)] = True
+        elif self.__deleted_count:
+            __mask = ~self.__deleted_mask()
+        return self.__lexical_index.search(query, top_k, __mask)[0]
+
+    def filter_rows(self, where: Dict[str, Any]) -> np.ndarray:
+        """
+        用倒排索引求满足过滤表达式的行号
+
+        表达式为字典，多个键之间是 AND：
+            {"source": "a.md"}                    相等（列表类型的元数据值命中任一元素即可）
+            {"tag": {"$in": ["x", "y"]}}          任一值
+            {"date": {"$gte": "2024-01-01"}}      范围：$gt / $gte / $lt / $lte
+            {"source": {"$ne": "a.md"}}           不等
+            {"$and": [...]} / {"$or": [...]}      组合
+
+        Args:
+            where: 过滤表达式
+
+        Returns:
+            升序排列的行号数组
+        """
+        __result: Optional[np.ndarray] = None
+        for __key, __condition in where.items():
+            if __key == '$and':
+                __rows = self.__intersect([self.filter_rows(__sub) for __sub in __condition])
+            elif __key == '$or':
+                __rows = self.__union([self.filter_rows(__sub) for __sub in __condition])
+            else:
+                __rows = self.__field_rows(__key, __condition)
+            __result = __rows if __result is None else np.intersect1d(__result, __rows, assume_unique=True)
+        if __result is None:
+            __result = np.arange(self.__count)
+        if self.__deleted_count:
+            __result = __result[~self.__deleted_mask()[__result]]
+        return __result
+
+    def delete(self, where: Dict[str, Any]) -> int:
+        """
+        删除满足过滤表达式的行（打删除标记，检索时屏蔽，save 时压缩）
+
+        Args:
+            where: 过滤表达式，见 filter_rows
+
+        Returns:
+            删除的行数
+        """
+        __rows = self.filter_rows(where)
+        if __rows.size == 0:
+            return 0
+        if self.__deleted is None or self.__deleted.shape[0] < self.__count:
+            __deleted = np.zeros(max(self.__count, 1), dtype=bool)
+            if self.__deleted is not None:
+                __deleted[:self.__deleted.shape[0]] = self.__deleted
+            self.__deleted = __deleted
+        self.__deleted[__rows] = True
+        self.__deleted_count += int(__rows.size)
+        return int(__rows.size)
+
+    def get_metadata(self, row: int) -> Dict[str, Any]:
+        """
+        按行号获取元数据
+
+        Args:
+            row: 行号
+
+        Returns:
+            元数据字典
+        """
+        if row < self.__base_count:
+            if self.__base_meta_blob is None:
+                return {}
+            __start, __end = self.__base_meta_offsets[row], self.__base_meta_offsets[row + 1]
+            return json.loads(self.__base_meta_blob[__start:__end].tobytes().decode('utf-8'))
+        return self.__metadata[row - self.__base_count]
+
+    def get_document(self, row: int) -> str:
+        """
+        按行号获取文档
+
+        Args:
+            row: 行号
+
+        Returns:
+            文档内容
+        """
+        if row < self.__base_count:
+            __start, __end = self.__base_offsets[row], self.__base_offsets[row + 1]
+            return self.__base_blob[__start:__end].tobytes().decode('utf-8')
+        return self.__documents[row - self.__base_count]
+
+    @property
+    def vector_nbytes(self) -> int:
+        """当前向量数据（原始/归一化/编码）占用的字节数"""
+        return sum(
+            __array[:self.__count].nbytes
+            for __array in (self.__matrix, self.__normalized, self.__codes)
+            if __array is not None
+        )
+
+    def save(self, path: Union[str, Path]) -> None:
+        """
+        保存到目录：embeddings.npy / normalized.npy 为 float32 原始矩阵，
+        codes.npy + quantizer.npz 为量化编码和参数（量化模式），
+        documents.bin 为 utf-8 拼接的文档，offsets.npy 为每篇文档的起止偏移。
+        每个文件先写临时文件再原子替换，已经 mmap 打开同一目录的进程不受影响。
+        已删除的行不会写出，重新加载后行号被压缩。
+
+        Args:
+            path: 目标目录
+        """
+        __path = Path(path)
+        __path.mkdir(parents=True, exist_ok=True)
+
+        # 压缩：__live 为保留的行号，__remap 把旧行号映射到新行号（已删除为 -1）
+        __live: Optional[np.ndarray] = None
+        __remap: Optional[np.ndarray] = None
+        if self.__deleted_count:
+            __alive = ~self.__deleted_mask()
+            __live = np.flatnonzero(__alive)
+            __remap = np.where(__alive, np.cumsum(__alive) - 1, -1)
+        __rows = range(self.__count) if __live is None else __live.tolist()
+        __live_count = len(__rows)
+
+        __encoded = [self.get_document(__i).encode('utf-8') for __i in __rows]
+        __offsets = np.zeros(__live_count + 1, dtype=np.int64)
+        np.cumsum([len(__doc) for __doc in __encoded], out=__offsets[1:])
+
+        __arrays = {
+            'embeddings.npy': self.__matrix,
+            'normalized.npy': self.__normalized,
+            'codes.npy': self.__codes,
+        }
+        for __name, __array in __arrays.items():
+            if __array is not None:
+                __valid = __array[:self.__count] if __live is None else __array[__live]
+                self.__atomic_write(__path / __name, lambda f: np.save(f, __valid))
+            elif (__path / __name).exists():
+                (__path / __name).unlink()
+        self.__atomic_write(__path / 'offsets.npy', lambda f: np.save(f, __offsets))
+        self.__atomic_write(__path / 'documents.bin', lambda f: f.writelines(__encoded))
+
+        __encoded_meta = [json.dumps(self.get_metadata(__i), ensure_ascii=False).encode('utf-8') for __i in __rows]
+        __meta_offsets = np.zeros(__live_count + 1, dtype=np.int64)
+        np.cumsum([len(__m) for __m in __encoded_meta], out=__meta_offsets[1:])
+        self.__atomic_write(__path / 'metadata_offsets.npy', lambda f: np.save(f, __meta_offsets))
+        self.__atomic_write(__path / 'metadata.bin', lambda f: f.writelines(__encoded_meta))
+
+        # 倒排索引展平为 filters_ids.npy，filters.json 记录 字段 -> [json(值), 起, 止]
+        __postings, __filter_spans, __position = [], {}, 0
+        for __field, __values in self.__filters.items():
+            __filter_spans[__field] = []
+            for __value, __ids in __values.items():
+                __ids = np.frombuffer(__ids, dtype=np.int64)
+                if __remap is not None:
+                    __ids = __remap[__ids]
+                    __ids = __ids[__ids >= 0]
+                if __ids.size == 0:
+                    continue
+                __postings.append(__ids)
+                __filter_spans[__field].append([json.dumps(__value), __position, __position + len(__ids)])
+                __position += len(__ids)
+        __filter_ids = np.concatenate(__postings) if __postings else np.empty(0, dtype=np.int64)
+        self.__atomic_write(__path / 'filters_ids.npy', lambda f: np.save(f, __filter_ids))
+        self.__atomic_write(__path / 'filters.json', lambda f: f.write(json.dumps(__filter_spans).encode('utf-8')))
+
+        __states = {
+            'ivf.npz': self.__index if self.__index is not None and self.__index.is_trained else None,
+            'quantizer.npz': self.__quantizer if self.__quantized else None,
+            'bm25.npz': self.__lexical_index,
+        }
+        for __name, __owner in __states.items():
+            if __owner is not None:
+                __state = __owner.export_state()
+                if __name == 'ivf.npz' and __remap is not None:
+                    __state = self.__compact_ivf_state(__state, __remap)
+                elif __name == 'bm25.npz' and __remap is not None:
+                    __state = self.__compact_bm25_state(__state, __remap, __live)
+                self.__atomic_write(__path / __name, lambda f: np.savez(f, **__state))
+            elif (__path / __name).exists():
+                (__path / __name).unlink()
+
+        # meta.json 最后写入，作为整个目录写完的标志
+        __meta = {
+            "version": self.FORMAT_VERSION,
+            "dim": self.__dim,
+            "count": __live_count,
+            "quantizer": self.__quantizer.kind if self.__quantizer is not None else None,
+        }
+        self.__atomic_write(__path / 'meta.json', lambda f: f.write(json.dumps(__meta).encode('utf-8')))
+
+    @classmethod
+    def load(
+        cls,
+        path: Union[str, Path],
+        index: Optional[IVFIndex] = None,
+        quantizer: Optional[Union[ScalarQuantizer, ProductQuantizer]] = None,
+        rescore_factor: int = 0,
+        mmap: bool = True,
+        lexical_index: Optional[BM25Index] = None,
+    ) -> "VectorStore":
+        """
+        从 save 写出的目录加载。mmap=True 时矩阵和文档都以 np.memmap 只读映射，
+        冷启动只需读取元数据，多个进程共享同一份页缓存；之后 add_item 会把矩阵复制到内存再追加。
+
+        Args:
+            path: save 写出的目录
+            index: 可选的 IVFIndex，存在 ivf.npz 时直接恢复其状态
+            quantizer: 可选的量化器；目录是量化格式且未传入时按 meta.json 自动创建
+            rescore_factor: 同构造函数，量化模式下大于0时加载 normalized.npy 用于重排序
+            mmap: 是否使用内存映射
+            lexical_index: 可选的 BM25 索引，存在 bm25.npz 时恢复，否则由已有文档重建
+
+        Returns:
+            加载好的向量存储
+        """
+        __path = Path(path)
+        __meta = json.loads((__path / 'meta.json').read_text(encoding='utf-8'))
+        if __meta.get("version") != cls.FORMAT_VERSION:
+            raise ValueError(f"Unsupported vector store format version: {__meta.get('version')}")
+
+        __kind = __meta.get("quantizer")
+        if quantizer is None and __kind is not None:
+            quantizer = QUANTIZERS[__kind]()
+        if quantizer is not None and __kind is not None and quantizer.kind != __kind:
+            raise ValueError(f"Quantizer mismatch: store uses '{__kind}', got '{quantizer.kind}'")
+
+        __store = cls(index=index, quantizer=quantizer, rescore_factor=rescore_factor, lexical_index=lexical_index)
+        __count = __meta["count"]
+        if __count == 0:
+            return __store
+
+        __mmap_mode = 'r' if mmap else None
+        __store.__dim = __meta["dim"]
+        __store.__count = __count
+        if (__path / 'quantizer.npz').exists() and quantizer is not None:
+            with np.load(__path / 'quantizer.npz') as __state:
+                quantizer.load_state(dict(__state))
+            __store.__codes = np.load(__path / 'codes.npy', mmap_mode=__mmap_mode)
+        if quantizer is None:
+            __store.__matrix = np.load(__path / 'embeddings.npy', mmap_mode=__mmap_mode)
+        if __store.__keeps_normalized and (__path / 'normalized.npy').exists():
+            __store.__normalized = np.load(__path / 'normalized.npy', mmap_mode=__mmap_mode)
+        elif __store.__quantized and rescore_factor > 0:
+            raise ValueError(
+                f"rescore_factor={rescore_factor} needs float32 vectors, but {__path} was saved without "
+                f"normalized.npy; load with rescore_factor=0 or re-save the store with rescoring enabled"
+            )
+
+        __store.__base_count = __count
+        __store.__base_offsets = np.load(__path / 'offsets.npy', mmap_mode=__mmap_mode)
+        __store.__base_blob = cls.__load_blob(__path / 'documents.bin', __store.__base_offsets, mmap)
+        if (__path / 'metadata.bin').exists():
+            __store.__base_meta_offsets = np.load(__path / 'metadata_offsets.npy', mmap_mode=__mmap_mode)
+            __store.__base_meta_blob = cls.__load_blob(__path / 'metadata.bin', __store.__base_meta_offsets, mmap)
+        if (__path / 'filters.json').exists():
+            __filter_ids = np.load(__path / 'filters_ids.npy')
+            for __field, __spans in json.loads((__path / 'filters.json').read_text(encoding='utf-8')).items():
+                __values = __store.__filters.setdefault(__field, {})
+                for __value, __start, __end in __spans:
+                    __ids = array('q')
+                    __ids.frombytes(__filter_ids[__start:__end].tobytes())
+                    __values[cls.__filter_key(json.loads(__value))] = __ids
+
+        # 从 float32 格式加载并传入量化器时，在这里完成量化
+        __store.__train_quantizer()
+
+        if index is not None:
+            if (__path / 'ivf.npz').exists():
+                with np.load(__path / 'ivf.npz') as __state:
+                    index.load_state(dict(__state))
+            elif __count >= index.train_size:
+                __store.rebuild_index()
+        if lexical_index is not None:
+            if (__path / 'bm25.npz').exists():
+                with np.load(__path / 'bm25.npz') as __state:
+                    lexical_index.load_state(dict(__state))
+            else:
+                lexical_index.add(0, [__store.get_document(__i) for __i in range(__count)])
+        return __store
+
+    def rebuild_index(self) -> None:
+        """用当前全部向量重新训练索引并重新分配倒排列表"""
+        if self.__index is None or self.__count == 0:
+            return
+        __vectors = self.__vectors()
+        self.__index.train(__vectors)
+        self.__index.add(np.arange(self.__count), __vectors)
+
     @staticmethod
-    def __cosine_similarity(v1: List[float], v2: List[float]) -> float:
-        """
-        计算两个向量的余弦相似度
-        
-        Args:
-            v1: 向量1
-            v2: 向量2
-            
-        Returns:
-            余弦相似度值，范围[-1, 1]
-        """
-        # 使用numpy进行更高效的计算（如果可用）
-        try:
-            import numpy as np
-            v1_np = np.array(v1)
-            v2_np = np.array(v2)
-            dot_product = np.dot(v1_np, v2_np)
-            norm_v1 = np.linalg.norm(v1_np)
-            norm_v2 = np.linalg.norm(v2_np)
-            
-            if norm_v1 == 0 or norm_v2 == 0:
-                return 0.0
-            return float(dot_product / (norm_v1 * norm_v2))
-        except ImportError:
-            # 纯Python实现
-            dot_product = sum(a * b for a, b in zip(v1, v2))
-            norm_v1 = math.sqrt(sum(a * a for a in v1))
-            norm_v2 = math.sqrt(sum(b * b for b in v2))
-            
-            if norm_v1 == 0 or norm_v2 == 0:
-                return 0.0
-            return dot_product / (norm_v1 * norm_v2)
-    
+    def __compact_ivf_state(state: Dict[str, np.ndarray], remap: np.ndarray) -> Dict[str, np.ndarray]:
+        """
+        把 IVF 倒排列表中的行号映射到压缩后的行号，并去掉已删除的行
+
+        Args:
+            state: IVFIndex.export_state 的结果
+            remap: 旧行号 -> 新行号（已删除为 -1）
+
+        Returns:
+            压缩后的索引状态
+        """
+        __ids, __offsets, _ = VectorStore.__compact_postings(state["list_ids"], state["list_offsets"], remap)
+        return {**state, "list_ids": __ids, "list_offsets": __offsets}
+
+    @staticmethod
+    def __compact_bm25_state(state: Dict[str, np.ndarray], remap: np.ndarray, live: np.ndarray) -> Dict[str, np.ndarray]:
+        """
+        把 BM25 倒排列表和文档长度映射到压缩后的行号
+
+        Args:
+            state: BM25Index.export_state 的结果
+            remap: 旧行号 -> 新行号（已删除为 -1）
+            live: 保留的旧行号
+
+        Returns:
+            压缩后的索引状态
+        """
+        __ids, __offsets, __keep = VectorStore.__compact_postings(state["doc_ids"], state["offsets"], remap)
+        return {
+            **state,
+            "doc_ids": __ids.astype(state["doc_ids"].dtype),
+            "offsets": __offsets,
+            "tfs": state["tfs"][__keep],
+            "doc_lens": state["doc_lens"][live],
+        }
+
+    @staticmethod
+    def __compact_postings(
+        ids: np.ndarray, offsets: np.ndarray, remap: np.ndarray
+    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        压缩展平的倒排列表 (ids + offsets)：行号重映射并去掉已删除的行
+
+        Args:
+            ids: 展平的行号
+            offsets: 每个列表的起止偏移
+            remap: 旧行号 -> 新行号（已删除为 -1）
+
+        Returns:
+            (新行号, 新偏移, 保留的位置掩码)
+        """
+        __ids = remap[ids]
+        __keep = __ids >= 0
+        __kept_before = np.concatenate([[0], np.cumsum(__keep)])
+        return __ids[__keep], __kept_before[offsets], __keep
+
+    def __deleted_mask(self) -> np.ndarray:
+        """返回长度为 count 的删除标记"""
+        __mask = np.zeros(self.__count, dtype=bool)
+        if self.__deleted is not None:
+            __length = min(self.__deleted.shape[0], self.__count)
+            __mask[:__length] = self.__deleted[:__length]
+        return __mask
+
+    @staticmethod
+    def __load_blob(path: Path, offsets: np.ndarray, mmap: bool) -> np.ndarray:
+        """打开 utf-8 拼接字节文件；空文件无法 mmap，直接返回空数组"""
+        if offsets[-1] == 0:
+            return np.empty(0, dtype=np.uint8)
+        if mmap:
+            return np.memmap(path, dtype=np.uint8, mode='r')
+        return np.fromfile(path, dtype=np.uint8)
+
+    @staticmethod
+    def __filter_key(value: Any) -> Any:
+        """把元数据值转成可哈希的倒排索引键，不可哈希的值返回 None 表示不建索引"""
+        if isinstance(value, (str, int, float, bool)) or value is None:
+            return value
+        return None
+
+    def __index_metadata(self, row: int, metadata: Dict[str, Any]) -> None:
+        """
+        把一行的元数据写入倒排索引，列表/元组/集合类型的值按元素分别建索引
+
+        Args:
+            row: 行号
+            metadata: 元数据
+        """
+        for __field, __value in metadata.items():
+            __values = __value if isinstance(__value, (list, tuple, set)) else [__value]
+            __postings = self.__filters.setdefault(__field, {})
+            for __v in __values:
+                __key = self.__filter_key(__v)
+                if __key is None and __v is not None:
+                    continue
+                __ids = __postings.get(__key)
+                if __ids is None:
+                    __ids = __postings[__key] = array('q')
+                # 同一行的列表值里可能有重复元素，保证倒排列表严格升序
+                if not __ids or __ids[-1] != row:
+                    __ids.append(row)
+
+    def __field_rows(self, field: str, condition: Any) -> np.ndarray:
+        """
+        求单个字段条件命中的行号
+
+        Args:
+            field: 元数据字段
+            condition: 值，或 {"$in"/"$ne"/"$gt"/"$gte"/"$lt"/"$lte": ...} 形式的操作符字典
+
+        Returns:
+            升序排列的行号数组
+        """
+        __postings = self.__filters.get(field, {})
+        if not isinstance(condition, dict):
+            return self.__postings_rows(__postings, [condition])
+
+        __result: Optional[np.ndarray] = None
+        for __op, __operand in condition.items():
+            if __op == '$eq':
+                __rows = self.__postings_rows(__postings, [__operand])
+            elif __op == '$in':
+                __rows = self.__postings_rows(__postings, __operand)
+            elif __op == '$ne':
+                __rows = np.setdiff1d(
+                    np.arange(self.__count), self.__postings_rows(__postings, [__operand]), assume_unique=True
+                )
+            elif __op in ('$gt', '$gte', '$lt', '$lte'):
+                __compare = {
+                    '$gt': lambda v: v > __operand,
+                    '$gte': lambda v: v >= __operand,
+                    '$lt': lambda v: v < __operand,
+                    '$lte': lambda v: v <= __operand,
+                }[__op]
+                __matched = []
+                for __value in __postings:
+                    try:
+                        if __value is not None and __compare(__value):
+                            __matched.append(__value)
+                    except TypeError:
+                        continue
+                __rows = self.__postings_rows(__postings, __matched)
+            else:
+                raise ValueError(f"Unsupported filter operator: {__op}")
+            __result = __rows if __result is None else np.intersect1d(__result, __rows, assume_unique=True)
+        return np.arange(self.__count) if __result is None else __result
+
+    def __postings_rows(self, postings: Dict[Any, array], values: List[Any]) -> np.ndarray:
+        """取若干个值的倒排列表并求并集"""
+        __parts = []
+        for __value in values:
+            __ids = postings.get(self.__filter_key(__value))
+            if __ids:
+                __parts.append(np.frombuffer(__ids, dtype=np.int64))
+        return self.__union(__parts)
+
+    def __union(self, parts: List[np.ndarray]) -> np.ndarray:
+        """多个升序行号数组的并集，用位图合并避免排序"""
+        if not parts:
+            return np.empty(0, dtype=np.int64)
+        if len(parts) == 1:
+            # 复制一份，避免把 array 缓冲区的视图泄露给调用方（持有视图时 array 无法追加）
+            return parts[0].copy()
+        __bitmap = np.zeros(self.__count, dtype=bool)
+        for __part in parts:
+            __bitmap[__part] = True
+        return np.flatnonzero(__bitmap)
+
+    @staticmethod
+    def __intersect(parts: List[np.ndarray]) -> np.ndarray:
+        """多个升序行号数组的交集"""
+        if not parts:
+            return np.empty(0, dtype=np.int64)
+        __result = parts[0]
+        for __part in parts[1:]:
+            __result = np.intersect1d(__result, __part, assume_unique=True)
+        return __result
+
+    @property
+    def __quantized(self) -> bool:
+        """量化器已训练、编码可用"""
+        return self.__quantizer is not None and self.__quantizer.is_trained
+
+    @property
+    def __keeps_normalized(self) -> bool:
+        """是否需要保存 float32 归一化向量：非量化模式、量化器训练前的缓冲、或需要重排序"""
+        return self.__quantizer is None or not self.__quantizer.is_trained or self.__rescore_factor > 0
+
+    def __vectors(self) -> np.ndarray:
+        """返回全部归一化向量；量化且未保留 float32 时由编码近似重建"""
+        if self.__normalized is not None:
+            return self.__normalized[:self.__count]
+        return self.__quantizer.decode(self.__codes[:self.__count])
+
+    def __score(self, queries: np.ndarray, rows: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        计算查询与存储向量的相似度，量化模式下直接在编码上打分
+
+        Args:
+            queries: 归一化查询 (m, dim)
+            rows: 只对这些行打分，None 表示全部行
+
+        Returns:
+            相似度 (m, len(rows) 或 count)
+        """
+        if self.__quantized:
+            __codes = self.__codes[:self.__count] if rows is None else self.__codes[rows]
+            return self.__quantizer.score(queries, __codes)
+        __matrix = self.__normalized[:self.__count] if rows is None else self.__normalized[rows]
+        return queries @ __matrix.T
+
+    def __select(self, query: np.ndarray, scores: np.ndarray, rows: Optional[np.ndarray], top_k: int) -> np.ndarray:
+        """
+        从打分结果中选出 top_k 行；开启重排序时先取更多候选再用 float32 精确打分
+
+        Args:
+            query: 归一化查询 (dim,)
+            scores: 与 rows 对应的相似度
+            rows: 打分的行号，None 表示 0..count-1
+            top_k: 需要的数量
+
+        Returns:
+            按相似度降序排列的行号
+        """
+        if self.__quantized and self.__rescore_factor > 0:
+            __candidates = self.__top_k_indices(scores, top_k * self.__rescore_factor)
+            # 被过滤屏蔽（-inf）的行不能进入重排序
+            __candidates = __candidates[np.isfinite(scores[__candidates])]
+            __candidates = __candidates if rows is None else rows[__candidates]
+            __exact = self.__normalized[__candidates] @ query
+            return __candidates[self.__top_k_indices(__exact, top_k)]
+
+        __selected = self.__top_k_indices(scores, top_k)
+        return __selected if rows is None else rows[__selected]
+
+    @staticmethod
+    def __top_k_indices(scores: np.ndarray, top_k: int) -> np.ndarray:
+        """
+        取相似度最高的 top_k 个下标（降序）
+
+        Args:
+            scores: 一维相似度数组
+            top_k: 需要的数量
+
+        Returns:
+            按相似度降序排列的下标数组
+        """
+        if top_k >= scores.shape[0]:
+            return np.argsort(-scores, kind='stable')
+        # argpartition 只做 O(N) 的选择，再对 top_k 个结果排序
+        __candidates = np.argpartition(-scores, top_k - 1)[:top_k]
+        return __candidates[np.argsort(-scores[__candidates], kind='stable')]
+
+    @staticmethod
+    def __normalize(vectors: np.ndarray) -> np.ndarray:
+        """
+        按行归一化，零向量保持为零（相似度为0）
+
+        Args:
+            vectors: 二维向量数组
+
+        Returns:
+            归一化后的 float32 数组
+        """
+        __norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        __norms[__norms == 0] = 1.0
+        return (vectors / __norms).astype(np.float32, copy=False)
+
+    def __train_quantizer(self) -> None:
+        """量化器达到训练阈值时训练并编码已有向量；不需要重排序时释放 float32 矩阵"""
+        if self.__quantizer is None or self.__quantizer.is_trained:
+            return
+        if self.__count < self.__quantizer.train_size:
+            return
+
+        __vectors = self.__normalized[:self.__count]
+        self.__quantizer.train(__vectors)
+        self.__codes = self.__grow(
+            None, self.__count, self.__quantizer.code_size(self.__dim), self.__quantizer.code_dtype
+        )
+        self.__codes[:self.__count] = self.__quantizer.encode(__vectors)
+        if not self.__keeps_normalized:
+            self.__normalized = None
+
+    def __update_index(self, start: int, vectors: np.ndarray) -> None:
+        """
+        增量维护索引：达到训练阈值时训练，之后把新向量分配到最近的簇
+
+        Args:
+            start: 新增向量的起始行号
+            vectors: 新增的归一化向量
+        """
+        if self.__index is None:
+            return
+        if not self.__index.is_trained:
+            if self.__count >= self.__index.train_size:
+                self.rebuild_index()
+        elif self.__index.needs_retrain(self.__count):
+            self.rebuild_index()
+        else:
+            self.__index.add(np.arange(start, start + vectors.shape[0]), vectors)
+
+    @staticmethod
+    def __atomic_write(path: Path, write) -> None:
+        """
+        先写入同目录临时文件再 os.replace，避免截断正被 mmap 的旧文件
+
+        Args:
+            path: 目标文件
+            write: 接收二进制文件对象的写入函数
+        """
+        __tmp = path.with_name(f'.{path.name}.tmp')
+        with open(__tmp, 'wb') as f:
+            write(f)
+        os.replace(__tmp, path)
+
+    def __grow(self, array: Optional[np.ndarray], capacity: int, width: int, dtype) -> np.ndarray:
+        """
+        确保数组至少能容纳 capacity 行，不足时按倍数扩容并复制已有的 count 行。
+        mmap 打开的只读数组在第一次追加时也会经由这里复制到内存。
+
+        Args:
+            array: 现有数组，可为 None
+            capacity: 需要的最小行数
+            width: 每行的列数
+            dtype: 数据类型
+
+        Returns:
+            容量足够的数组
+        """
+        __current = 0 if array is None else array.shape[0]
+        if capacity <= __current:
+            return array
+
+        __new_capacity = max(capacity, __current * 2, self.__initial_capacity)
+        __grown = np.empty((__new_capacity, width), dtype=dtype)
+        if array is not None and self.__count:
+            __grown[:self.__count] = array[:self.__count]
+        return __grown
+
     def __len__(self) -> int:
-        """返回存储的向量数量"""
-        return len(self.vector_store)
-    
+        """返回存储的（未删除的）向量数量"""
+        return self.__count - self.__deleted_count
+
     def clear(self) -> None:
         """清空向量存储"""
-        self.vector_store.clear()
+        self.__dim = None
+        self.__count = 0
+        self.__matrix = None
+        self.__normalized = None
+        self.__codes = None
+        self.__documents.clear()
+        self.__metadata.clear()
+        self.__filters.clear()
+        self.__deleted = None
+        self.__deleted_count = 0
+        self.__base_count = 0
+        self.__base_blob = None
+        self.__base_offsets = None
+        self.__base_meta_blob = None
+        self.__base_meta_offsets = None
+        if self.__index is not None:
+            self.__index.reset()
+        if self.__lexical_index is not None:
+            self.__lexical_index.reset()
 
 
-def example(): 
+def example():
     store = VectorStore()
-    
+
     # 添加向量项
     store.add_item({
         'embedding': [0.1, 0.2, 0.3, 0.4],
         'document': '文档A：关于机器学习的介绍'
     })
-    
+
     store.add_item({
         'embedding': [0.2, 0.3, 0.4, 0.5],
         'document': '文档B：深度学习基础'
     })
-    
+
     store.add_item({
         'embedding': [0.9, 0.8, 0.7, 0.6],
         'document': '文档C：Python编程指南'
     })
-    
+
     # 搜索相似文档
     query_vec = [0.15, 0.25, 0.35, 0.45]
-    results = store.search(query_vec, top_k=2)
+    results = asyncio.run(store.search(query_vec, top_k=2))
     print("异步搜索结果:", results)
 
+    # 批量搜索多个查询
+    batch_results = asyncio.run(store.search_many([query_vec, [0.9, 0.8, 0.7, 0.6]], top_k=1))
+    print("批量搜索结果:", batch_results)
+
+    # 按元数据过滤
+    store.add_item({
+        'embedding': [0.15, 0.25, 0.35, 0.4],
+        'document': '文档D：机器学习实战',
+        'metadata': {'source': 'ml.md', 'tags': ['ml', 'practice']}
+    })
+    filtered = asyncio.run(store.search(query_vec, top_k=2, where={'tags': {'$in': ['ml']}}))
+    print("过滤搜索结果:", filtered)
+
+    # 保存到磁盘并通过 mmap 重新打开
+    import tempfile
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        store.save(tmp_dir)
+        loaded = VectorStore.load(tmp_dir)
+        print("加载后搜索结果:", asyncio.run(loaded.search(query_vec, top_k=2)))
+
 if __name__ == "__main__":
-    example()
\ No newline at end of file
+    example()
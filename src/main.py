@@ -1,11 +1,18 @@
 import asyncio
+import os
 from pathlib import Path
-from typing import List
 
-from Agent import Agent
+from AgentRunner import AgentRunner
+from EmbeddingCache import EmbeddingCache
 from EmbeddingRetrieve import EmbeddingRetrieve
+from KnowledgeBase import KnowledgeBase
+from LLMResponseCache import LLMResponseCache
 from MCPClient import MCPClient
-from utils import log_title
+from MCPClientPool import MCPClientPool
+from ToolResultCache import ToolResultCache
+from ToolResultProcessor import ToolResultProcessor
+from Tracer import tracer
+from utils import debug, flush, info, warning
 
 # Get the current working directory
 current_dir = Path.cwd()
@@ -15,89 +22,132 @@ url = "https://jsonplaceholder.typicode.com/users'"
 out_path = current_dir / 'output'
 task = f"爬取{url}的内容，并总结内容保存到${out_path}/knowledge中，给每个人创建一个md文件，保存基本信息然后告诉我文件的大小是多少字节？"
 
+# 只读工具的结果缓存：相同 URL/未修改的文件不再重复请求，write_file 等写工具会使相关路径失效
+tool_cache = ToolResultCache({
+    'fetch': 300,
+    'read_file': 60,
+    'read_text_file': 60,
+    'read_multiple_files': 60,
+    'get_file_info': 60,
+    'list_directory': 60,
+    'directory_tree': 60,
+})
+
 # Example usage of ChatOpenAI
-fetch_mcp = MCPClient('fetch', 'uvx', ['mcp-server-fetch']);
+fetch_mcp = MCPClient('fetch', 'uvx', ['mcp-server-fetch'], result_cache=tool_cache);
 
 # Example usage of MCPClient for file operations
-file_mcp = MCPClient('file', 'npx', ["-y","@modelcontextprotocol/server-filesystem",current_dir]);
+file_mcp = MCPClient('file', 'npx', ["-y","@modelcontextprotocol/server-filesystem",current_dir], result_cache=tool_cache);
+
+# MCP 服务器池：子进程常驻，多个 Agent 共享，后台健康检查
+mcp_pool = MCPClientPool()
 
 async def main():
-    prompt = f"根据Chelsey的信息，创作一个关于她的故事，并且把她的故事保存到{out_path}/chelsey_story.md文件中，要包含她的基本信息和故事"
-    context = await retrieveContext(prompt);
-    agent = Agent('deepseek-v3.2', [fetch_mcp,file_mcp] ,'', context)
-    await agent.init()
-    
-    response = await agent.invoke(prompt)
-    
-    print('Final Response from Agent:')
-    print(response)
-    await agent.close()
+    prompts = [
+        f"根据Chelsey的信息，创作一个关于她的故事，并且把她的故事保存到{out_path}/chelsey_story.md文件中，要包含她的基本信息和故事",
+    ]
+    # 缓存、知识库和检索器会打开 SQLite 文件并加载索引，只在运行时创建，import main 不产生副作用
+
+    # 嵌入缓存：未变化的知识文件和重复的查询不再请求嵌入服务
+    embedding_cache = EmbeddingCache(out_path / '.cache' / 'embeddings.sqlite')
+
+    # LLM 响应缓存：LLM_CACHE_MODE=record 时录制，重跑相同流程直接回放；=replay 时完全离线
+    llm_cache = LLMResponseCache(out_path / '.cache' / 'llm.sqlite', mode=os.getenv('LLM_CACHE_MODE', 'off'))
+
+    # 工具结果处理：超过上限的网页等结果转存到 output/.cache/artifacts，模型按需分页读取
+    result_processor = ToolResultProcessor(out_path / '.cache' / 'artifacts', limits={'fetch': 8000})
+
+    # 增量索引的知识库：向量和文件清单持久化在 output/.index 中，只有新增/修改/删除的文件会被处理
+    knowledge_base = KnowledgeBase(out_path / 'knowledge', out_path / '.index')
 
+    # RAG 检索器，持有共享的 HTTP 连接池，在 main 结束时关闭
+    embedding_retrieves = EmbeddingRetrieve(
+        'text-embedding-v4',
+        rerank_model='qwen3-rerank',
+        vector_store=knowledge_base.vector_store,
+        cache=embedding_cache,
+    )
 
-async def retrieveContext(prompt: str):
+    # MCP 服务器的启动握手与知识库同步同时进行
+    mcp_start = asyncio.create_task(mcp_pool.start([fetch_mcp, file_mcp]))
+    # 多个 Agent 在同一个事件循环中并发执行，共享 LLM 客户端、MCP 服务器池和检索器
+    agent_runner = AgentRunner(
+        'deepseek-v3.2',
+        mcp_pool,
+        context_provider=lambda prompt: retrieveContext(prompt, knowledge_base, embedding_retrieves),
+        agent_options={'response_cache': llm_cache, 'result_processor': result_processor},
+    )
+    try:
+        await syncKnowledge(knowledge_base, embedding_retrieves, embedding_cache)
+        await mcp_start
+
+        responses = await agent_runner.map(prompts)
+        info('Agent runner: %s', agent_runner.stats)
+        # 最终结果直接输出到 stdout（静默模式下也输出），先写完缓冲中的日志
+        flush()
+        for prompt, response in zip(prompts, responses):
+            if isinstance(response, BaseException):
+                print(f'Agent failed for prompt {prompt!r}: {type(response).__name__}: {response}')
+                continue
+            print('Final Response from Agent:')
+            print(response)
+    finally:
+        if not mcp_start.done():
+            mcp_start.cancel()
+        await agent_runner.close()
+        await mcp_pool.close()
+        await embedding_retrieves.close()
+        embedding_cache.close()
+        llm_cache.close()
+        # TRACE_FILE 开启追踪时刷新 JSONL 缓冲
+        tracer.disable()
+        flush()
+
+
+async def syncKnowledge(knowledge_base: KnowledgeBase, embedding_retrieves: EmbeddingRetrieve, embedding_cache: EmbeddingCache):
+    """
+    同步知识库：只重新嵌入新增或修改过的文件，删除已移除文件的向量（所有 Agent 开始前执行一次）
+
+    Args:
+        knowledge_base: 增量索引的知识库
+        embedding_retrieves: 用于生成嵌入的检索器
+        embedding_cache: 嵌入缓存（用于输出统计）
+    """
+    try:
+        sync_stats = await knowledge_base.sync(embedding_retrieves)
+        info('Knowledge base sync: %s Embedding cache: %s', sync_stats, embedding_cache.stats)
+    except Exception as e:
+        warning('同步知识库失败: %s', e)
+
+
+async def retrieveContext(prompt: str, knowledge_base: KnowledgeBase, embedding_retrieves: EmbeddingRetrieve):
     """
     检索上下文：使用RAG从知识库中检索相关内容
     
     Args:
         prompt: 查询提示
+        knowledge_base: 知识库
+        embedding_retrieves: 检索器
         
     Returns:
         检索到的上下文内容
     """
 
-    # RAG
-    embedding_retrieves = EmbeddingRetrieve('qwen3-rerank')
-
-    knowledge_dir = out_path / 'knowledge'
-
-    # 确保目录存在（如果不存在则创建）
-    knowledge_dir.mkdir(parents=True, exist_ok=True)
-
-    # 检查目录是否为空
-    if not any(knowledge_dir.iterdir()):
-        print(f'知识库目录 {knowledge_dir} 为空，跳过embedding')
+    if len(knowledge_base.vector_store) == 0:
+        info('知识库 %s 为空，跳过检索', out_path / "knowledge")
         return ""
-    
-    # 读取文件
-    contents: List[str] = []
-    has_content = False
-    
-    try:
-        for file_path in knowledge_dir.iterdir():
-            if file_path.is_file() and file_path.suffix in ['.md', '.txt', '.json']:
-                try:
-                    with open(file_path, 'r', encoding='utf-8') as f:
-                        content = f.read()
-                        if content.strip():  # 只添加非空内容
-                            contents.append(content)
-                            has_content = True
-                except Exception as e:
-                    print(f'读取文件 {file_path} 失败，跳过: {e}')
-    except Exception as e:
-        print(f'访问目录 {knowledge_dir} 失败: {e}')
-    
-    if has_content and contents:
-        try:
-            # 将文档内容添加到向量存储中
-            await embedding_retrieves.embed(prompt, contents)
-        except Exception as e:
-            print(f'Embedding失败: {e}')
-            return ""
-    else:
-        print('跳过embedding: 无有效内容')
-        return ""
-    
+
     # 检索上下文
     try:
-        context_list = await embedding_retrieves.retrieve(prompt)
+        # 混合检索：向量召回语义相关内容，BM25 召回人名等精确关键词；候选再交给重排序模型精排
+        context_list = await embedding_retrieves.retrieve(prompt, mode="hybrid", rerank=True)
         context = '\n'.join(context_list) if context_list else ""
         
-        log_title(f'Retrieved Context: {context}')
-        print('Retrieved Context:', context)
+        debug('Retrieved Context: %s', context)
         
         return context
     except Exception as e:
-        print(f'检索上下文失败: {e}')
+        warning('检索上下文失败: %s', e)
         return ""
    
    
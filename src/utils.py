@@ -1,10 +1,196 @@
-from rich.console import Console
-from rich.style import Style
-from rich.text import Text
+import atexit
+import os
+import queue
+import sys
+import threading
+from typing import Any, Callable, Optional, TextIO
 
-console = Console()
+# 日志级别，SILENT 关闭全部输出（包括流式回显）
+DEBUG = 10
+INFO = 20
+WARNING = 30
+ERROR = 40
+SILENT = 100
 
-def log_title(message: str):
+LEVELS = {"debug": DEBUG, "info": INFO, "warning": WARNING, "error": ERROR, "silent": SILENT}
+
+
+class BufferedSink:
+    """缓冲输出：调用方只把字符串放进有界队列，由后台线程批量写入流，终端 I/O 不会阻塞事件循环
+
+    队列满时（输出跟不上突发的日志）按 overflow 处理："drop" 丢弃新消息并在之后写出丢弃的条数，
+    内存和调用方的开销都有上限；"block" 等待后台线程写出，不丢消息。
+    """
+
+    def __init__(self, stream: Optional[TextIO] = None, max_batch: int = 1024, max_queue: int = 10000,
+                 overflow: str = "drop"):
+        """
+        初始化缓冲输出
+
+        Args:
+            stream: 目标流，为 None 时使用（写出时的）sys.stdout
+            max_batch: 每次写入最多合并的条数
+            max_queue: 队列中最多等待写出的条数
+            overflow: 队列满时的策略，"drop" 或 "block"
+        """
+        if overflow not in ("drop", "block"):
+            raise ValueError(f"Unknown overflow policy: {overflow}")
+        self.__stream = stream
+        self.__max_batch = max_batch
+        self.__overflow = overflow
+        self.__queue: "queue.Queue[str]" = queue.Queue(maxsize=max(1, max_queue))
+        self.__thread: Optional[threading.Thread] = None
+        self.__lock = threading.Lock()
+        self.dropped = 0
+        self.__unreported = 0
+
+    def write(self, text: str) -> None:
+        """放入队列，立即返回（overflow="block" 且队列已满时等待）"""
+        if self.__thread is None:
+            self.__start()
+        if self.__overflow == "block":
+            self.__queue.put(text)
+            return
+        try:
+            self.__queue.put_nowait(text)
+        except queue.Full:
+            with self.__lock:
+                self.dropped += 1
+                self.__unreported += 1
+
+    def flush(self) -> None:
+        """等待队列中的内容（以及尚未报告的丢弃条数）全部写出"""
+        if self.__thread is None:
+            return
+        self.__queue.join()
+        if self.__unreported:
+            # 空批次只用于触发后台线程写出丢弃条数
+            self.__queue.put('')
+            self.__queue.join()
+
+    def __start(self) -> None:
+        with self.__lock:
+            if self.__thread is None:
+                self.__thread = threading.Thread(target=self.__drain, name="log-sink", daemon=True)
+                self.__thread.start()
+
+    def __drain(self) -> None:
+        """后台线程：取出一批内容合并后写一次，并报告期间丢弃的条数"""
+        while True:
+            __batch = [self.__queue.get()]
+            while len(__batch) < self.__max_batch:
+                try:
+                    __batch.append(self.__queue.get_nowait())
+                except queue.Empty:
+                    break
+            with self.__lock:
+                __dropped, self.__unreported = self.__unreported, 0
+            try:
+                __stream = self.__stream or sys.stdout
+                __stream.write(''.join(__batch))
+                if __dropped:
+                    __stream.write(f"[log sink full, dropped {__dropped} messages]\n")
+                __stream.flush()
+            except Exception:
+                pass
+            finally:
+                for _ in __batch:
+                    self.__queue.task_done()
+
+
+class _Logger:
+    """进程内共享的日志配置"""
+
+    def __init__(self):
+        self.level = LEVELS.get(os.getenv("LOG_LEVEL", "info").lower(), INFO)
+        self.sink: Any = BufferedSink()
+        self.color = sys.stdout.isatty()
+        self.echo: Optional[Callable[[str], None]] = None
+
+
+_logger = _Logger()
+atexit.register(lambda: _logger.sink.flush())
+
+
+def configure(
+    level: Optional[int] = None,
+    sink: Any = None,
+    color: Optional[bool] = None,
+    echo: Optional[Callable[[str], None]] = None,
+) -> None:
+    """
+    配置日志
+
+    Args:
+        level: 最低输出级别（DEBUG/INFO/WARNING/ERROR/SILENT），默认来自 LOG_LEVEL 环境变量
+        sink: 带 write(str) 和 flush() 的输出对象，默认是写 stdout 的 BufferedSink
+        color: log_title 是否输出 ANSI 颜色，默认在终端中开启
+        echo: 流式回显的处理函数，默认在 INFO 级别写入 sink
+    """
+    if level is not None:
+        _logger.level = level
+    if sink is not None:
+        _logger.sink.flush()
+        _logger.sink = sink
+    if color is not None:
+        _logger.color = color
+    if echo is not None:
+        _logger.echo = echo
+
+
+def is_enabled(level: int) -> bool:
+    """该级别的日志是否会输出，调用方可以在构造昂贵的消息前判断"""
+    return level >= _logger.level
+
+
+def log(level: int, message: str, *args: Any) -> None:
+    """
+    输出一条日志，只有级别开启时才执行 % 格式化
+
+    Args:
+        level: 日志级别
+        message: 消息，可以包含 % 占位符
+        args: 占位符参数
+    """
+    if level < _logger.level:
+        return
+    _logger.sink.write((message % args if args else message) + '\n')
+
+
+def debug(message: str, *args: Any) -> None:
+    log(DEBUG, message, *args)
+
+
+def info(message: str, *args: Any) -> None:
+    log(INFO, message, *args)
+
+
+def warning(message: str, *args: Any) -> None:
+    log(WARNING, message, *args)
+
+
+def error(message: str, *args: Any) -> None:
+    log(ERROR, message, *args)
+
+
+def echo(delta: str) -> None:
+    """流式回显（LLM 增量内容），INFO 级别以下才输出，可以通过 configure(echo=...) 替换"""
+    if INFO < _logger.level:
+        return
+    if _logger.echo is not None:
+        _logger.echo(delta)
+    else:
+        _logger.sink.write(delta)
+
+
+def flush() -> None:
+    """等待缓冲中的日志全部写出"""
+    _logger.sink.flush()
+
+
+def log_title(message: str, level: int = INFO):
+    if level < _logger.level:
+        return
     total_length = 88
     border_char = '='
 
@@ -14,22 +200,23 @@ def log_title(message: str):
     # 2. 计算消息居中位置，并构造带空格的消息字符串
     padded_message = f" {message} "
     start_pos = (total_length - len(padded_message)) // 2
-    
-    # 创建 Text 对象并设置样式
-    text = Text()
-    
-    # 左边框 - 绿色
-    text.append(border[:start_pos], style=Style(color="green"))
-    # 消息 - 亮青色
-    text.append(padded_message, style=Style(color="cyan", bold=True))
-    # 右边框 - 绿色
-    text.append(border[start_pos + len(padded_message):], style=Style(color="green"))
-    
-    console.print(text)
+    left = border[:start_pos]
+    right = border[start_pos + len(padded_message):]
+
+    # 左右边框 - 绿色，消息 - 亮青色（直接拼接 ANSI 转义，不经过 rich 渲染）
+    if _logger.color:
+        _logger.sink.write(f"\x1b[32m{left}\x1b[0m\x1b[1;36m{padded_message}\x1b[0m\x1b[32m{right}\x1b[0m\n")
+    else:
+        _logger.sink.write(f"{left}{padded_message}{right}\n")
 
 
 # 使用示例
 if __name__ == "__main__":
     log_title("Hello, World!")
     log_title("应用程序启动")
-    log_title("数据库连接成功")
\ No newline at end of file
+    log_title("数据库连接成功")
+    debug("不会输出，也不会格式化: %s", object())
+    info("连接了 %d 个服务器", 2)
+    configure(level=SILENT)
+    log_title("静默模式下不输出")
+    flush()
@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# src/ 是平铺的模块目录（没有包），测试直接按模块名导入
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / 'src'))
@@ -0,0 +1,159 @@
+"""测试用的本地 HTTP 服务器：模拟 OpenAI 兼容的流式聊天接口，以及 DashScope 风格的嵌入和重排序接口"""
+import hashlib
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, List, Optional
+
+
+def chat_chunk(delta: Dict[str, Any], finish_reason: Optional[str] = None) -> Dict[str, Any]:
+    """构造一个流式聊天增量"""
+    return {
+        "id": "chunk",
+        "object": "chat.completion.chunk",
+        "created": 0,
+        "model": "stub",
+        "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+    }
+
+
+def text_embedding(text: str, dim: int = 16) -> List[float]:
+    """确定性的文本向量：相同文本得到相同向量"""
+    return [float(__b) for __b in hashlib.sha256(text.encode('utf-8')).digest()[:dim]]
+
+
+class StubServer:
+    """在后台线程中运行的 HTTP 服务器，记录收到的请求并按配置返回结果
+
+    - chat_script(body) 返回本次流式响应的增量列表，默认回复 "ok"
+    - embedding_failures / rerank_failures 是依次返回的错误状态码，用完后正常响应
+    - chat_delay / embedding_delay / rerank_delay 为每个请求的处理延迟（秒）
+    - rerank_scores(query, documents) 返回相关性分数，默认按共同字符数打分
+    """
+
+    def __init__(self):
+        self.chat_requests: List[Dict[str, Any]] = []
+        self.embedding_requests: List[Dict[str, Any]] = []
+        self.rerank_requests: List[Dict[str, Any]] = []
+        self.chat_script: Optional[Callable[[Dict[str, Any]], List[Dict[str, Any]]]] = None
+        self.embedding_failures: List[int] = []
+        self.rerank_failures: List[int] = []
+        self.chat_delay = 0.0
+        self.embedding_delay = 0.0
+        self.rerank_delay = 0.0
+        self.rerank_scores: Optional[Callable[[str, List[str]], List[float]]] = None
+        # 同时在处理的嵌入请求数及其峰值，用于验证并发上限
+        self.embedding_in_flight = 0
+        self.embedding_max_in_flight = 0
+        self.__lock = threading.Lock()
+        self.__server: Optional[ThreadingHTTPServer] = None
+
+    @property
+    def url(self) -> str:
+        """服务器根地址"""
+        return f"http://127.0.0.1:{self.__server.server_address[1]}"
+
+    def start(self) -> "StubServer":
+        """在后台线程中启动"""
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, *args: Any) -> None:
+                pass
+
+            def do_POST(self) -> None:
+                __body = json.loads(self.rfile.read(int(self.headers['content-length'])))
+                try:
+                    if self.path.endswith('/chat/completions'):
+                        stub.handle_chat(self, __body)
+                    elif 'rerank' in self.path:
+                        stub.handle_rerank(self, __body)
+                    else:
+                        stub.handle_embeddings(self, __body)
+                except (BrokenPipeError, ConnectionResetError):
+                    # 客户端取消或超时后断开连接
+                    self.close_connection = True
+
+        self.__server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        threading.Thread(target=self.__server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self) -> None:
+        """关闭服务器"""
+        if self.__server is not None:
+            self.__server.shutdown()
+            self.__server.server_close()
+            self.__server = None
+
+    def handle_chat(self, handler: BaseHTTPRequestHandler, body: Dict[str, Any]) -> None:
+        """以 SSE 分块返回流式聊天响应"""
+        with self.__lock:
+            self.chat_requests.append(body)
+        time.sleep(self.chat_delay)
+        __chunks = self.chat_script(body) if self.chat_script else [
+            chat_chunk({"role": "assistant", "content": "ok"}),
+            chat_chunk({}, "stop"),
+        ]
+        handler.send_response(200)
+        handler.send_header('content-type', 'text/event-stream')
+        handler.send_header('transfer-encoding', 'chunked')
+        handler.end_headers()
+        for __chunk in [json.dumps(__c) for __c in __chunks] + ['[DONE]']:
+            __data = f"data: {__chunk}\n\n".encode('utf-8')
+            handler.wfile.write(b'%x\r\n%s\r\n' % (len(__data), __data))
+        handler.wfile.write(b'0\r\n\r\n')
+        handler.wfile.flush()
+
+    def handle_embeddings(self, handler: BaseHTTPRequestHandler, body: Dict[str, Any]) -> None:
+        """返回确定性的嵌入向量，按配置先返回错误状态码"""
+        with self.__lock:
+            self.embedding_requests.append(body)
+            __status = self.embedding_failures.pop(0) if self.embedding_failures else 200
+            self.embedding_in_flight += 1
+            self.embedding_max_in_flight = max(self.embedding_max_in_flight, self.embedding_in_flight)
+        try:
+            time.sleep(self.embedding_delay)
+            if __status != 200:
+                self.__send_json(handler, __status, {"message": "stub failure"})
+                return
+            __texts = body["input"]["texts"]
+            self.__send_json(handler, 200, {
+                "output": {"embeddings": [
+                    {"text_index": __i, "embedding": text_embedding(__text)} for __i, __text in enumerate(__texts)
+                ]},
+                "usage": {"total_tokens": sum(len(__text) for __text in __texts)},
+            })
+        finally:
+            with self.__lock:
+                self.embedding_in_flight -= 1
+
+    def handle_rerank(self, handler: BaseHTTPRequestHandler, body: Dict[str, Any]) -> None:
+        """返回重排序分数"""
+        with self.__lock:
+            self.rerank_requests.append(body)
+            __status = self.rerank_failures.pop(0) if self.rerank_failures else 200
+        time.sleep(self.rerank_delay)
+        if __status != 200:
+            self.__send_json(handler, __status, {"message": "stub failure"})
+            return
+        __query = body["input"]["query"]
+        __documents = body["input"]["documents"]
+        __scores = (
+            self.rerank_scores(__query, __documents) if self.rerank_scores
+            else [float(len(set(__query) & set(__document))) for __document in __documents]
+        )
+        self.__send_json(handler, 200, {"output": {"results": [
+            {"index": __i, "relevance_score": __score} for __i, __score in enumerate(__scores)
+        ]}})
+
+    @staticmethod
+    def __send_json(handler: BaseHTTPRequestHandler, status: int, payload: Dict[str, Any]) -> None:
+        __data = json.dumps(payload).encode('utf-8')
+        handler.send_response(status)
+        handler.send_header('content-type', 'application/json')
+        handler.send_header('content-length', str(len(__data)))
+        handler.end_headers()
+        handler.wfile.write(__data)
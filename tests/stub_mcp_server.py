@@ -0,0 +1,58 @@
+"""测试用的本地 MCP 服务器（stdio），提供可控延迟、崩溃和写操作的工具"""
+import asyncio
+import os
+import time
+from pathlib import Path
+
+try:
+    from mcp.server.fastmcp import FastMCP
+except ImportError:
+    # 新版 mcp 把 FastMCP 改名为 MCPServer
+    from mcp.server.mcpserver import MCPServer as FastMCP
+
+mcp = FastMCP("stub")
+
+
+@mcp.tool()
+async def slow(seconds: float, tag: str = "") -> str:
+    """等待 seconds 秒后返回"""
+    await asyncio.sleep(seconds)
+    return f"slept {seconds} {tag}"
+
+
+@mcp.tool()
+async def busy(seconds: float) -> str:
+    """阻塞事件循环 seconds 秒：模拟忙于长时间调用、暂时无法响应 ping 的服务器"""
+    time.sleep(seconds)
+    return f"busy {seconds}"
+
+
+@mcp.tool()
+async def write_file(path: str, content: str = "") -> str:
+    """把 content 追加到 path，并在进程退出前落盘（记录实际执行次数）"""
+    with open(path, 'a', encoding='utf-8') as f:
+        f.write(content + '\n')
+    return f"wrote {path}"
+
+
+@mcp.tool()
+async def crash_after_write(path: str) -> str:
+    """追加一行到 path 后直接退出进程：请求已经执行，但客户端收不到响应"""
+    with open(path, 'a', encoding='utf-8') as f:
+        f.write('ran\n')
+    os._exit(1)
+
+
+@mcp.tool()
+async def read_once_crash(path: str) -> str:
+    """只读工具：第一次调用时记录并退出进程，之后正常返回"""
+    __marker = Path(path)
+    __runs = __marker.read_text(encoding='utf-8') if __marker.exists() else ''
+    __marker.write_text(__runs + 'ran\n', encoding='utf-8')
+    if not __runs:
+        os._exit(1)
+    return "recovered"
+
+
+if __name__ == "__main__":
+    mcp.run()
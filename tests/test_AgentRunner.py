@@ -0,0 +1,71 @@
+import asyncio
+import os
+import unittest
+from types import SimpleNamespace
+
+from AgentRunner import AgentRunner
+from MCPClientPool import MCPClientPool
+from ToolResultProcessor import READ_ARTIFACT_TOOL, ToolResultProcessor
+from utils import SILENT, configure
+
+from tests.stub_http_server import StubServer
+
+
+class StubResultProcessor(ToolResultProcessor):
+    """read_artifact 的工具定义用普通对象构造，不依赖 mcp Tool 在 1.x/2.x 之间变化的字段名"""
+
+    @property
+    def tool(self):
+        return SimpleNamespace(name=READ_ARTIFACT_TOOL, description="", inputSchema={"type": "object"})
+
+
+class AgentRunnerTest(unittest.IsolatedAsyncioTestCase):
+    """用本地 stub 聊天服务验证运行器的结果和取消行为（不连接 MCP 服务器）"""
+
+    async def asyncSetUp(self):
+        configure(level=SILENT)
+        self.stub = StubServer().start()
+        os.environ["ALIBABA_BASE_URL"] = f"{self.stub.url}/v1"
+        os.environ["ALIBABA_KEY"] = "test"
+        self.pool = MCPClientPool(health_check_interval=None)
+        self.runner = AgentRunner(
+            "stub", self.pool, max_agents=2, max_pending=4,
+            agent_options={"result_processor": StubResultProcessor()},
+        )
+
+    async def asyncTearDown(self):
+        await self.runner.close()
+        await self.pool.close()
+        self.stub.stop()
+
+    async def test_map_returns_responses_in_order(self):
+        self.assertEqual(await self.runner.map(["a", "b", "c"]), ["ok", "ok", "ok"])
+        self.assertEqual(self.runner.stats["completed"], 3)
+
+    async def test_cancelling_map_cancels_running_agents(self):
+        self.stub.chat_delay = 0.5
+        batch = asyncio.create_task(self.runner.map(["a", "b", "c"]))
+        await asyncio.sleep(0.2)
+        running = [t for t in asyncio.all_tasks() if t.get_name().startswith("agent-")]
+        self.assertEqual(len(running), 2)
+
+        batch.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await batch
+        await asyncio.gather(*running, return_exceptions=True)
+        self.assertTrue(all(t.cancelled() for t in running))
+        self.assertEqual(self.runner.stats["running"], 0)
+
+    async def test_close_cancels_running_agents(self):
+        self.stub.chat_delay = 0.5
+        submitted = asyncio.create_task(self.runner.submit("a"))
+        await asyncio.sleep(0.2)
+        running = [t for t in asyncio.all_tasks() if t.get_name().startswith("agent-")]
+        await self.runner.close()
+        self.assertTrue(all(t.cancelled() for t in running))
+        with self.assertRaises(asyncio.CancelledError):
+            await submitted
+
+
+if __name__ == "__main__":
+    unittest.main()
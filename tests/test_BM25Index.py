@@ -0,0 +1,94 @@
+import math
+import unittest
+
+import numpy as np
+
+from BM25Index import BM25Index
+
+DOCUMENTS = [
+    "apple banana apple",   # 长度 3
+    "banana cherry",        # 长度 2
+    "cherry date egg fig",  # 长度 4
+]
+
+
+def idf(count, df):
+    return math.log(1 + (count - df + 0.5) / (df + 0.5))
+
+
+def term_score(count, df, tf, doc_len, avg_len, k1=1.2, b=0.75):
+    return idf(count, df) * tf * (k1 + 1) / (tf + k1 * (1 - b + b * doc_len / avg_len))
+
+
+class BM25IndexTest(unittest.TestCase):
+    def setUp(self):
+        self.index = BM25Index()
+        self.index.add(0, DOCUMENTS)
+
+    def test_scores_match_hand_computed_values(self):
+        rows, scores = self.index.search("apple")
+        np.testing.assert_array_equal(rows, [0])
+        # idf = ln(1 + 2.5 / 1.5) ≈ 0.9808，tf=2，文档长度等于平均长度：0.9808 * 2 * 2.2 / 3.2 ≈ 1.3486
+        self.assertAlmostEqual(float(scores[0]), 1.3486, places=4)
+
+        rows, scores = self.index.search("banana cherry")
+        np.testing.assert_array_equal(rows, [1, 0, 2])
+        expected = [
+            term_score(3, 2, 1, 2, 3) * 2,
+            term_score(3, 2, 1, 3, 3),
+            term_score(3, 2, 1, 4, 3),
+        ]
+        np.testing.assert_allclose(scores, expected, rtol=1e-5)
+
+    def test_top_k_and_mask(self):
+        rows, _ = self.index.search("banana cherry", top_k=2)
+        np.testing.assert_array_equal(rows, [1, 0])
+        rows, _ = self.index.search("banana cherry", mask=np.array([True, False, True]))
+        np.testing.assert_array_equal(rows, [0, 2])
+
+    def test_empty_or_unknown_query(self):
+        for query in ("", "   ", "，。!?", "unknown words"):
+            with self.subTest(query=query):
+                rows, scores = self.index.search(query)
+                self.assertEqual(rows.size, 0)
+                self.assertEqual(scores.size, 0)
+        self.assertEqual(self.index.search("apple", top_k=0)[0].size, 0)
+
+    def test_empty_corpus(self):
+        index = BM25Index()
+        self.assertEqual(index.doc_count, 0)
+        self.assertEqual(index.search("apple")[0].size, 0)
+        index.add(0, [""])
+        self.assertEqual(index.doc_count, 1)
+        self.assertEqual(index.search("apple")[0].size, 0)
+
+    def test_incremental_add_matches_bulk_add(self):
+        incremental = BM25Index()
+        incremental.add(0, DOCUMENTS[:1])
+        self.assertAlmostEqual(float(incremental.search("apple")[1][0]), term_score(1, 1, 2, 3, 3), places=5)
+        # 新文档改变文档数、idf 和平均长度，缓存的长度归一化必须失效
+        incremental.add(1, DOCUMENTS[1:])
+        for query in ("apple", "banana cherry", "fig egg apple"):
+            with self.subTest(query=query):
+                expected_rows, expected_scores = self.index.search(query)
+                rows, scores = incremental.search(query)
+                np.testing.assert_array_equal(rows, expected_rows)
+                np.testing.assert_allclose(scores, expected_scores, rtol=1e-6)
+
+    def test_rows_must_be_contiguous(self):
+        with self.assertRaises(ValueError):
+            self.index.add(5, ["gap"])
+
+    def test_export_and_load_round_trip(self):
+        restored = BM25Index(k1=2.0, b=0.1)
+        restored.load_state(self.index.export_state())
+        self.assertEqual((restored.k1, restored.b), (1.2, 0.75))
+        self.assertEqual(restored.nbytes, self.index.nbytes)
+        for query in ("apple", "banana cherry"):
+            np.testing.assert_array_equal(restored.search(query)[0], self.index.search(query)[0])
+        restored.add(3, ["apple pie"])
+        self.assertEqual(restored.search("apple")[0].tolist(), [0, 3])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,58 @@
+import json
+import unittest
+
+from openai import AsyncOpenAI
+
+from ChatOpenAI import ChatOpenAI
+from ContextWindow import ContextWindow
+from utils import SILENT, configure
+
+from tests.stub_http_server import StubServer, chat_chunk
+
+TASK = "IMPORTANT TASK: write story about Chelsey"
+
+
+def tool_call_script(body):
+    """每轮都请求一次工具调用"""
+    __round = sum(1 for __m in body["messages"] if __m["role"] == "tool")
+    return [
+        chat_chunk({"role": "assistant", "tool_calls": [{
+            "index": 0, "id": f"call_{__round}", "type": "function",
+            "function": {"name": "fetch", "arguments": json.dumps({"url": f"https://example.com/{__round}"})},
+        }]}),
+        chat_chunk({}, "tool_calls"),
+    ]
+
+
+class ChatOpenAIContextWindowTest(unittest.IsolatedAsyncioTestCase):
+    """用本地 stub 聊天服务验证压缩后发送的消息历史"""
+
+    async def asyncSetUp(self):
+        configure(level=SILENT)
+        self.stub = StubServer().start()
+        self.stub.chat_script = tool_call_script
+        self.client = AsyncOpenAI(base_url=f"{self.stub.url}/v1", api_key="test")
+
+    async def asyncTearDown(self):
+        await self.client.close()
+        self.stub.stop()
+
+    async def test_first_user_turn_survives_compaction(self):
+        llm = ChatOpenAI(
+            'stub', 'system prompt', context='retrieved context', client=self.client,
+            context_window=ContextWindow(max_tokens=400, keep_recent=2, tool_output_chars=50),
+        )
+        response = await llm.chat(TASK)
+        for round in range(8):
+            llm.append_tool_result(response["tool_calls"][0]["id"], "<html>" + "x" * 3000 + "</html>")
+            response = await llm.chat()
+
+        sent = self.stub.chat_requests[-1]["messages"]
+        self.assertEqual([m["content"] for m in sent[:3]], ["system prompt", "retrieved context", TASK])
+        # 之后的轮次被压缩成一条说明
+        self.assertIn("earlier messages omitted", sent[3]["content"])
+        self.assertEqual(sum(1 for m in sent if m.get("content") == TASK), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,46 @@
+import unittest
+
+from DocumentChunker import DocumentChunker, tokenize
+
+TEXT = (
+    "Chelsey Dietrich 住在 Roscoeview。她的邮箱是 Lucio_Hettinger@annie.ca。"
+    "她在 Keebler LLC 工作，公司口号是 user-centric fault-tolerant solution。"
+    "Pi is about 3.14. The end!"
+)
+
+
+def stream(text: str, read_size: int):
+    return [text[i:i + read_size] for i in range(0, len(text), read_size)]
+
+
+class DocumentChunkerTest(unittest.TestCase):
+    def test_zero_overlap_streamed_matches_chunk_text(self):
+        for mode in ("token", "sentence"):
+            for read_size in (1, 5, 17, 1000):
+                chunker = DocumentChunker(chunk_size=4, overlap=0, mode=mode, read_size=read_size)
+                with self.subTest(mode=mode, read_size=read_size):
+                    streamed = list(chunker.chunks(stream(TEXT, read_size)))
+                    self.assertEqual(streamed, chunker.chunk_text(TEXT))
+                    if mode == "token":
+                        # 没有重叠时每个词元恰好出现在一个块中
+                        self.assertEqual(sum(len(tokenize(c)) for c in streamed), len(tokenize(TEXT)))
+
+    def test_overlap_streamed_matches_chunk_text(self):
+        for mode in ("token", "sentence"):
+            chunker = DocumentChunker(chunk_size=12, overlap=4, mode=mode)
+            with self.subTest(mode=mode):
+                self.assertEqual(list(chunker.chunks(stream(TEXT, 7))), chunker.chunk_text(TEXT))
+
+    def test_sentence_mode_does_not_split_inside_email_or_decimal(self):
+        chunks = DocumentChunker(chunk_size=12, overlap=4).chunk_text(TEXT)
+        for chunk in chunks:
+            self.assertFalse(chunk.startswith(("ca", "14")), chunk)
+        self.assertTrue(any("annie.ca。" in chunk for chunk in chunks))
+
+    def test_rejects_invalid_overlap(self):
+        with self.assertRaises(ValueError):
+            DocumentChunker(chunk_size=4, overlap=4)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,126 @@
+import os
+import tempfile
+import threading
+import unittest
+from pathlib import Path
+
+import numpy as np
+
+from EmbeddingCache import EmbeddingCache
+from EmbeddingRetrieve import EmbeddingRetrieve
+from utils import SILENT, configure
+
+from tests.stub_http_server import StubServer
+
+
+class EmbeddingCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = Path(self.tmp.name) / 'embeddings.sqlite'
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_hit_and_miss(self):
+        cache = EmbeddingCache()
+        cache.put_many('m', ['a', 'b'], [[1.0, 2.0], [3.0, 4.0]])
+        a, missing, b = cache.get_many('m', ['a', 'c', 'b'])
+        np.testing.assert_array_equal(a, [1.0, 2.0])
+        np.testing.assert_array_equal(b, [3.0, 4.0])
+        self.assertIsNone(missing)
+        # 命名空间按模型区分
+        self.assertEqual(cache.get_many('other', ['a']), [None])
+        self.assertEqual((cache.memory_hits, cache.disk_hits, cache.misses), (2, 0, 2))
+
+    def test_lru_evicts_least_recently_used_by_bytes(self):
+        # 每个向量 2 个 float32 = 8 字节，内存层只放得下两个
+        cache = EmbeddingCache(max_memory_bytes=16)
+        cache.put_many('m', ['a', 'b'], [[1.0, 1.0], [2.0, 2.0]])
+        cache.get_many('m', ['a'])
+        cache.put_many('m', ['c'], [[3.0, 3.0]])
+        self.assertEqual(cache.stats["memory_items"], 2)
+        self.assertEqual(cache.stats["memory_bytes"], 16)
+        a, b, c = cache.get_many('m', ['a', 'b', 'c'])
+        self.assertIsNotNone(a)
+        self.assertIsNone(b)
+        self.assertIsNotNone(c)
+        # 超过上限的单个向量不进入内存层
+        cache.put_many('m', ['big'], [[0.0] * 8])
+        self.assertEqual(cache.get_many('m', ['big']), [None])
+
+    def test_persists_across_instances(self):
+        cache = EmbeddingCache(self.path, max_memory_bytes=8)
+        cache.put_many('m', ['a', 'b'], [[1.0, 2.0], [3.0, 4.0]])
+        cache.close()
+
+        reopened = EmbeddingCache(self.path)
+        a, b = reopened.get_many('m', ['a', 'b'])
+        np.testing.assert_array_equal(a, [1.0, 2.0])
+        np.testing.assert_array_equal(b, [3.0, 4.0])
+        self.assertEqual(reopened.disk_hits, 2)
+        # 磁盘命中回填到内存层
+        reopened.get_many('m', ['a'])
+        self.assertEqual(reopened.memory_hits, 1)
+        reopened.close()
+
+    def test_worker_threads_share_one_connection(self):
+        cache = EmbeddingCache(self.path, max_memory_bytes=64)
+        errors = []
+
+        def work(n):
+            try:
+                for i in range(50):
+                    text = f'{n}-{i}'
+                    cache.put_many('m', [text], [[float(n), float(i)]])
+                    np.testing.assert_array_equal(cache.get_many('m', [text])[0], [n, i])
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=work, args=(n,)) for n in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+        self.assertLessEqual(cache.stats["memory_bytes"], 64)
+        cache.close()
+
+
+class EmbeddingCacheOffLoopTest(unittest.IsolatedAsyncioTestCase):
+    """EmbeddingRetrieve 在工作线程中读写缓存，SQLite 不阻塞事件循环"""
+
+    async def test_cache_is_accessed_off_the_event_loop(self):
+        configure(level=SILENT)
+        stub = StubServer().start()
+        os.environ["EMBEDDING_BASE_URL"] = stub.url
+        os.environ["EMBEDDING_KEY"] = "test"
+        threads = []
+
+        class RecordingCache(EmbeddingCache):
+            def get_many(self, model, texts):
+                threads.append(threading.get_ident())
+                return super().get_many(model, texts)
+
+            def put_many(self, model, texts, embeddings):
+                threads.append(threading.get_ident())
+                return super().put_many(model, texts, embeddings)
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            cache = RecordingCache(Path(tmp_dir) / 'embeddings.sqlite')
+            retriever = EmbeddingRetrieve('stub-embedding', cache=cache)
+            try:
+                first = await retriever.embed(['a', 'b'])
+                second = await retriever.embed(['b', 'a'])
+            finally:
+                await retriever.close()
+                cache.close()
+                stub.stop()
+
+        self.assertEqual(len(stub.embedding_requests), 1)
+        np.testing.assert_array_equal(second[0], first[1])
+        self.assertEqual(len(threads), 3)
+        self.assertNotIn(threading.get_ident(), threads)
+
+
+if __name__ == "__main__":
+    unittest.main()
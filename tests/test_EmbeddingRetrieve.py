@@ -0,0 +1,178 @@
+import asyncio
+import os
+import unittest
+from unittest import mock
+
+import httpx
+
+from BM25Index import BM25Index
+from EmbeddingRetrieve import EmbeddingRetrieve
+from utils import SILENT, configure
+from VectorStore import VectorStore
+
+from tests.stub_http_server import StubServer
+
+
+class Http2FallbackTest(unittest.TestCase):
+    def test_missing_h2_is_reported(self):
+        with mock.patch("importlib.util.find_spec", return_value=None), \
+                mock.patch("EmbeddingRetrieve.warning") as warning:
+            EmbeddingRetrieve("stub-embedding")
+            EmbeddingRetrieve("stub-embedding", http2=False)
+        self.assertEqual(warning.call_count, 1)
+        self.assertIn("h2", warning.call_args.args[0])
+
+
+class EmbeddingBatchingTest(unittest.IsolatedAsyncioTestCase):
+    """用本地 stub 嵌入服务验证批量、并发上限和重试"""
+
+    async def asyncSetUp(self):
+        configure(level=SILENT)
+        self.stub = StubServer().start()
+        os.environ["EMBEDDING_BASE_URL"] = self.stub.url
+        os.environ["EMBEDDING_KEY"] = "test"
+        self.retriever = EmbeddingRetrieve(
+            "stub-embedding", batch_size=7, max_concurrency=2, max_retries=2, backoff_base=0.01,
+        )
+
+    async def asyncTearDown(self):
+        await self.retriever.close()
+        self.stub.stop()
+
+    async def test_documents_are_embedded_in_bounded_concurrent_batches(self):
+        self.stub.embedding_delay = 0.05
+        documents = [f"document {i}" for i in range(25)]
+        self.assertEqual(await self.retriever.add_documents(documents), 25)
+
+        sizes = [len(request["input"]["texts"]) for request in self.stub.embedding_requests]
+        self.assertEqual(sorted(sizes), [4, 7, 7, 7])
+        self.assertEqual(self.stub.embedding_max_in_flight, 2)
+        self.assertEqual(await self.retriever.retrieve("document 3", 1), ["document 3"])
+
+    async def test_duplicate_texts_are_requested_once(self):
+        embeddings = await self.retriever.embed(["a", "b", "a", "a"])
+        self.assertEqual(self.stub.embedding_requests[0]["input"]["texts"], ["a", "b"])
+        self.assertEqual(embeddings[0], embeddings[2])
+
+    async def test_retryable_status_codes_are_retried(self):
+        self.stub.embedding_failures = [503, 429]
+        self.assertEqual(len(await self.retriever.embed(["a"])), 1)
+        self.assertEqual(len(self.stub.embedding_requests), 3)
+
+    async def test_retries_are_bounded(self):
+        self.stub.embedding_failures = [503, 503, 503, 503]
+        with self.assertRaises(httpx.HTTPStatusError):
+            await self.retriever.embed(["a"])
+        self.assertEqual(len(self.stub.embedding_requests), 3)
+
+    async def test_client_errors_are_not_retried(self):
+        self.stub.embedding_failures = [400]
+        with self.assertRaises(httpx.HTTPStatusError):
+            await self.retriever.embed(["a"])
+        self.assertEqual(len(self.stub.embedding_requests), 1)
+
+
+class DocumentStreamTest(unittest.IsolatedAsyncioTestCase):
+    """add_document_stream 中途失败或某个批次被取消时停止读取并取消其余批次"""
+
+    async def asyncSetUp(self):
+        configure(level=SILENT)
+        self.retriever = EmbeddingRetrieve("stub-embedding", batch_size=2, max_concurrency=2)
+        self.calls = []
+
+    async def asyncTearDown(self):
+        await self.retriever.close()
+
+    async def slow_add(self, documents, metadatas=None):
+        self.calls.append(documents)
+        await asyncio.sleep(0.05)
+        return len(documents)
+
+    def items(self, count=10):
+        return [(f"doc {i}", {"part": i}) for i in range(count)]
+
+    async def test_batches_are_summed(self):
+        with mock.patch.object(self.retriever, "add_documents", self.slow_add):
+            self.assertEqual(await self.retriever.add_document_stream(self.items(9)), 9)
+        self.assertEqual([len(batch) for batch in self.calls], [2, 2, 2, 2, 1])
+
+    async def test_cancelled_batch_stops_the_stream(self):
+        async def add(documents, metadatas=None):
+            if not self.calls:
+                self.calls.append(documents)
+                # 模拟批次任务被外部取消
+                asyncio.current_task().cancel()
+                await asyncio.sleep(0)
+            return await self.slow_add(documents, metadatas)
+
+        with mock.patch.object(self.retriever, "add_documents", add):
+            with self.assertRaises(asyncio.CancelledError):
+                await self.retriever.add_document_stream(self.items())
+        # 第三批等待名额时发现第一批已取消，不再提交
+        self.assertEqual(len(self.calls), 2)
+        self.assertFalse([t for t in asyncio.all_tasks() if t is not asyncio.current_task()])
+
+    async def test_failed_batch_is_raised(self):
+        async def add(documents, metadatas=None):
+            if not self.calls:
+                self.calls.append(documents)
+                raise ValueError("bad batch")
+            return await self.slow_add(documents, metadatas)
+
+        with mock.patch.object(self.retriever, "add_documents", add):
+            with self.assertRaisesRegex(ValueError, "bad batch"):
+                await self.retriever.add_document_stream(self.items())
+        self.assertEqual(len(self.calls), 2)
+
+
+class HybridRerankTest(unittest.IsolatedAsyncioTestCase):
+    """用本地 stub 嵌入/重排序服务验证混合检索和两阶段重排序"""
+
+    async def asyncSetUp(self):
+        configure(level=SILENT)
+        self.stub = StubServer().start()
+        os.environ["EMBEDDING_BASE_URL"] = self.stub.url
+        os.environ["EMBEDDING_KEY"] = "test"
+        self.retriever = EmbeddingRetrieve(
+            "stub-embedding",
+            rerank_model="stub-rerank",
+            vector_store=VectorStore(lexical_index=BM25Index()),
+            max_retries=0,
+            rerank_candidates=8,
+            rerank_timeout=0.3,
+        )
+        self.documents = [f"note {i} about topic {i % 7}" for i in range(40)]
+        self.documents[23] = "Chelsey Dietrich lives in Roscoeview"
+        await self.retriever.add_documents(self.documents)
+
+    async def asyncTearDown(self):
+        await self.retriever.close()
+        self.stub.stop()
+
+    async def test_hybrid_finds_exact_keywords(self):
+        self.assertEqual(await self.retriever.retrieve("Chelsey Dietrich", 1, mode="lexical"), [self.documents[23]])
+        # RRF 融合后 BM25 第一名至少与向量第一名并列，一定在前两名中
+        self.assertIn(self.documents[23], await self.retriever.retrieve("Chelsey Dietrich", 2, mode="hybrid"))
+
+    async def test_rerank_scores_only_the_candidate_budget(self):
+        self.stub.rerank_scores = lambda query, documents: [float(len(document)) for document in documents]
+        results = await self.retriever.retrieve("topic 3", 3, rerank=True)
+
+        self.assertEqual(len(self.stub.rerank_requests), 1)
+        candidates = self.stub.rerank_requests[0]["input"]["documents"]
+        self.assertEqual(len(candidates), 8)
+        self.assertEqual(results, sorted(candidates, key=len, reverse=True)[:3])
+
+    async def test_rerank_failure_falls_back_to_first_stage_order(self):
+        first_stage = await self.retriever.retrieve("topic 3", 3)
+        self.stub.rerank_failures = [400]
+        self.assertEqual(await self.retriever.retrieve("topic 3", 3, rerank=True), first_stage)
+
+    async def test_rerank_timeout_falls_back_to_first_stage_order(self):
+        first_stage = await self.retriever.retrieve("topic 3", 3)
+        self.stub.rerank_delay = 1.0
+        self.assertEqual(await self.retriever.retrieve("topic 3", 3, rerank=True), first_stage)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,93 @@
+import unittest
+
+import numpy as np
+
+from IVFIndex import IVFIndex, recall_report
+from VectorStore import VectorStore
+
+
+def clustered(count, dim=16, seed=0):
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(10, dim))
+    data = (centers[rng.integers(0, 10, count)] + 0.3 * rng.normal(size=(count, dim))).astype(np.float32)
+    queries = data[rng.choice(count, 20, replace=False)] + 0.05 * rng.normal(size=(20, dim))
+    return data, queries.astype(np.float32)
+
+
+def build(data, index):
+    store = VectorStore(index=index)
+    store.add_items([{'embedding': v, 'document': f'doc-{i}'} for i, v in enumerate(data)])
+    return store
+
+
+class IVFIndexTest(unittest.TestCase):
+    def test_probing_every_list_equals_exact_search(self):
+        data, queries = clustered(1000)
+        index = IVFIndex(nlist=16, train_size=200)
+        store = build(data, index)
+        self.assertTrue(index.is_trained)
+        self.assertEqual(index.nlist, 16)
+        exact = store.search_indices(queries, 10, exact=True)
+        for got, expected in zip(store.search_indices(queries, 10, nprobe=16), exact):
+            np.testing.assert_array_equal(got, expected)
+
+    def test_every_row_is_in_exactly_one_list(self):
+        data, queries = clustered(1000)
+        index = IVFIndex(nlist=16, train_size=200)
+        build(data, index)
+        rows = index.probe(queries[0] / np.linalg.norm(queries[0]), nprobe=16)
+        np.testing.assert_array_equal(np.sort(rows), np.arange(1000))
+
+    def test_export_and_load_keep_probe_results(self):
+        data, queries = clustered(1000)
+        index = IVFIndex(nlist=16, train_size=200)
+        build(data, index)
+        restored = IVFIndex(nlist=16)
+        restored.load_state(index.export_state())
+        self.assertEqual(restored.nlist, index.nlist)
+        for query in queries:
+            query = query / np.linalg.norm(query)
+            for nprobe in (1, 4):
+                np.testing.assert_array_equal(restored.probe(query, nprobe), index.probe(query, nprobe))
+
+    def test_automatic_nlist_retrains_after_4x_growth(self):
+        data, _ = clustered(1600)
+        index = IVFIndex(train_size=100)
+        store = VectorStore(index=index)
+        store.add_items([{'embedding': v, 'document': ''} for v in data[:100]])
+        self.assertEqual(index.nlist, int(4 * np.sqrt(100)))
+        self.assertFalse(index.needs_retrain(399))
+        self.assertTrue(index.needs_retrain(400))
+
+        store.add_items([{'embedding': v, 'document': ''} for v in data[100:400]])
+        self.assertEqual(index.nlist, int(4 * np.sqrt(400)))
+        self.assertFalse(index.needs_retrain(400))
+        # 重训后所有行重新分配，没有丢失或重复
+        rows = index.probe(np.eye(16, dtype=np.float32)[0], nprobe=index.nlist)
+        np.testing.assert_array_equal(np.sort(rows), np.arange(400))
+
+    def test_fixed_nlist_never_retrains(self):
+        index = IVFIndex(nlist=4, train_size=10)
+        index.train(np.eye(8, dtype=np.float32)[np.arange(10) % 8])
+        self.assertFalse(index.needs_retrain(10 ** 6))
+
+    def test_add_before_training_is_rejected(self):
+        with self.assertRaises(RuntimeError):
+            IVFIndex().add(np.arange(1), np.ones((1, 4), dtype=np.float32))
+
+
+class RecallReportTest(unittest.TestCase):
+    def test_recall_reaches_one_when_probing_every_list(self):
+        data, queries = clustered(1000)
+        store = build(data, IVFIndex(nlist=16, train_size=200))
+        report = recall_report(store, queries, top_k=10, nprobe_values=[1, 4, 16])
+        self.assertEqual([row["nprobe"] for row in report], [0, 1, 4, 16])
+        self.assertEqual(report[0]["recall"], 1.0)
+        self.assertEqual(report[-1]["recall"], 1.0)
+        recalls = [row["recall"] for row in report[1:]]
+        self.assertEqual(recalls, sorted(recalls))
+        self.assertTrue(all(row["latency_ms"] >= 0 for row in report))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,174 @@
+import asyncio
+import os
+import tempfile
+import unittest
+from pathlib import Path
+
+from DocumentChunker import DocumentChunker
+from EmbeddingRetrieve import EmbeddingRetrieve
+from KnowledgeBase import KnowledgeBase
+from utils import SILENT, configure
+
+from tests.stub_http_server import StubServer
+
+
+class EditingChunker(DocumentChunker):
+    """在分块开始前改写文件，模拟哈希与分块之间的并发编辑"""
+
+    def __init__(self, edits, **kwargs):
+        super().__init__(**kwargs)
+        self.edits = edits
+
+    def chunk_file(self, path, digest=None):
+        if path in self.edits:
+            Path(path).write_text(self.edits.pop(path), encoding='utf-8')
+        return super().chunk_file(path, digest)
+
+
+class KnowledgeBaseSyncTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        configure(level=SILENT)
+        self.stub = StubServer().start()
+        os.environ["EMBEDDING_BASE_URL"] = self.stub.url
+        os.environ["EMBEDDING_KEY"] = "test"
+        self.tmp = tempfile.TemporaryDirectory()
+        self.knowledge_dir = Path(self.tmp.name) / 'knowledge'
+        self.index_dir = Path(self.tmp.name) / 'index'
+        self.knowledge_dir.mkdir()
+        self.retrievers = []
+
+    async def asyncTearDown(self):
+        for retriever in self.retrievers:
+            await retriever.close()
+        self.stub.stop()
+        self.tmp.cleanup()
+
+    def write(self, name, text):
+        (self.knowledge_dir / name).write_text(text, encoding='utf-8')
+        return str(self.knowledge_dir / name)
+
+    def open(self, **kwargs):
+        kwargs.setdefault('chunker', DocumentChunker(chunk_size=64, overlap=0))
+        knowledge_base = KnowledgeBase(self.knowledge_dir, self.index_dir, **kwargs)
+        retriever = EmbeddingRetrieve('stub-embedding', vector_store=knowledge_base.vector_store)
+        self.retrievers.append(retriever)
+        return knowledge_base, retriever
+
+    def sources(self, knowledge_base):
+        store = knowledge_base.vector_store
+        return sorted({store.get_metadata(int(row))['source'] for row in store.filter_rows({})})
+
+    async def test_add_modify_delete(self):
+        a = self.write('a.md', '机器学习是一种人工智能技术。')
+        b = self.write('b.md', 'Python 是一种流行的编程语言。')
+        self.write('ignored.bin', 'not indexed')
+        knowledge_base, retriever = self.open()
+
+        stats = await knowledge_base.sync(retriever)
+        self.assertEqual((stats["added"], stats["updated"], stats["removed"]), (2, 0, 0))
+        self.assertEqual(self.sources(knowledge_base), [a, b])
+        requests = len(self.stub.embedding_requests)
+
+        # 没有变化：不读文件，不请求嵌入
+        stats = await knowledge_base.sync(retriever)
+        self.assertEqual(stats["unchanged"], 2)
+        self.assertEqual(stats["chunks"], 0)
+        # 只改 mtime：重新哈希后发现内容未变，仍然不请求嵌入
+        os.utime(a, ns=(0, 1))
+        self.assertEqual((await knowledge_base.sync(retriever))["unchanged"], 2)
+        self.assertEqual(len(self.stub.embedding_requests), requests)
+
+        self.write('a.md', '深度学习是机器学习的一个分支。')
+        os.remove(b)
+        stats = await knowledge_base.sync(retriever)
+        self.assertEqual((stats["added"], stats["updated"], stats["removed"]), (0, 1, 1))
+        self.assertEqual(self.sources(knowledge_base), [a])
+        self.assertEqual(knowledge_base.files, [a])
+        self.assertEqual(await retriever.retrieve('深度学习是机器学习的一个分支。', 1), ['深度学习是机器学习的一个分支。'])
+
+    async def test_index_is_reloaded_without_reembedding(self):
+        a = self.write('a.md', '第一句。第二句。第三句。')
+        knowledge_base, retriever = self.open()
+        await knowledge_base.sync(retriever)
+        requests = len(self.stub.embedding_requests)
+
+        reopened, retriever = self.open()
+        self.assertEqual(reopened.files, [a])
+        stats = await reopened.sync(retriever)
+        self.assertEqual(stats["unchanged"], 1)
+        self.assertEqual(len(self.stub.embedding_requests), requests)
+        self.assertEqual(len(reopened.vector_store), len(knowledge_base.vector_store))
+
+        # 分块参数变化时丢弃旧索引
+        rebuilt, retriever = self.open(chunker=DocumentChunker(chunk_size=4, overlap=0))
+        self.assertEqual(rebuilt.files, [])
+        self.assertEqual((await rebuilt.sync(retriever))["added"], 1)
+
+    async def test_edit_between_hash_and_chunk_is_not_indexed_under_the_old_hash(self):
+        a = self.write('a.md', '旧内容。')
+        knowledge_base, retriever = self.open(chunker=EditingChunker({a: '新内容。'}, chunk_size=8, overlap=0))
+        stats = await knowledge_base.sync(retriever)
+        self.assertEqual(stats["failed"], 1)
+        self.assertEqual(knowledge_base.files, [])
+        self.assertEqual(len(knowledge_base.vector_store), 0)
+
+        # 下一次 sync 以当前内容重新索引，清单哈希与块一致
+        stats = await knowledge_base.sync(retriever)
+        self.assertEqual(stats["added"], 1)
+        self.assertEqual(await retriever.retrieve('新内容。', 1), ['新内容。'])
+        self.assertEqual((await knowledge_base.sync(retriever))["unchanged"], 1)
+
+    async def test_unreadable_file_is_retried_next_sync(self):
+        a = self.write('a.md', 'valid')
+        (self.knowledge_dir / 'bad.md').write_bytes(b'\xff\xfe broken utf-8')
+        knowledge_base, retriever = self.open()
+        stats = await knowledge_base.sync(retriever)
+        self.assertEqual((stats["added"], stats["failed"]), (2, 1))
+        self.assertEqual(knowledge_base.files, [a])
+        self.assertEqual(self.sources(knowledge_base), [a])
+
+
+class KnowledgeBaseQueueTest(unittest.IsolatedAsyncioTestCase):
+    """分块队列有界：嵌入慢时读取线程等待，而不是把整个文件读进内存"""
+
+    async def test_chunk_queue_applies_backpressure(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            knowledge_dir = Path(tmp_dir) / 'knowledge'
+            knowledge_dir.mkdir()
+            for i in range(3):
+                (knowledge_dir / f'{i}.md').write_text(' '.join(f'w{j}' for j in range(200)), encoding='utf-8')
+
+            produced = []
+
+            class CountingChunker(DocumentChunker):
+                def chunk_file(self, path, digest=None):
+                    for chunk in super().chunk_file(path, digest):
+                        produced.append(chunk)
+                        yield chunk
+
+            knowledge_base = KnowledgeBase(
+                knowledge_dir, Path(tmp_dir) / 'index',
+                chunker=CountingChunker(chunk_size=4, overlap=0, mode="token"), max_workers=2, queue_size=2,
+            )
+            lead = []
+
+            class SlowRetriever:
+                vector_store = knowledge_base.vector_store
+
+                async def add_document_stream(self, items):
+                    consumed = 0
+                    async for document, metadata in items:
+                        consumed += 1
+                        lead.append(len(produced) - consumed)
+                        self.vector_store.add_item({'embedding': [1.0, 0.0], 'document': document, 'metadata': metadata})
+                        await asyncio.sleep(0.001)
+                    return consumed
+
+            stats = await knowledge_base.sync(SlowRetriever())
+            self.assertEqual(stats["chunks"], 150)
+            # 队列容量 + 每个读取线程手里的一个块
+            self.assertLessEqual(max(lead), 2 + 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
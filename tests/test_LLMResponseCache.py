@@ -0,0 +1,112 @@
+import tempfile
+import threading
+import unittest
+from pathlib import Path
+
+from openai import AsyncOpenAI
+
+from ChatOpenAI import ChatOpenAI
+from LLMResponseCache import LLMResponseCache
+from utils import SILENT, configure
+
+from tests.stub_http_server import StubServer
+from tests.test_ChatOpenAI import tool_call_script
+
+EVENTS = [
+    {"type": "content", "delta": "晴，"},
+    {"type": "done", "content": "晴，", "tool_calls": []},
+]
+
+
+class LLMResponseCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = Path(self.tmp.name) / 'llm.sqlite'
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_key_ignores_dict_order(self):
+        a = LLMResponseCache.key("m", [{"role": "user", "content": "hi"}], [])
+        b = LLMResponseCache.key("m", [{"content": "hi", "role": "user"}], [])
+        self.assertEqual(a, b)
+        self.assertNotEqual(a, LLMResponseCache.key("other", [{"role": "user", "content": "hi"}], []))
+
+    def test_lru_and_persistence(self):
+        cache = LLMResponseCache(self.path, max_memory_items=1)
+        cache.put("a", "m", EVENTS)
+        cache.put("b", "m", EVENTS)
+        self.assertEqual(cache.stats["memory_items"], 1)
+        # a 已被挤出内存层，从 SQLite 读回
+        self.assertEqual(cache.get("a"), EVENTS)
+        self.assertIsNone(cache.get("missing"))
+        self.assertEqual((cache.memory_hits, cache.disk_hits, cache.misses), (0, 1, 1))
+        cache.close()
+
+        replay = LLMResponseCache(self.path, mode="replay")
+        self.assertEqual(replay.get("b"), EVENTS)
+        replay.close()
+
+    def test_unknown_mode_is_rejected(self):
+        with self.assertRaises(ValueError):
+            LLMResponseCache(mode="write")
+
+
+class ChatOpenAIReplayTest(unittest.IsolatedAsyncioTestCase):
+    """录制后回放：事件与录制时一致，消息历史只追加一次，且不访问网络"""
+
+    async def asyncSetUp(self):
+        configure(level=SILENT)
+        self.stub = StubServer().start()
+        self.stub.chat_script = tool_call_script
+        self.client = AsyncOpenAI(base_url=f"{self.stub.url}/v1", api_key="test")
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = Path(self.tmp.name) / 'llm.sqlite'
+
+    async def asyncTearDown(self):
+        await self.client.close()
+        self.stub.stop()
+        self.tmp.cleanup()
+
+    async def run_chat(self, cache):
+        llm = ChatOpenAI('stub', 'system prompt', client=self.client, response_cache=cache)
+        events = [event async for event in llm.stream('fetch something')]
+        return events, llm.get_messages()
+
+    async def test_replay_matches_recording_and_appends_once(self):
+        recorder = LLMResponseCache(self.path, mode="record")
+        recorded, recorded_history = await self.run_chat(recorder)
+        recorder.close()
+        self.assertEqual(len(self.stub.chat_requests), 1)
+        self.assertEqual(recorded[-1]["type"], "done")
+
+        threads = []
+
+        class RecordingCache(LLMResponseCache):
+            def get(self, key):
+                threads.append(threading.get_ident())
+                return super().get(key)
+
+        replay = RecordingCache(self.path, mode="replay")
+        replayed, replayed_history = await self.run_chat(replay)
+        replay.close()
+
+        self.assertEqual(replayed, recorded)
+        self.assertEqual(replayed_history, recorded_history)
+        self.assertEqual(sum(1 for m in replayed_history if m["role"] == "assistant"), 1)
+        self.assertEqual(len(self.stub.chat_requests), 1)
+        self.assertEqual(replay.disk_hits, 1)
+        # SQLite 查询在工作线程中执行
+        self.assertEqual(len(threads), 1)
+        self.assertNotEqual(threads[0], threading.get_ident())
+
+    async def test_replay_miss_raises(self):
+        replay = LLMResponseCache(self.path, mode="replay")
+        with self.assertRaises(LookupError):
+            await self.run_chat(replay)
+        replay.close()
+        self.assertEqual(self.stub.chat_requests, [])
+
+
+if __name__ == "__main__":
+    unittest.main()
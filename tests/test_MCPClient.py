@@ -0,0 +1,91 @@
+import asyncio
+import subprocess
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+
+from MCPClient import MCPClient
+from MCPClientPool import MCPClientPool
+from ToolResultCache import ToolResultCache
+
+STUB_SERVER = str(Path(__file__).with_name('stub_mcp_server.py'))
+
+
+def text(result) -> str:
+    return result.content[0].text
+
+
+class MCPClientReconnectTest(unittest.IsolatedAsyncioTestCase):
+    """用本地 stub 服务器验证断线重连与重试策略"""
+
+    async def asyncSetUp(self):
+        self.tmp = Path(tempfile.mkdtemp())
+        self.cache = ToolResultCache({'read_once_crash': 60})
+        self.client = MCPClient('stub', sys.executable, [STUB_SERVER], result_cache=self.cache)
+        await self.client.init()
+
+    async def asyncTearDown(self):
+        await self.client.close()
+
+    def runs(self, name: str) -> int:
+        path = self.tmp / name
+        return len(path.read_text(encoding='utf-8').splitlines()) if path.exists() else 0
+
+    async def test_reconnects_when_server_died_before_the_call(self):
+        subprocess.run(['pkill', '-f', STUB_SERVER])
+        await asyncio.sleep(0.5)
+        self.assertFalse(self.client.is_alive)
+        self.assertIn('slept', text(await self.client.call_tool_result('slow', {'seconds': 0.01})))
+        self.assertTrue(self.client.is_alive)
+
+    async def test_non_idempotent_call_is_not_replayed_after_connection_loss(self):
+        marker = str(self.tmp / 'crash')
+        with self.assertRaises(ConnectionError):
+            await self.client.call_tool_result('crash_after_write', {'path': marker})
+        self.assertEqual(self.runs('crash'), 1)
+        # 重连后后续调用可以正常使用
+        self.assertIn('slept', text(await self.client.call_tool_result('slow', {'seconds': 0.01})))
+
+    async def test_idempotent_call_is_retried_after_connection_loss(self):
+        marker = str(self.tmp / 'read')
+        self.assertEqual(text(await self.client.call_tool_result('read_once_crash', {'path': marker})), 'recovered')
+        self.assertEqual(self.runs('read'), 2)
+
+    async def test_pool_health_check_restarts_dead_server(self):
+        pool = MCPClientPool(health_check_interval=None)
+        await pool.start([self.client])
+        subprocess.run(['pkill', '-f', STUB_SERVER])
+        await asyncio.sleep(0.5)
+        await pool.check_health()
+        self.assertTrue(self.client.is_alive)
+        await pool.close()
+
+    async def test_pool_does_not_reconnect_a_busy_server_too_early(self):
+        pool = MCPClientPool(health_check_interval=None, ping_timeout=0.1, max_ping_failures=3)
+        await pool.start([self.client])
+        call = asyncio.create_task(self.client.call_tool_result('busy', {'seconds': 1.0}))
+        await asyncio.sleep(0.1)
+        self.assertEqual(self.client.in_flight, 1)
+
+        # ping 超时但调用在途：前两次只记录失败，不中断长调用
+        for _ in range(2):
+            self.assertEqual(await pool.check_health(), {'stub': False})
+        self.assertEqual(text(await call), 'busy 1.0')
+        self.assertEqual(self.client.in_flight, 0)
+        # ping 恢复后失败计数清零
+        self.assertEqual(await pool.check_health(), {'stub': True})
+
+        call = asyncio.create_task(self.client.call_tool_result('busy', {'seconds': 1.0}))
+        await asyncio.sleep(0.1)
+        for _ in range(3):
+            await pool.check_health()
+        # 连续失败达到上限：重连，在途调用被中断
+        with self.assertRaises(ConnectionError):
+            await call
+        self.assertTrue(self.client.is_alive)
+        await pool.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
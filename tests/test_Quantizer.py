@@ -0,0 +1,148 @@
+import tempfile
+import unittest
+
+import numpy as np
+
+from Quantizer import ProductQuantizer, ScalarQuantizer, quantization_report
+from VectorStore import VectorStore
+
+
+def clustered(count=2000, dim=32, seed=0):
+    """带簇结构的归一化向量和靠近语料点的查询"""
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(20, dim))
+    data = (centers[rng.integers(0, 20, count)] + 0.3 * rng.normal(size=(count, dim))).astype(np.float32)
+    queries = data[rng.choice(count, 50, replace=False)] + 0.05 * rng.normal(size=(50, dim))
+    data /= np.linalg.norm(data, axis=1, keepdims=True)
+    return data, queries.astype(np.float32)
+
+
+def build(data, **kwargs):
+    store = VectorStore(**kwargs)
+    store.add_items([{'embedding': v, 'document': str(i)} for i, v in enumerate(data)])
+    return store
+
+
+def recall(approx, exact):
+    return sum(len(np.intersect1d(a, e)) for a, e in zip(approx, exact)) / sum(len(e) for e in exact)
+
+
+class ScalarQuantizerTest(unittest.TestCase):
+    def test_round_trip_error_is_within_half_a_step(self):
+        data, _ = clustered()
+        quantizer = ScalarQuantizer()
+        quantizer.train(data)
+        step = quantizer.export_state()["scale"]
+        codes = quantizer.encode(data)
+        self.assertEqual(codes.dtype, np.int8)
+        self.assertEqual(codes.shape, data.shape)
+        self.assertTrue(np.all(np.abs(quantizer.decode(codes) - data) <= step / 2 + 1e-6))
+
+    def test_score_matches_decoded_inner_product(self):
+        data, queries = clustered()
+        quantizer = ScalarQuantizer(block_size=300)
+        quantizer.train(data)
+        codes = quantizer.encode(data)
+        np.testing.assert_allclose(
+            quantizer.score(queries, codes), queries @ quantizer.decode(codes).T, rtol=1e-4, atol=1e-4
+        )
+
+
+class ProductQuantizerTest(unittest.TestCase):
+    def test_reconstruction_is_much_closer_than_the_mean(self):
+        data, _ = clustered()
+        quantizer = ProductQuantizer(m=8)
+        quantizer.train(data)
+        codes = quantizer.encode(data)
+        self.assertEqual(codes.shape, (len(data), 8))
+        self.assertEqual(codes.dtype, np.uint8)
+        error = np.mean(np.sum((quantizer.decode(codes) - data) ** 2, axis=1))
+        spread = np.mean(np.sum((data - data.mean(axis=0)) ** 2, axis=1))
+        self.assertLess(error, 0.2 * spread)
+
+    def test_lookup_and_batched_scores_match_decoded_inner_product(self):
+        data, queries = clustered()
+        quantizer = ProductQuantizer(m=8, block_size=300)
+        quantizer.train(data)
+        codes = quantizer.encode(data)
+        # 1 个查询走查表累加，50 个查询（>= 4 * dsub）走重建 + 矩阵乘
+        for batch in (queries[:1], queries):
+            with self.subTest(queries=len(batch)):
+                np.testing.assert_allclose(
+                    quantizer.score(batch, codes), batch @ quantizer.decode(codes).T, rtol=1e-4, atol=1e-4
+                )
+
+    def test_dimension_must_split_into_subspaces(self):
+        with self.assertRaises(ValueError):
+            ProductQuantizer(m=5).train(np.ones((300, 32), dtype=np.float32))
+
+
+class QuantizedVectorStoreTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.data, cls.queries = clustered()
+        cls.exact = build(cls.data).search_indices(cls.queries, 10)
+
+    def test_compression_ratio(self):
+        count, dim = self.data.shape
+        self.assertEqual(build(self.data).vector_nbytes, count * dim * 4 * 2)  # 原始 + 归一化
+        self.assertEqual(build(self.data, quantizer=ScalarQuantizer()).vector_nbytes, count * dim)
+        self.assertEqual(build(self.data, quantizer=ProductQuantizer(m=8, train_size=1000)).vector_nbytes, count * 8)
+        # 重排序额外保留 float32 归一化向量
+        self.assertEqual(
+            build(self.data, quantizer=ScalarQuantizer(), rescore_factor=4).vector_nbytes, count * dim * 5
+        )
+
+    def test_recall_against_exact_search(self):
+        cases = {
+            "int8": ({"quantizer": ScalarQuantizer()}, 0.9),
+            "int8+rescore": ({"quantizer": ScalarQuantizer(), "rescore_factor": 4}, 0.99),
+            "pq": ({"quantizer": ProductQuantizer(m=8, train_size=1000)}, 0.3),
+            "pq+rescore": ({"quantizer": ProductQuantizer(m=8, train_size=1000), "rescore_factor": 16}, 0.95),
+        }
+        measured = {}
+        for name, (kwargs, minimum) in cases.items():
+            measured[name] = recall(build(self.data, **kwargs).search_indices(self.queries, 10), self.exact)
+            with self.subTest(name=name):
+                self.assertGreaterEqual(measured[name], minimum)
+        self.assertGreaterEqual(measured["int8+rescore"], measured["int8"])
+        self.assertGreater(measured["pq+rescore"], measured["pq"])
+
+    def test_single_and_batched_search_agree(self):
+        store = build(self.data, quantizer=ProductQuantizer(m=8, train_size=1000), rescore_factor=4)
+        batched = store.search_indices(self.queries, 10)
+        for query, rows in zip(self.queries, batched):
+            np.testing.assert_array_equal(store.search_indices([query], 10)[0], rows)
+
+    def test_rescore_load_without_normalized_vectors_is_rejected(self):
+        store = build(self.data, quantizer=ScalarQuantizer())
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            store.save(tmp_dir)
+            with self.assertRaisesRegex(ValueError, "normalized.npy"):
+                VectorStore.load(tmp_dir, rescore_factor=4)
+            loaded = VectorStore.load(tmp_dir)
+            for expected, got in zip(store.search_indices(self.queries, 10), loaded.search_indices(self.queries, 10)):
+                np.testing.assert_array_equal(got, expected)
+
+    def test_rescore_round_trip(self):
+        store = build(self.data, quantizer=ScalarQuantizer(), rescore_factor=4)
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            store.save(tmp_dir)
+            loaded = VectorStore.load(tmp_dir, rescore_factor=4)
+            for expected, got in zip(store.search_indices(self.queries, 10), loaded.search_indices(self.queries, 10)):
+                np.testing.assert_array_equal(got, expected)
+
+
+class QuantizationReportTest(unittest.TestCase):
+    def test_report_leaves_caller_quantizer_untouched(self):
+        data, queries = clustered(count=500)
+        quantizer = ProductQuantizer(m=8)
+        rows = quantization_report(data, queries, top_k=5, configs={"pq": {"quantizer": quantizer}})
+        self.assertEqual(quantizer.train_size, 8192)
+        self.assertFalse(quantizer.is_trained)
+        self.assertTrue(rows[0]["trained"])
+        self.assertEqual(rows[0]["compression"], 32 * 4 / 8)
+
+
+if __name__ == "__main__":
+    unittest.main()
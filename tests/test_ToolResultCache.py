@@ -0,0 +1,63 @@
+import asyncio
+import unittest
+from types import SimpleNamespace
+
+from ToolResultCache import ToolResultCache
+
+
+class ToolResultCacheTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.cache = ToolResultCache({"read_file": 60, "list_directory": 60})
+        self.calls = []
+
+    def fetch(self, tool, args, delay=0.0):
+        async def __fetch():
+            self.calls.append((tool, args))
+            await asyncio.sleep(delay)
+            return SimpleNamespace(isError=False, content=f"{tool} {args} #{len(self.calls)}")
+        return __fetch
+
+    async def call(self, tool, args, delay=0.0):
+        return await self.cache.call("file", tool, args, self.fetch(tool, args, delay))
+
+    async def test_move_directory_invalidates_descendants(self):
+        await self.call("read_file", {"path": "/data/notes/a.md"})
+        await self.call("list_directory", {"path": "/data/notes/sub"})
+        await self.call("read_file", {"path": "/data/notes-other/b.md"})
+        await self.call("move_file", {"source": "/data/notes", "destination": "/data/archive"})
+        self.assertEqual(self.cache.stats["items"], 1)
+
+        await self.call("read_file", {"path": "/data/notes/a.md"})
+        await self.call("read_file", {"path": "/data/notes-other/b.md"})
+        self.assertEqual(self.cache.stats["hits"], 1)
+
+    async def test_concurrent_calls_share_one_request(self):
+        await asyncio.gather(*(self.call("read_file", {"path": "/a"}, delay=0.05) for _ in range(3)))
+        self.assertEqual(len(self.calls), 1)
+        self.assertEqual(self.cache.stats["hits"], 2)
+
+    async def test_follower_takes_over_when_leader_is_cancelled(self):
+        leader = asyncio.create_task(self.call("read_file", {"path": "/a"}, delay=0.2))
+        await asyncio.sleep(0.01)
+        follower = asyncio.create_task(self.call("read_file", {"path": "/a"}, delay=0.01))
+        await asyncio.sleep(0.01)
+        leader.cancel()
+        result = await follower
+        self.assertTrue(result.content.startswith("read_file"))
+        self.assertEqual(len(self.calls), 2)
+        with self.assertRaises(asyncio.CancelledError):
+            await leader
+
+    async def test_cancelled_follower_does_not_cancel_leader(self):
+        leader = asyncio.create_task(self.call("read_file", {"path": "/a"}, delay=0.05))
+        await asyncio.sleep(0.01)
+        follower = asyncio.create_task(self.call("read_file", {"path": "/a"}))
+        await asyncio.sleep(0.01)
+        follower.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await follower
+        self.assertTrue((await leader).content.startswith("read_file"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,46 @@
+import json
+import tempfile
+import unittest
+
+from mcp.types import TextContent
+
+from ToolResultProcessor import ToolResultProcessor
+
+
+class ReadArtifactBoundsTest(unittest.TestCase):
+    """read_artifact 的参数来自模型，任何取值都不能读出超过一页的内容"""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.processor = ToolResultProcessor(self.tmp.name, max_chars=100, page_bytes=256)
+        block = json.loads(self.processor.process("fetch", [TextContent(type="text", text="页" * 3000)]))["content"][0]
+        self.artifact = block["artifact"]
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def read(self, **kwargs):
+        return json.loads(self.processor.read_artifact(self.artifact, **kwargs))
+
+    def test_limit_is_clamped_to_page_bytes(self):
+        for limit in (None, 0, -1, 10 ** 9):
+            with self.subTest(limit=limit):
+                page = self.read(offset=0, limit=limit)
+                self.assertLessEqual(len(page["text"].encode('utf-8')), 256)
+                # 即使 limit 很小每页也会前进
+                self.assertGreater(page["next_offset"], 0)
+
+    def test_negative_offset_is_rejected(self):
+        self.assertIn("error", self.read(offset=-1))
+
+    def test_pages_cover_the_whole_artifact(self):
+        text, offset = "", 0
+        while offset is not None:
+            page = self.read(offset=offset)
+            text += page["text"]
+            offset = page["next_offset"]
+        self.assertEqual(text, "页" * 3000)
+
+
+if __name__ == "__main__":
+    unittest.main()
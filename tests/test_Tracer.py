@@ -0,0 +1,158 @@
+import asyncio
+import contextvars
+import json
+import tempfile
+import unittest
+from pathlib import Path
+
+from Tracer import NOOP_SPAN, InMemoryCollector, JsonlExporter, Tracer, _current_span
+
+
+class SpanPropagationTest(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.collector = InMemoryCollector()
+        self.tracer = Tracer()
+        self.tracer.enable(self.collector)
+
+    def spans(self, name):
+        return [span for span in self.collector.spans if span["name"] == name]
+
+    async def child(self, i):
+        with self.tracer.span("child", i=i):
+            await asyncio.sleep(0.01 * (3 - i))
+            with self.tracer.span("grandchild", i=i):
+                await asyncio.sleep(0)
+
+    async def test_parent_propagates_across_gather_and_create_task(self):
+        with self.tracer.span("root") as root:
+            await asyncio.gather(*(self.child(i) for i in range(3)))
+            await asyncio.create_task(self.child(3))
+        self.assertIsNone(_current_span.get())
+
+        children = self.spans("child")
+        self.assertEqual(len(children), 4)
+        # 并发的兄弟 span 互不嵌套，都挂在 root 下
+        self.assertTrue(all(span["parent_id"] == root.span_id for span in children))
+        self.assertTrue(all(span["trace_id"] == root.span_id for span in self.collector.spans))
+        parents = {span["attributes"]["i"]: span["span_id"] for span in children}
+        for span in self.spans("grandchild"):
+            self.assertEqual(span["parent_id"], parents[span["attributes"]["i"]])
+        self.assertIsNone(self.spans("root")[0]["parent_id"])
+
+    async def test_separate_roots_get_separate_traces(self):
+        await asyncio.gather(self.child(0), self.child(1))
+        children = self.spans("child")
+        self.assertEqual([span["parent_id"] for span in children], [None, None])
+        self.assertNotEqual(children[0]["trace_id"], children[1]["trace_id"])
+
+    def test_exit_in_another_context_restores_the_parent(self):
+        with self.tracer.span("outer") as outer:
+            inner = self.tracer.span("inner")
+            # 在另一个上下文中进入、在当前上下文中退出（例如被其他任务关闭的异步生成器），token 无法 reset
+            contextvars.copy_context().run(inner.__enter__)
+            inner.__exit__(None, None, None)
+            self.assertIs(_current_span.get(), outer)
+            with self.tracer.span("next"):
+                pass
+        self.assertEqual(self.spans("next")[0]["parent_id"], outer.span_id)
+        self.assertIsNone(_current_span.get())
+
+    def test_errors_are_recorded(self):
+        with self.assertRaises(KeyError):
+            with self.tracer.span("failing"):
+                raise KeyError("x")
+        self.assertEqual(self.spans("failing")[0]["error"], "KeyError: 'x'")
+
+    def test_disabled_tracer_is_a_noop(self):
+        tracer = Tracer()
+        self.assertIs(tracer.span("anything"), NOOP_SPAN)
+        tracer.count("anything")
+        self.assertFalse(tracer.enabled)
+
+
+class InMemoryCollectorTest(unittest.TestCase):
+    def test_counters_are_aggregated_by_name(self):
+        collector = InMemoryCollector()
+        tracer = Tracer()
+        tracer.enable(collector)
+        tracer.count("tokens", 10, model="a")
+        tracer.count("tokens", 5, model="b")
+        tracer.count("hits")
+        tracer.count("bytes", 0.5)
+        tracer.count("bytes", 1.5)
+        self.assertEqual(collector.counters, {"tokens": 15, "hits": 1, "bytes": 2.0})
+        # 计数器不计入 span
+        self.assertEqual(collector.spans, [])
+
+    def test_counter_carries_the_current_trace(self):
+        records = []
+        collector = InMemoryCollector()
+        collector.export = records.append
+        tracer = Tracer()
+        tracer.enable(collector)
+        with tracer.span("root") as root:
+            tracer.count("inside")
+        tracer.count("outside")
+        counters = {record["name"]: record for record in records if record["type"] == "counter"}
+        self.assertEqual(counters["inside"]["trace_id"], root.trace_id)
+        self.assertIsNone(counters["outside"]["trace_id"])
+
+    def test_summary_and_span_limit(self):
+        collector = InMemoryCollector(max_spans=3)
+        for i, duration in enumerate([1.0, 4.0, 2.0, 3.0]):
+            collector.export({"type": "span", "name": "a" if i % 2 else "b", "duration_ms": duration})
+        self.assertEqual(len(collector.spans), 3)
+        self.assertEqual(collector.summary(), {
+            "a": {"count": 2, "total_ms": 7.0, "max_ms": 4.0},
+            "b": {"count": 1, "total_ms": 2.0, "max_ms": 2.0},
+        })
+
+
+class JsonlExporterTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = Path(self.tmp.name) / 'traces' / 'trace.jsonl'
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def lines(self):
+        if not self.path.exists():
+            return []
+        return [json.loads(line) for line in self.path.read_text(encoding='utf-8').splitlines()]
+
+    def test_buffer_is_written_when_full(self):
+        exporter = JsonlExporter(self.path, buffer_size=3)
+        exporter.export({"type": "counter", "name": "a", "value": 1})
+        exporter.export({"type": "counter", "name": "b", "value": 2})
+        self.assertEqual(self.lines(), [])
+        exporter.export({"type": "counter", "name": "c", "value": 3})
+        self.assertEqual([record["name"] for record in self.lines()], ["a", "b", "c"])
+
+        exporter.export({"type": "counter", "name": "d", "value": 4})
+        exporter.flush()
+        self.assertEqual(len(self.lines()), 4)
+        # 空缓冲 flush 不写入
+        exporter.flush()
+        self.assertEqual(len(self.lines()), 4)
+
+    def test_disable_flushes_and_reopening_appends(self):
+        tracer = Tracer()
+        tracer.enable(JsonlExporter(self.path))
+        with tracer.span("work", path=Path("x")):
+            tracer.count("items", 2)
+        self.assertEqual(self.lines(), [])
+        tracer.disable()
+        records = self.lines()
+        self.assertEqual([record["type"] for record in records], ["counter", "span"])
+        # 无法序列化的属性按 str 写出
+        self.assertEqual(records[1]["attributes"]["path"], "x")
+
+        tracer.enable(JsonlExporter(self.path))
+        tracer.count("items", 1)
+        tracer.disable()
+        self.assertEqual(len(self.lines()), 3)
+
+
+if __name__ == "__main__":
+    unittest.main()
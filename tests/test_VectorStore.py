@@ -0,0 +1,243 @@
+import tempfile
+import unittest
+
+import numpy as np
+
+from BM25Index import BM25Index
+from IVFIndex import IVFIndex
+from Quantizer import ScalarQuantizer
+from VectorStore import VectorStore
+
+
+def random_items(count, dim=16, seed=0):
+    rng = np.random.default_rng(seed)
+    vectors = rng.normal(size=(count, dim)).astype(np.float32)
+    return vectors, [{'embedding': v, 'document': f'doc-{i}'} for i, v in enumerate(vectors)]
+
+
+def reference_top_k(vectors, queries, top_k):
+    """NumPy 参考实现：余弦相似度全排序后取前 top_k"""
+    normalized = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+    queries = queries / np.linalg.norm(queries, axis=1, keepdims=True)
+    return [np.argsort(-row, kind='stable')[:top_k] for row in queries @ normalized.T]
+
+
+class VectorStoreSearchTest(unittest.IsolatedAsyncioTestCase):
+    def test_top_k_order_matches_numpy_reference(self):
+        vectors, items = random_items(500)
+        queries = np.random.default_rng(1).normal(size=(20, 16)).astype(np.float32)
+        store = VectorStore(initial_capacity=8)
+        # 逐条添加，经过多次扩容
+        for item in items:
+            store.add_item(item)
+        for top_k in (1, 5, 37):
+            for got, expected in zip(store.search_indices(queries, top_k), reference_top_k(vectors, queries, top_k)):
+                np.testing.assert_array_equal(got, expected)
+
+    async def test_top_k_larger_than_store_returns_everything_in_order(self):
+        vectors, items = random_items(5)
+        store = VectorStore()
+        store.add_items(items)
+        query = vectors[2] + 0.01
+        rows = store.search_indices([query], 50)[0]
+        np.testing.assert_array_equal(rows, reference_top_k(vectors, query[np.newaxis, :], 5)[0])
+        self.assertEqual(len(await store.search(query, top_k=50)), 5)
+
+    async def test_empty_store(self):
+        store = VectorStore()
+        self.assertEqual(await store.search([1.0, 0.0], top_k=3), [])
+        self.assertEqual(store.search_indices([], 3), [])
+        self.assertEqual([len(r) for r in store.search_indices([[1.0, 0.0], [0.0, 1.0]], 3)], [0, 0])
+        self.assertEqual(len(store), 0)
+
+    async def test_zero_vectors_score_zero(self):
+        store = VectorStore()
+        store.add_items([
+            {'embedding': [0.0, 0.0, 0.0], 'document': 'zero'},
+            {'embedding': [1.0, 0.0, 0.0], 'document': 'x'},
+            {'embedding': [-1.0, 0.0, 0.0], 'document': '-x'},
+        ])
+        self.assertEqual(await store.search([1.0, 0.0, 0.0], top_k=3), ['x', 'zero', '-x'])
+        # 零查询与所有向量的相似度都是 0，按行号稳定排序，不产生 nan
+        self.assertEqual(await store.search([0.0, 0.0, 0.0], top_k=3), ['zero', 'x', '-x'])
+
+    async def test_batched_and_single_search_agree(self):
+        vectors, items = random_items(300)
+        queries = np.random.default_rng(2).normal(size=(10, 16)).astype(np.float32)
+        store = VectorStore()
+        store.add_items(items)
+        batched = await store.search_many(queries.tolist(), top_k=7)
+        for query, expected in zip(queries, batched):
+            self.assertEqual(await store.search(query.tolist(), top_k=7), expected)
+
+    def test_dimension_mismatch_is_rejected(self):
+        store = VectorStore()
+        store.add_item({'embedding': [1.0, 0.0], 'document': 'a'})
+        with self.assertRaises(ValueError):
+            store.add_item({'embedding': [1.0, 0.0, 0.0], 'document': 'b'})
+        with self.assertRaises(ValueError):
+            store.search_indices([[1.0, 0.0, 0.0]], 1)
+
+
+class VectorStorePersistenceTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        _, items = random_items(600)
+        for i, item in enumerate(items):
+            item['document'] = f'文档 {i} word{i % 7}'
+            item['metadata'] = {'source': f'file-{i % 6}.md', 'part': i}
+        self.items = items
+        self.queries = np.random.default_rng(3).normal(size=(15, 16)).astype(np.float32)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def assert_same_results(self, expected_store, store, **kwargs):
+        for expected, got in zip(
+            expected_store.search_indices(self.queries, 10, **kwargs), store.search_indices(self.queries, 10, **kwargs)
+        ):
+            np.testing.assert_array_equal(got, expected)
+
+    def test_round_trip(self):
+        configs = {
+            "plain": {},
+            "ivf": {"index": lambda: IVFIndex(nlist=8, train_size=200)},
+            "int8": {"quantizer": lambda: ScalarQuantizer(train_size=200)},
+            "ivf+int8": {"index": lambda: IVFIndex(nlist=8, train_size=200),
+                         "quantizer": lambda: ScalarQuantizer(train_size=200)},
+        }
+        for name, factories in configs.items():
+            for mmap in (True, False):
+                with self.subTest(config=name, mmap=mmap):
+                    store = VectorStore(**{k: f() for k, f in factories.items()})
+                    store.add_items(self.items)
+                    path = f"{self.tmp.name}/{name}-{mmap}"
+                    store.save(path)
+                    loaded = VectorStore.load(path, mmap=mmap, **{k: f() for k, f in factories.items()})
+                    self.assertEqual(len(loaded), len(store))
+                    self.assertEqual(loaded.vector_nbytes, store.vector_nbytes)
+                    self.assertEqual(loaded.get_document(17), store.get_document(17))
+                    self.assertEqual(loaded.get_metadata(17), store.get_metadata(17))
+                    self.assert_same_results(store, loaded)
+                    self.assert_same_results(store, loaded, exact=True)
+
+    def test_append_after_mmap_load(self):
+        store = VectorStore()
+        store.add_items(self.items[:300])
+        store.save(self.tmp.name)
+        loaded = VectorStore.load(self.tmp.name)
+        loaded.add_items(self.items[300:])
+        full = VectorStore()
+        full.add_items(self.items)
+        self.assert_same_results(full, loaded)
+        self.assertEqual(loaded.get_document(450), full.get_document(450))
+        np.testing.assert_array_equal(
+            loaded.filter_rows({'source': 'file-1.md'}), full.filter_rows({'source': 'file-1.md'})
+        )
+
+    def test_deleted_rows_stay_hidden_after_save_load_and_compaction(self):
+        store = VectorStore(index=IVFIndex(nlist=8, train_size=200), lexical_index=BM25Index())
+        store.add_items(self.items)
+        self.assertEqual(store.delete({'source': 'file-0.md'}), 100)
+        self.assertEqual(store.delete({'source': 'file-0.md'}), 0)
+        self.assertEqual(len(store), 500)
+
+        def check(s):
+            live = {f'file-{i}.md' for i in range(1, 6)}
+            for exact in (True, False):
+                for rows in s.search_indices(self.queries, 50, exact=exact):
+                    self.assertTrue({s.get_metadata(int(r))['source'] for r in rows} <= live)
+            self.assertEqual(s.filter_rows({'source': 'file-0.md'}).size, 0)
+            for row in s.lexical_search_indices('word0', top_k=600):
+                self.assertNotEqual(s.get_metadata(int(row))['source'], 'file-0.md')
+
+        check(store)
+        store.save(self.tmp.name)
+        loaded = VectorStore.load(
+            self.tmp.name, index=IVFIndex(nlist=8, train_size=200), lexical_index=BM25Index()
+        )
+        check(loaded)
+        # save 压缩掉已删除的行，行号连续重排
+        self.assertEqual(len(loaded), 500)
+        self.assertEqual(loaded.get_metadata(0)['part'], 1)
+        self.assertEqual(loaded.filter_rows({}).size, 500)
+        np.testing.assert_array_equal(
+            np.sort(loaded.search_indices(self.queries[:1], 500, nprobe=8)[0]), np.arange(500)
+        )
+        for expected, got in zip(store.search_indices(self.queries, 10, exact=True),
+                                 loaded.search_indices(self.queries, 10, exact=True)):
+            self.assertEqual([store.get_document(int(r)) for r in expected],
+                             [loaded.get_document(int(r)) for r in got])
+
+
+class VectorStoreFilterTest(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.vectors, items = random_items(800)
+        for i, item in enumerate(items):
+            item['metadata'] = {'source': f'file-{i % 8}.md', 'part': i, 'tags': ['even' if i % 2 == 0 else 'odd']}
+        self.items = items
+        self.queries = np.random.default_rng(4).normal(size=(10, 16)).astype(np.float32)
+
+    def reference(self, rows, top_k):
+        """只在给定行上做参考检索"""
+        return [rows[r] for r in reference_top_k(self.vectors[rows], self.queries, top_k)]
+
+    def test_filter_then_top_k_on_exact_path(self):
+        store = VectorStore()
+        store.add_items(self.items)
+        where_cases = {
+            # 选择性高：按行收集后打分
+            "selective": ({'source': 'file-3.md'}, np.arange(3, 800, 8)),
+            # 选择性低：整体打分后屏蔽
+            "broad": ({'tags': 'even'}, np.arange(0, 800, 2)),
+            "operators": ({'$or': [{'source': {'$in': ['file-1.md', 'file-2.md']}}, {'part': {'$gte': 790}}]},
+                          np.array(sorted({*range(1, 800, 8), *range(2, 800, 8), *range(790, 800)}))),
+            "ne": ({'source': {'$ne': 'file-0.md'}, 'part': {'$lt': 100}},
+                   np.array([i for i in range(100) if i % 8])),
+        }
+        for name, (where, rows) in where_cases.items():
+            with self.subTest(where=name):
+                np.testing.assert_array_equal(store.filter_rows(where), rows)
+                for got, expected in zip(store.search_indices(self.queries, 5, where=where), self.reference(rows, 5)):
+                    np.testing.assert_array_equal(got, expected)
+
+    def test_filter_then_top_k_on_ivf_path(self):
+        index = IVFIndex(nlist=8, train_size=200)
+        store = VectorStore(index=index)
+        store.add_items(self.items)
+        rows = np.arange(0, 800, 2)
+        # nprobe=1 时过滤结果（400 行）多于一次探查的候选，走 IVF：结果等于探查候选与过滤结果交集上的精确 top_k
+        for query, got in zip(self.queries, store.search_indices(self.queries, 5, where={'tags': 'even'}, nprobe=1)):
+            probed = index.probe(query / np.linalg.norm(query), 1)
+            candidates = np.intersect1d(probed, rows)
+            scores = self.vectors[candidates] @ query / np.linalg.norm(self.vectors[candidates], axis=1)
+            np.testing.assert_array_equal(got, candidates[np.argsort(-scores, kind='stable')[:5]])
+
+    async def test_filter_that_matches_nothing(self):
+        store = VectorStore(index=IVFIndex(nlist=8, train_size=200))
+        store.add_items(self.items)
+        for where in ({'source': 'missing.md'}, {'unknown': 1}, {'part': {'$gt': 10 ** 6}}):
+            with self.subTest(where=where):
+                self.assertEqual(store.filter_rows(where).size, 0)
+                self.assertEqual([len(r) for r in store.search_indices(self.queries, 5, where=where)], [0] * 10)
+                self.assertEqual(await store.search(self.queries[0], top_k=5, where=where), [])
+
+    def test_filter_after_delete(self):
+        store = VectorStore(index=IVFIndex(nlist=8, train_size=200))
+        store.add_items(self.items)
+        self.assertEqual(store.delete({'part': {'$lt': 400}, 'tags': 'even'}), 200)
+        rows = np.arange(400, 800, 2)
+        np.testing.assert_array_equal(store.filter_rows({'tags': 'even'}), rows)
+        for exact in (True, False):
+            for got, expected in zip(
+                store.search_indices(self.queries, 5, where={'tags': 'even'}, exact=exact, nprobe=8),
+                self.reference(rows, 5),
+            ):
+                np.testing.assert_array_equal(got, expected)
+        # 删除后新增的行可以被过滤命中
+        store.add_item({'embedding': self.queries[0], 'document': 'new', 'metadata': {'tags': ['even']}})
+        self.assertEqual(store.search_indices(self.queries[:1], 1, where={'tags': 'even'})[0][0], 800)
+
+
+if __name__ == "__main__":
+    unittest.main()
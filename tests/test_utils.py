@@ -0,0 +1,47 @@
+import io
+import threading
+import unittest
+
+from utils import BufferedSink
+
+
+class BlockedStream(io.StringIO):
+    """在 release 之前阻塞写入，模拟跟不上输出的终端"""
+
+    def __init__(self):
+        super().__init__()
+        self.release = threading.Event()
+
+    def write(self, text):
+        self.release.wait()
+        return super().write(text)
+
+
+class BufferedSinkTest(unittest.TestCase):
+    def test_drop_policy_bounds_the_queue_and_reports_drops(self):
+        stream = BlockedStream()
+        sink = BufferedSink(stream, max_queue=10)
+        for i in range(1000):
+            sink.write(f"line {i}\n")
+        stream.release.set()
+        sink.flush()
+
+        lines = stream.getvalue().splitlines()
+        self.assertGreater(sink.dropped, 0)
+        self.assertEqual(len([line for line in lines if line.startswith("line")]), 1000 - sink.dropped)
+        self.assertLessEqual(1000 - sink.dropped, 11)
+        self.assertEqual(lines[-1], f"[log sink full, dropped {sink.dropped} messages]")
+
+    def test_block_policy_keeps_every_message(self):
+        stream = BlockedStream()
+        stream.release.set()
+        sink = BufferedSink(stream, max_queue=2, overflow="block")
+        for i in range(200):
+            sink.write(f"{i}\n")
+        sink.flush()
+        self.assertEqual(stream.getvalue().splitlines(), [str(i) for i in range(200)])
+        self.assertEqual(sink.dropped, 0)
+
+
+if __name__ == "__main__":
+    unittest.main()